@@ -0,0 +1,215 @@
+"""
+Контроль допуска запросов к агенту (backpressure).
+
+На воркер — не больше `max_concurrency` одновременных запусков графа и ограниченная
+очередь ожидания. Очередь справедлива по сессиям: освободившееся место получает
+следующая сессия по кругу, а не следующий запрос, поэтому одна сессия не может занять
+всю очередь. Когда очередь полна (или сессия превысила свою долю), запрос сразу
+отклоняется с 503/429 и `Retry-After` вместо того, чтобы замедлять всех.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+# Окно замеров времени ожидания и обслуживания для метрик
+_WINDOW = 500
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен: status — HTTP-код (429 | 503), retry_after — через сколько секунд повторить."""
+
+    def __init__(self, status: int, retry_after: int, reason: str) -> None:
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionTicket:
+    """Выданное место; `release` по одному билету срабатывает один раз."""
+
+    __slots__ = ("started", "released")
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.released = False
+
+
+class _Timings:
+    """Скользящее окно длительностей: среднее и p95."""
+
+    def __init__(self) -> None:
+        self._samples: Deque[float] = deque(maxlen=_WINDOW)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    @property
+    def mean(self) -> float:
+        return sum(self._samples) / len(self._samples) if self._samples else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        ordered = sorted(self._samples)
+        p95 = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)] if ordered else 0.0
+        return {"avg_s": self.mean, "p95_s": p95, "max_s": ordered[-1] if ordered else 0.0}
+
+
+class AdmissionController:
+    """Ограничение параллелизма с ограниченной очередью и круговым обслуживанием сессий."""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        max_queue_per_session: int,
+        max_wait_s: Optional[float],
+    ) -> None:
+        """
+        Args:
+            max_concurrency: Одновременных запусков на воркер.
+            max_queue: Мест в очереди ожидания (0 — без очереди).
+            max_queue_per_session: Ожидающих запросов одной сессии.
+            max_wait_s: Максимальное ожидание в очереди (None — без ограничения).
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_queue_per_session = max(1, max_queue_per_session)
+        self.max_wait_s = max_wait_s
+        self._active = 0
+        self._queued = 0
+        # Очереди сессий в порядке обслуживания (round-robin)
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queue_time = _Timings()
+        self._service_time = _Timings()
+        self._stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_session": 0, "timeouts": 0}
+
+    @classmethod
+    def from_settings(cls, cfg) -> "AdmissionController":
+        """Контроллер из настроек (admission_max_concurrency, admission_max_queue, ...)."""
+        return cls(
+            max_concurrency=cfg.admission_max_concurrency,
+            max_queue=cfg.admission_max_queue,
+            max_queue_per_session=cfg.admission_max_queue_per_session,
+            max_wait_s=cfg.admission_max_wait_s,
+        )
+
+    # ---------- очередь ----------
+    def _retry_after(self) -> int:
+        """Оценка времени до свободного места: очередь / параллелизм × среднее время обслуживания."""
+        service = self._service_time.mean or 1.0
+        return max(1, math.ceil(service * (self._queued + 1) / self.max_concurrency))
+
+    def _grant_next(self) -> None:
+        """Отдаёт освободившееся место следующей по кругу сессии."""
+        while self._active < self.max_concurrency and self._waiters:
+            session, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiters.move_to_end(session)
+            else:
+                del self._waiters[session]
+            if not waiter.done():
+                self._active += 1
+                waiter.set_result(None)
+
+    def _forget(self, session: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiters.get(session)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[session]
+
+    async def acquire(self, session_id: str) -> AdmissionTicket:
+        """
+        Ждёт места для запуска.
+
+        Args:
+            session_id: Сессия запроса (единица справедливости).
+
+        Returns:
+            AdmissionTicket: Билет места — передать в `release`.
+
+        Raises:
+            AdmissionRejected: Очередь полна (503), сессия превысила долю очереди (429)
+                или ожидание превысило max_wait_s (503).
+        """
+        t0 = time.monotonic()
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self._stats["admitted"] += 1
+            self._queue_time.add(0.0)
+            return AdmissionTicket(t0)
+
+        if self._queued >= self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            raise AdmissionRejected(503, self._retry_after(), "Сервер перегружен: очередь запросов заполнена")
+        waiters = self._waiters.get(session_id)
+        if waiters is not None and len(waiters) >= self.max_queue_per_session:
+            self._stats["rejected_session"] += 1
+            raise AdmissionRejected(429, self._retry_after(), "Слишком много одновременных запросов от сессии")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(session_id, deque()).append(waiter)
+        self._queued += 1
+        self._stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            self._forget(session_id, waiter)
+            if waiter.done():  # место выдано в момент таймаута
+                return self._started(t0)
+            waiter.cancel()
+            self._stats["timeouts"] += 1
+            raise AdmissionRejected(503, self._retry_after(), "Сервер перегружен: время ожидания в очереди истекло")
+        except asyncio.CancelledError:
+            self._forget(session_id, waiter)
+            if waiter.done() and not waiter.cancelled():
+                # клиент ушёл, а место уже выдано — возвращаем его
+                self._active -= 1
+                self._grant_next()
+            waiter.cancel()
+            raise
+        return self._started(t0)
+
+    def _started(self, t0: float) -> AdmissionTicket:
+        now = time.monotonic()
+        self._stats["admitted"] += 1
+        self._queue_time.add(now - t0)
+        return AdmissionTicket(now)
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """Освобождает место и передаёт его следующей сессии (повторный вызов ничего не делает)."""
+        if ticket.released:
+            return
+        ticket.released = True
+        self._service_time.add(time.monotonic() - ticket.started)
+        self._active -= 1
+        self._grant_next()
+
+    @asynccontextmanager
+    async def admit(self, session_id: str) -> AsyncIterator[None]:
+        """`acquire` + `release` вокруг обработки запроса."""
+        ticket = await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Занятые места, глубина очереди, счётчики допуска/отказов, время ожидания и обслуживания."""
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._queued,
+            "max_queue": self.max_queue,
+            "queued_sessions": len(self._waiters),
+            **self._stats,
+            "queue_time": self._queue_time.stats(),
+            "service_time": self._service_time.stats(),
+        }
@@ -1,14 +1,31 @@
-from typing import Dict, Optional, TypedDict, Literal, List
+from collections import OrderedDict
+from contextlib import nullcontext
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple, TypedDict, List
+import asyncio
 import os
+import threading
+import time
 
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
 
 from llm_service.llm_client import LLMClient
+from llm_service.circuit_breaker import breakers
+from llm_service.hedging import hedger
+from llm_service.prompt_cache import prompt_tokens
+from llm_service.rate_limit import rate_limiters
 from settings import get_settings
 from logger import get_logger
-from langchain_tools import make_tools, rag_search
+from langchain_tools import make_tools, rag_cache, rag_search, arag_search
+from intent_router import Intent, IntentRouter, match_rules
+from response_cache import make_response_cache, normalize_question
+from retrieval import RetrievedDocument, dedupe, load_encoding, pack_context
+from session_runs import SessionRuns, idempotency_key as idempotency_key_for
+from session_store import make_checkpointer
+from speculation import SpeculativeRetrieval
 
 
 # ---------- Состояние графа ----------
@@ -16,11 +33,24 @@ class AgentState(TypedDict, total=False):
     """Общее состояние исполнения графа."""
 
     question: str
-    intent: Literal["general", "rag_answer", "generate_quiz", "evaluate_quiz"]
-    documents: List[str]
+    intent: Intent
+    documents: List[str]            # фрагменты для промпта после дедупликации и упаковки в бюджет
     quiz_content: Optional[str]
     user_solution: Optional[str]
     final_answer: str
+    cache_hit: bool                 # ответ rag_answer взят из кэша в planner, retrieve не нужен
+
+
+# Пауза перед повторной попыткой эмбеддинга вопроса, если провайдер их не отдаёт
+QVEC_UNAVAILABLE_PAUSE_S = 300.0
+
+# Приёмник событий потокового запуска (astream_run). Задаётся на время одного запуска
+# и наследуется задачами графа через контекст asyncio; вне стрима — None.
+_stream_sink: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar("stream_sink", default=None)
+
+# Намерение, заранее определённое пакетной маршрутизацией (run_many / arun_many). Задаётся
+# на время запуска одного элемента пакета; планировщик тогда не классифицирует вопрос сам.
+_intent_hint: ContextVar[Optional[Intent]] = ContextVar("intent_hint", default=None)
 
 
 # ---------- Агентная система ----------
@@ -51,7 +81,6 @@ class AgentSystem:
                 system_prompt = f.read().strip()
         
         self.client = LLMClient(provider=prov, system_prompt=system_prompt)
-        self.cfg = cfg
         self.log.info("Инициализация агента: provider=%s", prov)
 
         # Инициализируем инструменты
@@ -59,60 +88,271 @@ class AgentSystem:
         self.tool_names = [tool.name for tool in self.tools]
         self.log.info("Available tools: %s", self.tool_names)
 
-        # Инициализируем память для графа
-        self.memory = MemorySaver()
+        # Эмбеддинги вопросов (общие для роутера и кэша ответов), LRU по нормализованному вопросу
+        self._qvec_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._qvec_cache_size = 256
+        self._qvec_lock = threading.Lock()
+        # Если провайдер не отдаёт эмбеддинги, не пытаемся снова до этого момента (monotonic)
+        self._qvec_unavailable_until = 0.0
+
+        # Роутер намерений: дешёвые уровни перед LLM-планировщиком
+        self.router = IntentRouter(
+            self.client,
+            use_embeddings=cfg.intent_router_embeddings,
+            embedding_threshold=cfg.intent_embedding_threshold,
+            embedding_margin=cfg.intent_embedding_margin,
+            embed_query=self._embed_question,
+            aembed_query=self._aembed_question,
+            llm_batch_size=cfg.intent_llm_batch_size,
+            llm_batch_wait_ms=cfg.intent_llm_batch_wait_ms,
+            structured_output=cfg.intent_structured_output,
+            llm_max_tokens=cfg.intent_llm_max_tokens,
+        )
+
+        # Спекулятивный поиск в RAG параллельно с классификацией намерения
+        self.speculation = SpeculativeRetrieval(rag_search, arag_search)
+
+        # Кодировка для бюджета контекста RAG: загрузка (возможно, с сети) — при старте, а не в первом запросе
+        load_encoding()
+
+        # Кэш ответов для rag_answer / direct_answer (None — выключен)
+        self.response_cache = make_response_cache(cfg)
+
+        # Очередь запусков по сессии и присоединение повторных запросов к идущему запуску
+        self.session_runs = SessionRuns(dedup_ttl_s=cfg.session_dedup_ttl_s)
+
+        # Инициализируем память для графа: memory (TTL и LRU-лимиты) или sqlite/redis (checkpointer_backend)
+        self.memory = make_checkpointer(cfg)
 
         self.app = self._build_graph()
 
+    @property
+    def cfg(self):
+        """Текущие настройки (кэш get_settings(), учитывает горячую перезагрузку)."""
+        return get_settings()
+
+    # ---------- Промпты узлов ----------
+    @staticmethod
+    def _direct_answer_prompt(q: str) -> str:
+        return (
+            "Ответь кратко и по делу, оформи в 1–2 абзаца; при необходимости добавь список.\n\n"
+            f"Вопрос: {q}"
+        )
+
+    @staticmethod
+    def _rag_answer_prompt(q: str, documents: List[str]) -> str:
+        context = "\n\n".join(documents)
+        return f"Context: {context}. Question: {q}"
+
+    @staticmethod
+    def _create_quiz_prompt(documents: List[str]) -> str:
+        context = "\n\n".join(documents)
+        return f"Make a quiz based on: {context}"
+
+    @staticmethod
+    def _evaluate_quiz_prompt(quiz_content: str, user_solution: str) -> str:
+        return f"Quiz: {quiz_content}\nUser Answer: {user_solution}\nEvaluate the answer."
+
+    async def _agenerate_answer(self, node: str, prompt: str, temperature: float) -> str:
+        """
+        Генерирует ответ узла: при потоковом запуске — токен за токеном в приёмник событий,
+        иначе — обычным `agenerate` (с хеджем, если он включён для узла).
+        """
+        sink = _stream_sink.get()
+        if sink is None:
+            return (await self.client.agenerate([prompt], temperature=temperature, hedge_node=node))[0]
+
+        def _on_token(piece: str) -> None:
+            sink({"event": "token", "node": node, "text": piece})
+
+        return await self.client.astream_generate(prompt, _on_token, temperature=temperature)
+
+    # ---------- Эмбеддинги вопросов и кэш ответов ----------
+    def _recall_qvec(self, key: str) -> Optional[List[float]]:
+        with self._qvec_lock:
+            return self._qvec_cache.get(key)
+
+    def _remember_qvec(self, key: str, vector: List[float]) -> List[float]:
+        if not vector:
+            self.log.warning("Эмбеддинг вопроса недоступен, пауза %.0f с", QVEC_UNAVAILABLE_PAUSE_S)
+            self._qvec_unavailable_until = time.monotonic() + QVEC_UNAVAILABLE_PAUSE_S
+        else:
+            with self._qvec_lock:
+                self._qvec_cache[key] = vector
+                self._qvec_cache.move_to_end(key)
+                while len(self._qvec_cache) > self._qvec_cache_size:
+                    self._qvec_cache.popitem(last=False)
+        return vector
+
+    def _embed_question(self, question: str) -> List[float]:
+        """Эмбеддинг вопроса с мемоизацией (пустой список, если эмбеддинги недоступны)."""
+        key = normalize_question(question)
+        vector = self._recall_qvec(key)
+        if vector is not None or time.monotonic() < self._qvec_unavailable_until:
+            return vector or []
+        return self._remember_qvec(key, (self.client.embed([question]) or [[]])[0])
+
+    async def _aembed_question(self, question: str) -> List[float]:
+        """Асинхронный аналог `_embed_question`."""
+        key = normalize_question(question)
+        vector = self._recall_qvec(key)
+        if vector is not None or time.monotonic() < self._qvec_unavailable_until:
+            return vector or []
+        return self._remember_qvec(key, (await self.client.aembed([question]) or [[]])[0])
+
+    def _cache_lookup(self, namespace: str, q: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        """Ищет ответ в кэше; возвращает (ответ | None, эмбеддинг вопроса для последующего store)."""
+        cache = self.response_cache
+        if cache is None or not cache.enabled_for(namespace):
+            return None, None
+        vector = self._embed_question(q) if self.cfg.response_cache_semantic else None
+        return cache.lookup(namespace, q, vector), vector
+
+    async def _acache_lookup(self, namespace: str, q: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        """Асинхронный аналог `_cache_lookup`."""
+        cache = self.response_cache
+        if cache is None or not cache.enabled_for(namespace):
+            return None, None
+        vector = await self._aembed_question(q) if self.cfg.response_cache_semantic else None
+        return cache.lookup(namespace, q, vector), vector
+
+    def _cache_vector(self, namespace: str, q: str) -> Optional[List[float]]:
+        """Эмбеддинг вопроса для store (уже мемоизирован после lookup в planner)."""
+        cache = self.response_cache
+        if cache is None or not cache.enabled_for(namespace) or not self.cfg.response_cache_semantic:
+            return None
+        return self._embed_question(q)
+
+    async def _acache_vector(self, namespace: str, q: str) -> Optional[List[float]]:
+        """Асинхронный аналог `_cache_vector`."""
+        cache = self.response_cache
+        if cache is None or not cache.enabled_for(namespace) or not self.cfg.response_cache_semantic:
+            return None
+        return await self._aembed_question(q)
+
+    def _planned(self, state: AgentState, intent: Intent, cached: Optional[str], speculating: bool) -> AgentState:
+        """Итог planner: намерение и, если ответ RAG нашёлся в кэше, сам ответ (retrieve пропускается)."""
+        update: AgentState = {**state, "intent": intent, "cache_hit": cached is not None}
+        if cached is not None:
+            self.log.info("planner: ответ rag_answer из кэша, retrieve пропущен")
+            self._emit_cached("rag_answer", cached)
+            update["final_answer"] = cached
+        if speculating and self.route_after_planner(update) != "retrieve":
+            self.speculation.discard()
+        return update
+
+    def _cache_store(self, namespace: str, q: str, answer: str, vector: Optional[List[float]]) -> None:
+        if self.response_cache is not None:
+            self.response_cache.store(namespace, q, answer, vector)
+
+    def _emit_cached(self, node: str, answer: str) -> None:
+        """При потоковом запуске отдаёт ответ из кэша одним фрагментом."""
+        sink = _stream_sink.get()
+        if sink is not None:
+            sink({"event": "token", "node": node, "text": answer, "cached": True})
+
     # ---------- Узлы графа ----------
     def planner_node(self, state: AgentState) -> AgentState:
         """
         Анализирует запрос и определяет план действий (intent).
         """
-        import time
-
         q = (state.get("question") or "").strip()
         self.log.info("start:planner | question_len=%d", len(q))
         t0 = time.perf_counter()
 
-        # Определяем намерение на основе запроса
+        # Если правила не решили маршрут, поиск стартует параллельно с классификацией
+        speculating = self._should_speculate(q) and self.speculation.start(q)
+
+        # Определяем намерение на основе запроса; ответ RAG ищем в кэше до поиска документов
         intent = self._determine_intent(q)
+        cached = self._cache_lookup("rag_answer", q)[0] if intent == "rag_answer" else None
+        update = self._planned(state, intent, cached, speculating)
 
         dt = (time.perf_counter() - t0) * 1000
         self.log.info("done:planner | intent=%s | %.1f ms", intent, dt)
-        return {**state, "intent": intent}
+        return update
+
+    async def aplanner_node(self, state: AgentState) -> AgentState:
+        """Асинхронный аналог `planner_node`."""
+        q = (state.get("question") or "").strip()
+        self.log.info("start:planner | question_len=%d", len(q))
+        t0 = time.perf_counter()
+
+        speculating = self._should_speculate(q) and self.speculation.astart(q)
+
+        intent = await self._adetermine_intent(q)
+        cached = (await self._acache_lookup("rag_answer", q))[0] if intent == "rag_answer" else None
+        update = self._planned(state, intent, cached, speculating)
+
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("done:planner | intent=%s | %.1f ms", intent, dt)
+        return update
 
     def retrieve_node(self, state: AgentState) -> AgentState:
         """
         Ищет документы в RAG.
         """
-        import time
+        q = (state.get("question") or "").strip()
+        self.log.info("start:retrieve | q_len=%d", len(q))
+        t0 = time.perf_counter()
 
+        docs = self.speculation.take(q)
+        if docs is None:
+            docs = rag_search(q)
+        packed = self._pack_documents(docs)
+
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("done:retrieve | docs_count=%d | packed=%d | %.1f ms", len(docs), len(packed), dt)
+        return {**state, "documents": packed}
+
+    async def aretrieve_node(self, state: AgentState) -> AgentState:
+        """Асинхронный аналог `retrieve_node`."""
         q = (state.get("question") or "").strip()
         self.log.info("start:retrieve | q_len=%d", len(q))
         t0 = time.perf_counter()
 
-        docs = rag_search(q)
+        docs = await self.speculation.atake(q)
+        if docs is None:
+            docs = await arag_search(q)
+        # Дедупликация и подсчёт токенов — CPU-работа: не держим ею event loop
+        packed = await asyncio.to_thread(self._pack_documents, docs)
 
         dt = (time.perf_counter() - t0) * 1000
-        self.log.info("done:retrieve | docs_count=%d | %.1f ms", len(docs), dt)
-        return {**state, "documents": docs}
+        self.log.info("done:retrieve | docs_count=%d | packed=%d | %.1f ms", len(docs), len(packed), dt)
+        return {**state, "documents": packed}
 
     def direct_answer_node(self, state: AgentState) -> AgentState:
         """
         Отвечает без инструментов (болтовня).
         """
-        import time
+        q = (state.get("question") or "").strip()
+        self.log.info("start:direct_answer | q_len=%d", len(q))
+        t0 = time.perf_counter()
+
+        answer, qvec = self._cache_lookup("general", q)
+        if answer is None:
+            answer = self.client.generate([self._direct_answer_prompt(q)], temperature=0.2, hedge_node="direct_answer")[0]
+            self._cache_store("general", q, answer, qvec)
+        else:
+            self.log.info("direct_answer: ответ из кэша")
 
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("done:direct_answer | out_len=%d | %.1f ms", len(answer or ""), dt)
+        return {**state, "final_answer": answer}
+
+    async def adirect_answer_node(self, state: AgentState) -> AgentState:
+        """Асинхронный аналог `direct_answer_node`."""
         q = (state.get("question") or "").strip()
         self.log.info("start:direct_answer | q_len=%d", len(q))
         t0 = time.perf_counter()
 
-        prompt = (
-            "Ответь кратко и по делу, оформи в 1–2 абзаца; при необходимости добавь список.\n\n"
-            f"Вопрос: {q}"
-        )
-        answer = self.client.generate([prompt], temperature=0.2)[0]
+        answer, qvec = await self._acache_lookup("general", q)
+        if answer is None:
+            answer = await self._agenerate_answer("direct_answer", self._direct_answer_prompt(q), temperature=0.2)
+            self._cache_store("general", q, answer, qvec)
+        else:
+            self.log.info("direct_answer: ответ из кэша")
+            self._emit_cached("direct_answer", answer)
 
         dt = (time.perf_counter() - t0) * 1000
         self.log.info("done:direct_answer | out_len=%d | %.1f ms", len(answer or ""), dt)
@@ -122,15 +362,28 @@ class AgentSystem:
         """
         Генерирует ответ на основе документов.
         """
-        import time
+        q = (state.get("question") or "").strip()
+        self.log.info("start:rag_answer | q_len=%d", len(q))
+        t0 = time.perf_counter()
+
+        # кэш уже проверен в planner (до retrieve) — здесь только генерация и сохранение
+        prompt = self._rag_answer_prompt(q, state.get("documents", []))
+        answer = self.client.generate([prompt], temperature=0.2, hedge_node="rag_answer")[0]
+        self._cache_store("rag_answer", q, answer, self._cache_vector("rag_answer", q))
+
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("done:rag_answer | out_len=%d | %.1f ms", len(answer or ""), dt)
+        return {**state, "final_answer": answer}
 
+    async def arag_answer_node(self, state: AgentState) -> AgentState:
+        """Асинхронный аналог `rag_answer_node`."""
         q = (state.get("question") or "").strip()
         self.log.info("start:rag_answer | q_len=%d", len(q))
         t0 = time.perf_counter()
 
-        context = "\n".join(state.get("documents", []))
-        prompt = f"Context: {context}. Question: {q}"
-        answer = self.client.generate([prompt], temperature=0.2)[0]
+        prompt = self._rag_answer_prompt(q, state.get("documents", []))
+        answer = await self._agenerate_answer("rag_answer", prompt, temperature=0.2)
+        self._cache_store("rag_answer", q, answer, await self._acache_vector("rag_answer", q))
 
         dt = (time.perf_counter() - t0) * 1000
         self.log.info("done:rag_answer | out_len=%d | %.1f ms", len(answer or ""), dt)
@@ -140,15 +393,25 @@ class AgentSystem:
         """
         Создает квиз на основе документов.
         """
-        import time
+        q = (state.get("question") or "").strip()
+        self.log.info("start:create_quiz | q_len=%d", len(q))
+        t0 = time.perf_counter()
+
+        prompt = self._create_quiz_prompt(state.get("documents", []))
+        quiz = self.client.generate([prompt], temperature=0.7, hedge_node="create_quiz")[0]
 
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("done:create_quiz | quiz_len=%d | %.1f ms", len(quiz or ""), dt)
+        return {**state, "quiz_content": quiz, "final_answer": quiz}
+
+    async def acreate_quiz_node(self, state: AgentState) -> AgentState:
+        """Асинхронный аналог `create_quiz_node`."""
         q = (state.get("question") or "").strip()
         self.log.info("start:create_quiz | q_len=%d", len(q))
         t0 = time.perf_counter()
 
-        context = "\n".join(state.get("documents", []))
-        prompt = f"Make a quiz based on: {context}"
-        quiz = self.client.generate([prompt], temperature=0.7)[0]
+        prompt = self._create_quiz_prompt(state.get("documents", []))
+        quiz = await self._agenerate_answer("create_quiz", prompt, temperature=0.7)
 
         dt = (time.perf_counter() - t0) * 1000
         self.log.info("done:create_quiz | quiz_len=%d | %.1f ms", len(quiz or ""), dt)
@@ -158,8 +421,6 @@ class AgentSystem:
         """
         Оценивает решение пользователя.
         """
-        import time
-
         q = (state.get("question") or "").strip()
         self.log.info("start:evaluate_quiz | q_len=%d", len(q))
         t0 = time.perf_counter()
@@ -169,8 +430,21 @@ class AgentSystem:
         user_solution = q
 
         # Оцениваем ответ
-        prompt = f"Quiz: {quiz_content}\nUser Answer: {user_solution}\nEvaluate the answer."
-        feedback = self.client.generate([prompt], temperature=0.3)[0]
+        prompt = self._evaluate_quiz_prompt(quiz_content, user_solution)
+        feedback = self.client.generate([prompt], temperature=0.3, hedge_node="evaluate_quiz")[0]
+
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("done:evaluate_quiz | feedback_len=%d | %.1f ms", len(feedback or ""), dt)
+        return {**state, "final_answer": feedback}
+
+    async def aevaluate_quiz_node(self, state: AgentState) -> AgentState:
+        """Асинхронный аналог `evaluate_quiz_node`."""
+        q = (state.get("question") or "").strip()
+        self.log.info("start:evaluate_quiz | q_len=%d", len(q))
+        t0 = time.perf_counter()
+
+        prompt = self._evaluate_quiz_prompt(state.get("quiz_content", ""), q)
+        feedback = await self._agenerate_answer("evaluate_quiz", prompt, temperature=0.3)
 
         dt = (time.perf_counter() - t0) * 1000
         self.log.info("done:evaluate_quiz | feedback_len=%d | %.1f ms", len(feedback or ""), dt)
@@ -180,6 +454,8 @@ class AgentSystem:
     @staticmethod
     def route_after_planner(state: AgentState) -> str:
         """Решает, куда идти после планирования."""
+        if state.get("cache_hit"):
+            return "cached"
         intent = state.get("intent", "general")
         if intent == "general":
             return "direct_answer"
@@ -197,24 +473,23 @@ class AgentSystem:
         else:
             return "rag_answer"
 
-    def _determine_intent(self, question: str) -> Literal["general", "rag_answer", "generate_quiz", "evaluate_quiz"]:
-        """Определяет намерение пользователя с использованием LLM."""
-        prompt = (
-            "Определи намерение пользователя. Возможные варианты:\n"
-            "1. general - если пользователь хочет просто поговорить или задать общий вопрос.\n"
-            "2. rag_answer - если пользователь хочет получить ответ на основе учебника Яндекса по машинному обучению.\n"
-            "3. generate_quiz - если пользователь хочет пройти квиз на основе учебника Яндекса.\n"
-            "4. evaluate_quiz - если пользователь хочет оценить результаты прохождения квиза. результаты прохождения берем из памяти\n"
-            f"Вопрос: {question}\n"
-            "Выбери наиболее подходящий вариант: general, rag_answer, generate_quiz или evaluate_quiz."
-        )
-        intent = self.client.generate([prompt], temperature=0.1)[0].strip().lower()
-        
-        # Приводим к правильному типу
-        if intent in ["general", "rag_answer", "generate_quiz", "evaluate_quiz"]:
-            return intent
-        else:
-            return "general"
+    def _pack_documents(self, docs: List[RetrievedDocument]) -> List[str]:
+        """Убирает почти-дубликаты и оставляет лучшие фрагменты в пределах `rag_context_max_tokens`."""
+        cfg = self.cfg
+        packed = pack_context(dedupe(docs, cfg.rag_dedup_threshold), cfg.rag_context_max_tokens)
+        return [d.render() for d in packed]
+
+    def _should_speculate(self, question: str) -> bool:
+        """Спекулятивный поиск нужен, только если маршрут не решён правилами (они мгновенны) или пакетом."""
+        return self.cfg.speculative_retrieval and _intent_hint.get() is None and match_rules(question) is None
+
+    def _determine_intent(self, question: str) -> Intent:
+        """Определяет намерение пользователя: подсказка пакета или правила → эмбеддинги → LLM."""
+        return _intent_hint.get() or self.router.route(question).intent
+
+    async def _adetermine_intent(self, question: str) -> Intent:
+        """Асинхронный аналог `_determine_intent`."""
+        return _intent_hint.get() or (await self.router.aroute(question)).intent
 
     # ---------- Сборка графа ----------
     def _build_graph(self):
@@ -225,12 +500,13 @@ class AgentSystem:
         """
         self.log.debug("build_graph: begin")
         builder = StateGraph(AgentState)
-        builder.add_node("planner", self.planner_node)
-        builder.add_node("retrieve", self.retrieve_node)
-        builder.add_node("direct_answer", self.direct_answer_node)
-        builder.add_node("rag_answer", self.rag_answer_node)
-        builder.add_node("create_quiz", self.create_quiz_node)
-        builder.add_node("evaluate_quiz", self.evaluate_quiz_node)
+        # Каждый узел — пара sync/async: invoke() идёт через первую, ainvoke() — через вторую
+        builder.add_node("planner", RunnableLambda(self.planner_node, afunc=self.aplanner_node))
+        builder.add_node("retrieve", RunnableLambda(self.retrieve_node, afunc=self.aretrieve_node))
+        builder.add_node("direct_answer", RunnableLambda(self.direct_answer_node, afunc=self.adirect_answer_node))
+        builder.add_node("rag_answer", RunnableLambda(self.rag_answer_node, afunc=self.arag_answer_node))
+        builder.add_node("create_quiz", RunnableLambda(self.create_quiz_node, afunc=self.acreate_quiz_node))
+        builder.add_node("evaluate_quiz", RunnableLambda(self.evaluate_quiz_node, afunc=self.aevaluate_quiz_node))
 
         builder.add_edge(START, "planner")
         builder.add_conditional_edges(
@@ -239,7 +515,8 @@ class AgentSystem:
             {
                 "direct_answer": "direct_answer",
                 "retrieve": "retrieve",
-                "evaluate_quiz": "evaluate_quiz"
+                "evaluate_quiz": "evaluate_quiz",
+                "cached": END,
             }
         )
         builder.add_conditional_edges(
@@ -259,22 +536,82 @@ class AgentSystem:
         self.log.debug("build_graph: done")
         return app
 
+    # ---------- Сессии и метрики ----------
+    def end_session(self, session_id: str) -> bool:
+        """
+        Удаляет состояние сессии из памяти графа.
+        Args:
+            session_id: Идентификатор сессии.
+        Returns:
+            True, если сессия существовала.
+        """
+        return self.memory.delete_thread(session_id)
+
+    def _persist(self, session_id: str) -> None:
+        """
+        Сбрасывает буферизованный чекпоинт сессии до ответа клиенту: следующий запрос сессии
+        на другом воркере видит итог запуска. При ошибке запись остаётся в буфере фонового сброса.
+        """
+        try:
+            self.memory.flush_thread(session_id)
+        except Exception as e:
+            self.log.error("Не удалось сбросить чекпоинт сессии %s: %s", session_id, repr(e))
+
+    async def _apersist(self, session_id: str) -> None:
+        """Асинхронный аналог `_persist` (запись в базу — в потоке)."""
+        await asyncio.to_thread(self._persist, session_id)
+
+    def close(self) -> None:
+        """Сбрасывает буферизованные записи сессий и закрывает хранилище."""
+        self.memory.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Метрики агента: сессии и очерёдность их запусков, роутер намерений, кэш ответов, очереди лимитов,
+        автоматы провайдеров, хедж, входные токены (из кэша провайдера и без), спекулятивный
+        поиск и кэш RAG.
+        """
+        return {
+            "sessions": self.memory.stats(),
+            "session_runs": self.session_runs.stats(),
+            "intent_router": self.router.stats(),
+            "response_cache": self.response_cache.stats() if self.response_cache else None,
+            "rate_limits": rate_limiters.stats(),
+            "providers": breakers.stats(),
+            "hedging": hedger.stats(),
+            "prompt_tokens": prompt_tokens.stats(),
+            "speculative_retrieval": self.speculation.stats(),
+            "rag_cache": rag_cache.stats(),
+        }
+
     # ---------- Публичный вызов ----------
-    def run(self, question: str, session_id: str = "default") -> str:
+    def run(self, question: str, session_id: str = "default", idempotency_key: Optional[str] = None) -> str:
         """
         Запускает граф на один вопрос.
+        Запуски одной сессии идут по очереди; повтор того же запроса, пока первый выполняется,
+        получает его ответ без нового запуска. С явным `idempotency_key` готовый ответ
+        отдаётся повтору ещё session_dedup_ttl_s секунд после завершения.
         Args:
             question: Вопрос пользователя.
             session_id: Идентификатор сессии для управления памятью графа.
+            idempotency_key: Ключ идемпотентности клиента (иначе — хэш сессии и вопроса).
         Returns:
             Финальный ответ строкой.
         """
-        import time
+        key = idempotency_key_for(session_id, question, idempotency_key)
+        return self.session_runs.run(
+            session_id, key, lambda: self._run(question, session_id), replay=bool(idempotency_key)
+        )
 
+    def _run(self, question: str, session_id: str) -> str:
         self.log.info("run: start | q_len=%d", len(question or ""))
         t0 = time.perf_counter()
         config = {"configurable": {"thread_id": session_id}}
-        final_state: AgentState = self.app.invoke({"question": question}, config=config)
+        try:
+            with self.speculation.scope():
+                final_state: AgentState = self.app.invoke({"question": question}, config=config)
+        finally:
+            self._persist(session_id)
         answer = final_state.get("final_answer", "")
         dt = (time.perf_counter() - t0) * 1000
         self.log.info("run: done  | out_len=%d | %.1f ms", len(answer or ""), dt)
@@ -282,3 +619,225 @@ class AgentSystem:
         # опционально – совместимость с UI, где ожидают AIMessage
         _ = AIMessage(content=answer)
         return answer
+
+    async def arun(
+        self,
+        question: str,
+        session_id: str = "default",
+        idempotency_key: Optional[str] = None,
+        admit: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> str:
+        """
+        Асинхронно запускает граф на один вопрос (через `ainvoke`, не блокируя event loop).
+        Очерёдность и идемпотентность — как у `run`.
+        Args:
+            question: Вопрос пользователя.
+            session_id: Идентификатор сессии для управления памятью графа.
+            idempotency_key: Ключ идемпотентности клиента (иначе — хэш сессии и вопроса).
+            admit: Контекст допуска (`admission.admit`); занимает место только сам запуск графа,
+                повтор, присоединившийся к идущему запуску, — нет.
+        Returns:
+            Финальный ответ строкой.
+        """
+        key = idempotency_key_for(session_id, question, idempotency_key)
+        return await self.session_runs.arun(
+            session_id, key, lambda: self._arun(question, session_id), replay=bool(idempotency_key), admit=admit
+        )
+
+    async def _arun(self, question: str, session_id: str) -> str:
+        self.log.info("arun: start | q_len=%d", len(question or ""))
+        t0 = time.perf_counter()
+        config = {"configurable": {"thread_id": session_id}}
+        try:
+            with self.speculation.scope():
+                final_state: AgentState = await self.app.ainvoke({"question": question}, config=config)
+        finally:
+            await self._apersist(session_id)
+        answer = final_state.get("final_answer", "")
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("arun: done  | out_len=%d | %.1f ms", len(answer or ""), dt)
+        return answer
+
+    def _batch_intents(self, questions: List[str]) -> List[Optional[Intent]]:
+        """Намерения вопросов пакета одной маршрутизацией; при ошибке — None (каждый запуск решит сам)."""
+        try:
+            return [d.intent for d in self.router.classify_batch(questions)]
+        except Exception as e:
+            self.log.warning("run_many: пакетная маршрутизация не удалась: %s", repr(e))
+            return [None] * len(questions)
+
+    async def _abatch_intents(self, questions: List[str]) -> List[Optional[Intent]]:
+        """Асинхронный аналог `_batch_intents`."""
+        try:
+            return [d.intent for d in await self.router.aclassify_batch(questions)]
+        except Exception as e:
+            self.log.warning("arun_many: пакетная маршрутизация не удалась: %s", repr(e))
+            return [None] * len(questions)
+
+    @staticmethod
+    def _batch_result(index: int, session_id: str, answer: Optional[str], error: Optional[BaseException]) -> Dict[str, Any]:
+        if error is not None:
+            return {"index": index, "session_id": session_id, "status": "error", "detail": str(error)}
+        return {"index": index, "session_id": session_id, "status": "success", "answer": answer}
+
+    def _batch_concurrency(self, max_concurrency: Optional[int]) -> int:
+        """Одновременных элементов пакета: запрошенное, но не больше batch_max_concurrency."""
+        limit = max(1, self.cfg.batch_max_concurrency)
+        return max(1, min(max_concurrency or limit, limit))
+
+    def run_many(
+        self, items: List[Tuple[str, str]], max_concurrency: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Запускает граф на пакет вопросов (оценка качества, прогрев кэшей).
+
+        Намерения всех вопросов определяются заранее одной пакетной маршрутизацией
+        (`IntentRouter.classify_batch`: неуверенные вопросы — одним вызовом LLM), затем
+        элементы выполняются через `run` не более чем по `max_concurrency` одновременно.
+        Args:
+            items: Пары (вопрос, session_id).
+            max_concurrency: Одновременных запусков (по умолчанию и не больше batch_max_concurrency).
+        Yields:
+            {"index", "session_id", "status": "success", "answer"} или
+            {"index", "session_id", "status": "error", "detail"} — в порядке завершения.
+        """
+        if not items:
+            return
+        intents = self._batch_intents([q for q, _ in items])
+
+        def _one(index: int) -> Dict[str, Any]:
+            question, session_id = items[index]
+            _intent_hint.set(intents[index])  # поток пула: контекст задачи свой
+            try:
+                return self._batch_result(index, session_id, self.run(question, session_id), None)
+            except Exception as e:
+                self.log.error("run_many: элемент %d: %s", index, repr(e))
+                return self._batch_result(index, session_id, None, e)
+            finally:
+                _intent_hint.set(None)
+
+        workers = min(self._batch_concurrency(max_concurrency), len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="run_many") as pool:
+            futures = [pool.submit(_one, i) for i in range(len(items))]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    async def arun_many(
+        self,
+        items: List[Tuple[str, str]],
+        max_concurrency: Optional[int] = None,
+        admit: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Асинхронный аналог `run_many`: элементы выполняются через `arun` под семафором,
+        результаты отдаются по мере завершения. Если потребитель перестал читать,
+        ещё не завершённые запуски отменяются.
+        `admit` — контекст допуска каждого элемента (см. `arun`): пакет занимает столько мест,
+        сколько его элементов выполняется; отказ в допуске — строка со статусом error.
+        """
+        if not items:
+            return
+        intents = await self._abatch_intents([q for q, _ in items])
+        semaphore = asyncio.Semaphore(self._batch_concurrency(max_concurrency))
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def _one(index: int) -> None:
+            question, session_id = items[index]
+            async with semaphore:
+                _intent_hint.set(intents[index])  # у каждой задачи своя копия контекста
+                try:
+                    answer = await self.arun(question, session_id, admit=admit)
+                except Exception as e:
+                    self.log.error("arun_many: элемент %d: %s", index, repr(e))
+                    queue.put_nowait(self._batch_result(index, session_id, None, e))
+                else:
+                    queue.put_nowait(self._batch_result(index, session_id, answer, None))
+
+        tasks = [asyncio.create_task(_one(i)) for i in range(len(items))]
+        try:
+            for _ in range(len(tasks)):
+                yield await queue.get()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def astream_run(
+        self,
+        question: str,
+        session_id: str = "default",
+        admit: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Запускает граф на один вопрос в потоковом режиме.
+
+        Отдаёт события по мере выполнения:
+        - {"event": "start", "session_id": ...} — очередь сессии пройдена, место в допуске получено;
+        - {"event": "planner", "intent": ...} и {"event": "retrieve", "docs_count": ...} — прогресс;
+        - {"event": "token", "node": ..., "text": ...} — фрагменты ответа узлов-генераторов;
+        - {"event": "done", "answer": ..., "session_id": ...} — итог (состояние уже в чекпоинте);
+        - {"event": "error", "detail": ...} — ошибка выполнения графа.
+        Запуски одной сессии идут по очереди (см. `run`); повторы не объединяются.
+        Ошибка до события start (отказ в допуске) поднимается из генератора, а не приходит событием.
+        Args:
+            question: Вопрос пользователя.
+            session_id: Идентификатор сессии для управления памятью графа.
+            admit: Контекст допуска (`admission.admit`); входит в него запуск, дождавшийся своей сессии.
+        """
+        self.log.info("astream_run: start | q_len=%d", len(question or ""))
+        t0 = time.perf_counter()
+        config = {"configurable": {"thread_id": session_id}}
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def _drive() -> None:
+            answer = ""
+            started = False
+            try:
+                async with self.session_runs.session_lock(session_id):
+                    async with admit() if admit is not None else nullcontext():
+                        started = True
+                        queue.put_nowait({"event": "start", "session_id": session_id})
+                        try:
+                            with self.speculation.scope():
+                                async for chunk in self.app.astream({"question": question}, config=config, stream_mode="updates"):
+                                    for node, update in chunk.items():
+                                        update = update or {}
+                                        if node == "planner":
+                                            queue.put_nowait({"event": "planner", "intent": update.get("intent")})
+                                        elif node == "retrieve":
+                                            queue.put_nowait({"event": "retrieve", "docs_count": len(update.get("documents") or [])})
+                                        if "final_answer" in update:
+                                            answer = update.get("final_answer") or ""
+                        finally:
+                            await self._apersist(session_id)
+                queue.put_nowait({"event": "done", "answer": answer, "session_id": session_id})
+                dt = (time.perf_counter() - t0) * 1000
+                self.log.info("astream_run: done  | out_len=%d | %.1f ms", len(answer), dt)
+            except Exception as e:
+                if not started:
+                    queue.put_nowait(e)
+                    return
+                self.log.error("astream_run: ошибка %s", repr(e))
+                queue.put_nowait({"event": "error", "detail": str(e)})
+            finally:
+                queue.put_nowait(None)
+
+        # Задача копирует контекст в момент создания — приёмник виден только этому запуску
+        token = _stream_sink.set(queue.put_nowait)
+        try:
+            task = asyncio.create_task(_drive())
+        finally:
+            _stream_sink.reset(token)
+
+        try:
+            while (event := await queue.get()) is not None:
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            if not task.done():
+                task.cancel()
@@ -5,11 +5,17 @@ FastAPI приложение для агента.
 
 import argparse
 import json
-from fastapi import FastAPI, HTTPException
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
+from admission import AdmissionController, AdmissionRejected
 from agent_system import AgentSystem
+from http_pool import http_pool
 from settings import get_settings
 
 # Парсинг аргументов командной строки
@@ -30,17 +36,37 @@ except FileNotFoundError:
     # Используем переменную окружения, если файл настроек отсутствует
     AGENT_PORT = int(os.getenv("AGENT_PORT", "8250"))
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Жизненный цикл приложения: при остановке закрываем пулы HTTP-соединений и хранилище сессий."""
+    yield
+    await http_pool.aclose()
+    agent.close()
+
 # Создание приложения FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Инициализация агента
 agent = AgentSystem()
 
+# Контроль допуска: лимит одновременных запусков и очередь на воркер
+admission = AdmissionController.from_settings(get_settings())
+
+
+def _rejected(e: AdmissionRejected) -> HTTPException:
+    """Отказ в допуске: 429/503 с Retry-After."""
+    return HTTPException(status_code=e.status, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
 # Модель для запроса
 class AgentRequest(BaseModel):
     question: str
     session_id: Optional[str] = "default"
 
+# Модель для пакетного запроса
+class BatchRequest(BaseModel):
+    items: List[AgentRequest]
+    max_concurrency: Optional[int] = None
+
 # Модель для ответа
 class AgentResponse(BaseModel):
     answer: str
@@ -49,20 +75,92 @@ class AgentResponse(BaseModel):
 
 # Эндпоинт для запуска агента
 @app.post("/api/agent/run")
-async def run_agent(request: AgentRequest):
+async def run_agent(request: AgentRequest, idempotency_key: Optional[str] = Header(default=None)):
     """
     Запускает агента для обработки вопроса.
+    Граф выполняется асинхронно, поэтому event loop остаётся свободным для других запросов.
+    При перегрузке запрос ждёт в очереди или сразу получает 429/503 с Retry-After.
+    Повтор запроса (тот же заголовок Idempotency-Key или тот же вопрос сессии) получает
+    ответ уже идущего запуска и места в контроле допуска не занимает.
     """
     try:
-        answer = agent.run(request.question, request.session_id)
+        answer = await agent.arun(
+            request.question,
+            request.session_id,
+            idempotency_key=idempotency_key,
+            admit=lambda: admission.admit(request.session_id),
+        )
         return AgentResponse(
             answer=answer,
             session_id=request.session_id,
             status="success"
         )
+    except AdmissionRejected as e:
+        raise _rejected(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Эндпоинт для потокового запуска агента (Server-Sent Events)
+@app.post("/api/agent/stream")
+async def stream_agent(request: AgentRequest):
+    """
+    Запускает агента и отдаёт прогресс и токены ответа по мере генерации (SSE).
+    Каждое событие: `event: <тип>` + `data: <json>`; первое — `start`, последнее — `done` или `error`.
+    Место в контроле допуска занимается после очереди сессии, до начала потока (отказ — 429/503),
+    и держится до его конца (освобождается и при обрыве соединения — фоновой задачей ответа).
+    """
+    events = agent.astream_run(
+        request.question,
+        request.session_id,
+        admit=lambda: admission.admit(request.session_id),
+    )
+    try:
+        first = await events.__anext__()
+    except AdmissionRejected as e:
+        raise _rejected(e)
+
+    def _sse(event):
+        data = json.dumps(event, ensure_ascii=False)
+        return f"event: {event['event']}\ndata: {data}\n\n"
+
+    async def _events():
+        yield _sse(first)
+        async for event in events:
+            yield _sse(event)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(events.aclose),
+    )
+
+# Эндпоинт для пакетного запуска агента (NDJSON)
+@app.post("/api/agent/run_batch")
+async def run_batch(request: BatchRequest):
+    """
+    Запускает агента на пакет вопросов (оценка качества, прогрев кэшей).
+    Намерения вопросов определяются одной пакетной маршрутизацией, элементы выполняются
+    не более чем по `max_concurrency` (batch_max_concurrency) одновременно. Ответ — NDJSON:
+    строка на элемент в порядке завершения, `index` — номер элемента в запросе.
+    Каждый выполняющийся элемент занимает своё место в контроле допуска; элементы пакета
+    стоят в очереди как одна «сессия», поэтому пакет не вытесняет диалоги. Отказ в допуске
+    (перегрузка) — строка элемента со статусом error.
+    """
+    limit = get_settings().batch_max_items
+    if len(request.items) > limit:
+        raise HTTPException(status_code=413, detail=f"Слишком много элементов в пакете (максимум {limit})")
+    batch_session = f"batch:{uuid.uuid4().hex}"
+    items = [(item.question, item.session_id) for item in request.items]
+
+    async def _lines():
+        async for result in agent.arun_many(
+            items, request.max_concurrency, admit=lambda: admission.admit(batch_session)
+        ):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
 # Эндпоинт для проверки состояния агента
 @app.get("/api/agent/status")
 async def get_agent_status():
@@ -75,14 +173,24 @@ async def get_agent_status():
 @app.post("/api/agent/end_session")
 async def end_session(session_id: Optional[str] = "default"):
     """
-    Завершает сессию агента.
+    Завершает сессию агента: удаляет её состояние из памяти графа.
     """
     try:
-        # Здесь можно добавить логику для завершения сессии, если это необходимо
-        return {"status": "success", "message": "Session ended", "session_id": session_id}
+        existed = agent.end_session(session_id)
+        message = "Session ended" if existed else "Session not found"
+        return {"status": "success", "message": message, "session_id": session_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Эндпоинт метрик агента
+@app.get("/api/agent/metrics")
+async def get_agent_metrics():
+    """
+    Возвращает метрики агента: живые сессии и занятая ими память, роутер, кэш ответов,
+    а также контроль допуска (очередь, отказы, время ожидания и обслуживания).
+    """
+    return {**agent.metrics(), "admission": admission.stats()}
+
 # Запуск приложения
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,172 @@
+"""
+Пул долгоживущих HTTP-клиентов для внешних сервисов (RAG, test_generator, ...).
+
+На каждый сервис (origin: схема + хост + порт, т.е. `rag_service_url`,
+`test_generator_service_url` и т.д.) держится один `httpx.Client` и один
+`httpx.AsyncClient` со своим пулом соединений и keep-alive. HTTP/2 включается,
+если установлен пакет `h2`.
+"""
+
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Dict, List
+
+import httpx
+
+from logger import get_logger
+from settings import get_settings
+
+
+def _h2_available() -> bool:
+    """Проверяет, установлена ли поддержка HTTP/2 (пакет h2)."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def service_key(url: str) -> str:
+    """
+    Ключ пула для URL: origin сервиса.
+
+    Args:
+        url: Полный URL запроса.
+
+    Returns:
+        str: "scheme://host:port".
+    """
+    u = httpx.URL(url)
+    port = u.port or (443 if u.scheme == "https" else 80)
+    return f"{u.scheme}://{u.host}:{port}"
+
+
+class HTTPClientPool:
+    """
+    Менеджер пулов соединений: по одному sync- и async-клиенту на сервис.
+    """
+
+    def __init__(self) -> None:
+        self.log = get_logger(__name__)
+        self._lock = threading.Lock()
+        self._clients: Dict[str, httpx.Client] = {}
+        # AsyncClient привязан к event loop: клиенты хранятся по циклу (слабая ссылка —
+        # запись исчезает вместе с циклом), внутри — по сервису
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @staticmethod
+    def _client_kwargs() -> dict:
+        """Общие параметры клиентов из настроек: лимиты, таймауты, HTTP/2."""
+        cfg = get_settings()
+        limits = httpx.Limits(
+            max_connections=cfg.http_max_connections,
+            max_keepalive_connections=cfg.http_max_keepalive_connections,
+            keepalive_expiry=cfg.http_keepalive_expiry_s,
+        )
+        return dict(
+            limits=limits,
+            timeout=cfg.http_timeout_s,
+            http2=cfg.http2_enabled and _h2_available(),
+        )
+
+    def client(self, url: str) -> httpx.Client:
+        """
+        Возвращает (создаёт при первом обращении) sync-клиент для сервиса URL.
+
+        Args:
+            url: URL запроса (используется только origin).
+
+        Returns:
+            httpx.Client: Долгоживущий клиент с пулом соединений.
+        """
+        key = service_key(url)
+        with self._lock:
+            c = self._clients.get(key)
+            if c is None or c.is_closed:
+                kwargs = self._client_kwargs()
+                self.log.info("http_pool: новый клиент %s (http2=%s)", key, kwargs["http2"])
+                c = httpx.Client(**kwargs)
+                self._clients[key] = c
+            return c
+
+    def async_client(self, url: str) -> httpx.AsyncClient:
+        """
+        Возвращает (создаёт при первом обращении) async-клиент для сервиса URL
+        в текущем event loop.
+
+        Args:
+            url: URL запроса (используется только origin).
+
+        Returns:
+            httpx.AsyncClient: Долгоживущий клиент с пулом соединений.
+        """
+        key = service_key(url)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._drop_closed_loops()
+            clients = self._async_clients.setdefault(loop, {})
+            c = clients.get(key)
+            if c is None or c.is_closed:
+                kwargs = self._client_kwargs()
+                self.log.info("http_pool: новый async-клиент %s (http2=%s)", key, kwargs["http2"])
+                c = httpx.AsyncClient(**kwargs)
+                clients[key] = c
+            return c
+
+    def _drop_closed_loops(self) -> int:
+        """
+        Забывает клиентов закрытых циклов (например, после `asyncio.run`): закрыть их уже
+        нельзя, а соединения освобождаются вместе с циклом. Вызывать под self._lock.
+        """
+        dead = [loop for loop in self._async_clients.keys() if loop.is_closed()]
+        for loop in dead:
+            del self._async_clients[loop]
+        return len(dead)
+
+    def close(self) -> None:
+        """Закрывает все sync-клиенты."""
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for c in clients:
+            c.close()
+
+    async def aclose(self) -> None:
+        """
+        Закрывает все клиенты: async-клиенты текущего цикла — здесь, клиенты других
+        работающих циклов — задачей в их цикле, клиенты закрытых циклов забываются.
+        """
+        current = asyncio.get_running_loop()
+        with self._lock:
+            self._drop_closed_loops()
+            by_loop = list(self._async_clients.items())
+            self._async_clients.clear()
+        own: List[httpx.AsyncClient] = []
+        foreign = 0
+        for loop, clients in by_loop:
+            if loop is current:
+                own.extend(clients.values())
+                continue
+            for c in clients.values():
+                try:
+                    asyncio.run_coroutine_threadsafe(c.aclose(), loop)
+                    foreign += 1
+                except RuntimeError:  # цикл закрылся между проверкой и вызовом
+                    pass
+        for c in own:
+            await c.aclose()
+        self.close()
+        self.log.info("http_pool: закрыто async-клиентов=%d (в других циклах=%d)", len(own), foreign)
+
+    def stats(self) -> Dict[str, int]:
+        """Число sync-клиентов, циклов с async-клиентами и async-клиентов."""
+        with self._lock:
+            self._drop_closed_loops()
+            return {
+                "clients": len(self._clients),
+                "loops": len(self._async_clients),
+                "async_clients": sum(len(c) for c in self._async_clients.values()),
+            }
+
+
+# Пул процесса: общий для всех инструментов
+http_pool = HTTPClientPool()
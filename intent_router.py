@@ -0,0 +1,634 @@
+"""
+Многоуровневый роутер намерений перед LLM-планировщиком.
+
+Уровни (от дешёвого к дорогому):
+1. rules     — ключевые слова / регулярные выражения для очевидных случаев;
+2. embedding — ближайший центроид по эмбеддингам размеченных примеров;
+3. llm       — классификация LLM, только если предыдущие уровни не уверены.
+
+Вопросы уровня llm, пришедшие почти одновременно (в пределах `llm_batch_wait_ms`),
+классифицируются одним вызовом (`IntentBatcher`): нумерованный список вопросов → JSON-список меток.
+
+Ответ уровня llm ограничен схемой (function calling / JSON mode, см. llm_service/structured.py)
+и несколькими токенами; если модель всё же ответила текстом, метка извлекается из него.
+"""
+
+import asyncio
+import json
+import math
+import re
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Literal, Optional, Sequence, Tuple
+
+from llm_service.structured import StructuredOutput
+from logger import get_logger
+
+Intent = Literal["general", "rag_answer", "generate_quiz", "evaluate_quiz"]
+INTENTS: Tuple[str, ...] = ("general", "rag_answer", "generate_quiz", "evaluate_quiz")
+
+# Пауза перед повторной попыткой построить центроиды, если эмбеддинги примеров недоступны
+CENTROIDS_RETRY_PAUSE_S = 300.0
+
+# Схемы ответа уровня llm: одна метка и список меток пакета
+INTENT_OUTPUT = StructuredOutput(
+    name="set_intent",
+    description="Намерение пользователя",
+    parameters={
+        "type": "object",
+        "properties": {"label": {"type": "string", "enum": list(INTENTS)}},
+        "required": ["label"],
+    },
+)
+BATCH_INTENT_OUTPUT = StructuredOutput(
+    name="set_intents",
+    description="Намерения вопросов в порядке их номеров",
+    parameters={
+        "type": "object",
+        "properties": {"labels": {"type": "array", "items": {"type": "string", "enum": list(INTENTS)}}},
+        "required": ["labels"],
+    },
+)
+
+# Порядок важен: первое совпадение выигрывает («создай квиз из учебника» — это квиз, а не RAG).
+RULES: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("evaluate_quiz", re.compile(
+        r"(вот\s+мои\s+ответы|мои\s+ответы\s+на|ответы\s+на\s+(квиз|тест|вопросы)|"
+        r"провер\w*\s+(мои\s+)?(ответ|решени)|оцени\w*\s+(мои\s+)?(ответ|решени|результат))",
+        re.IGNORECASE,
+    )),
+    ("generate_quiz", re.compile(
+        r"((созда\w*|сдела\w*|сгенерир\w*|состав\w*|придума\w*|дай|хочу\s+пройти|проведи)\s+(\w+\s+){0,2}"
+        r"(квиз|тест|викторин)\w*|\bquiz\b)",
+        re.IGNORECASE,
+    )),
+    ("rag_answer", re.compile(
+        r"((из|по|в)\s+учебник\w*|учебник\w*\s+яндекс)",
+        re.IGNORECASE,
+    )),
+    ("general", re.compile(
+        r"^\s*(привет\w*|здравствуй\w*|добр\w+\s+(день|вечер|утро)|hi|hello|спасибо|благодарю|пока)"
+        r"[\s!.?,)]*(как\s+(дела|ты)[\s!.?,)]*)?$",
+        re.IGNORECASE,
+    )),
+]
+
+# Размеченные примеры для уровня эмбеддингов (центроид на намерение)
+DEFAULT_EXAMPLES: Dict[str, List[str]] = {
+    "general": [
+        "Привет! Как дела?",
+        "Кто ты и что умеешь?",
+        "Расскажи анекдот",
+        "Какая сегодня погода?",
+        "Спасибо за помощь",
+    ],
+    "rag_answer": [
+        "Что такое градиентный бустинг?",
+        "Объясни, как работает логистическая регрессия",
+        "Чем отличается bagging от boosting?",
+        "Как устроена функция потерь в линейной регрессии?",
+        "Что такое переобучение и как с ним бороться?",
+        "Расскажи про решающие деревья",
+    ],
+    "generate_quiz": [
+        "Создай квиз по машинному обучению",
+        "Хочу проверить свои знания по нейросетям",
+        "Дай мне несколько вопросов для самопроверки по кластеризации",
+        "Сгенерируй тест по линейным моделям",
+        "Проведи викторину по градиентному спуску",
+    ],
+    "evaluate_quiz": [
+        "Вот мои ответы на квиз: 1 — а, 2 — б",
+        "Проверь мои ответы",
+        "Мои ответы: первый вариант, второй вариант",
+        "Оцени мое решение теста",
+        "Ответ на первый вопрос — переобучение, на второй — регуляризация",
+    ],
+}
+
+
+def intent_prompt(question: str) -> str:
+    """Промпт LLM-уровня классификации."""
+    return (
+        "Определи намерение пользователя. Возможные варианты:\n"
+        "1. general - если пользователь хочет просто поговорить или задать общий вопрос.\n"
+        "2. rag_answer - если пользователь хочет получить ответ на основе учебника Яндекса по машинному обучению.\n"
+        "3. generate_quiz - если пользователь хочет пройти квиз на основе учебника Яндекса.\n"
+        "4. evaluate_quiz - если пользователь хочет оценить результаты прохождения квиза. результаты прохождения берем из памяти\n"
+        f"Вопрос: {question}\n"
+        'Ответь только JSON-объектом {"label": "<вариант>"}, где вариант — general, rag_answer, '
+        "generate_quiz или evaluate_quiz."
+    )
+
+
+def batch_intent_prompt(questions: Sequence[str]) -> str:
+    """Промпт LLM-уровня для нескольких вопросов сразу (ответ — JSON-список меток в порядке вопросов)."""
+    numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+    return (
+        "Определи намерение пользователя для каждого вопроса. Возможные варианты:\n"
+        "general - общий вопрос или разговор; rag_answer - ответ по учебнику Яндекса по машинному обучению; "
+        "generate_quiz - пройти квиз по учебнику; evaluate_quiz - оценить результаты прохождения квиза.\n"
+        f"Вопросы:\n{numbered}\n"
+        f'Ответь только JSON-объектом {{"labels": [...]}} со списком из {len(questions)} вариантов '
+        'в порядке вопросов, например {"labels": ["rag_answer", "general"]}, без пояснений.'
+    )
+
+
+_BATCH_LINE_RE = re.compile(r"^\s*(\d+)\s*[:.)\-]\s*([a-z_]+)", re.IGNORECASE | re.MULTILINE)
+
+
+def parse_batch_intents(raw: str, count: int) -> List[Optional[Intent]]:
+    """
+    Разбирает ответ на `batch_intent_prompt`: JSON-список меток (в том числе `{"labels": [...]}`),
+    а если его нет или длина не совпадает — строки вида «номер: вариант».
+
+    Returns:
+        List[Optional[Intent]]: Намерение по номеру вопроса; None — метки нет или вариант недопустим.
+    """
+    intents: List[Optional[Intent]] = [None] * count
+    raw = raw or ""
+    start, end = raw.find("["), raw.rfind("]")
+    if 0 <= start < end:
+        try:
+            labels = json.loads(raw[start:end + 1])
+        except ValueError:
+            labels = None
+        if isinstance(labels, list) and len(labels) == count:
+            for i, label in enumerate(labels):
+                value = str(label).strip().lower()
+                intents[i] = value if value in INTENTS else None
+            return intents
+    for num, value in _BATCH_LINE_RE.findall(raw):
+        i, value = int(num) - 1, value.lower()
+        if 0 <= i < count and value in INTENTS:
+            intents[i] = value
+    return intents
+
+
+_LABEL_RE = re.compile(r"\b(" + "|".join(INTENTS) + r")\b")
+
+
+def parse_intent(raw: str) -> Intent:
+    """
+    Приводит ответ LLM к допустимому намерению: JSON `{"label": ...}` (структурированный ответ),
+    иначе первая метка, встреченная в тексте (модель добавила пунктуацию или фразу), иначе general.
+    """
+    text = (raw or "").strip().lower()
+    start, end = text.find("{"), text.rfind("}")
+    if 0 <= start < end:
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            data = None
+        label = str(data.get("label") or "").strip() if isinstance(data, dict) else ""
+        if label in INTENTS:
+            return label
+    match = _LABEL_RE.search(text)
+    return match.group(1) if match else "general"
+
+
+def match_rules(question: str) -> Optional[Intent]:
+    """
+    Уровень правил: возвращает намерение для очевидных формулировок.
+
+    Args:
+        question: Вопрос пользователя.
+
+    Returns:
+        Optional[Intent]: Намерение или None, если ни одно правило не сработало.
+    """
+    for intent, pattern in RULES:
+        if pattern.search(question or ""):
+            return intent
+    return None
+
+
+def _normalize(v: Sequence[float]) -> List[float]:
+    """L2-нормализация вектора."""
+    norm = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / norm for x in v]
+
+
+def _dot(a: Sequence[float], b: Sequence[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+@dataclass
+class RouteDecision:
+    """Результат маршрутизации: намерение, решивший уровень, уверенность и время."""
+
+    intent: Intent
+    tier: str
+    confidence: float
+    latency_ms: float
+
+
+class IntentBatcher:
+    """
+    Микробатчинг уровня llm: вопросы, пришедшие в пределах `max_wait_s` друг от друга
+    (но не больше `max_batch_size`), классифицируются одним вызовом `classify`.
+    """
+
+    def __init__(
+        self,
+        classify: Callable[[List[str]], Awaitable[List[Intent]]],
+        max_batch_size: int = 8,
+        max_wait_s: float = 0.005,
+    ) -> None:
+        """
+        Args:
+            classify: Классификация списка вопросов (намерения в том же порядке).
+            max_batch_size: Максимум вопросов в одном вызове.
+            max_wait_s: Сколько первый вопрос пакета ждёт попутчиков.
+        """
+        self._classify = classify
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max(0.0, max_wait_s)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._lock = threading.Lock()
+        self._stats = {"questions": 0, "batches": 0, "max_batch": 0, "errors": 0}
+
+    async def classify(self, question: str) -> Intent:
+        """
+        Классифицирует вопрос в составе ближайшего пакета.
+
+        Raises:
+            Exception: Ошибка вызова пакета (получают все его вопросы).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((question, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_s, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Отправляет накопленный пакет (по таймеру или при заполнении)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [(q, f) for q, f in self._pending if not f.done()]  # отменённые ожидания не отправляем
+        self._pending = []
+        if not batch:
+            return
+        with self._lock:
+            self._stats["questions"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            intents = await self._classify([q for q, _ in batch])
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), intent in zip(batch, intents):
+            if not future.done():
+                future.set_result(intent)
+
+    def stats(self) -> Dict[str, float]:
+        """Вопросы, пакеты, средний и максимальный размер пакета, ошибки вызова."""
+        with self._lock:
+            stats: Dict[str, float] = dict(self._stats)
+        stats["avg_batch"] = stats["questions"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+
+class IntentRouter:
+    """
+    Роутер намерений: rules → embedding (nearest centroid) → llm.
+    """
+
+    def __init__(
+        self,
+        client,
+        use_embeddings: bool = True,
+        embedding_threshold: float = 0.5,
+        embedding_margin: float = 0.05,
+        examples: Optional[Dict[str, List[str]]] = None,
+        embed_query: Optional[Callable[[str], List[float]]] = None,
+        aembed_query: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+        llm_batch_size: int = 1,
+        llm_batch_wait_ms: float = 5.0,
+        structured_output: bool = True,
+        llm_max_tokens: int = 16,
+    ) -> None:
+        """
+        Args:
+            client: LLMClient (нужны generate/agenerate и embed/aembed).
+            use_embeddings: Включить уровень эмбеддингов.
+            embedding_threshold: Минимальное косинусное сходство с лучшим центроидом.
+            embedding_margin: Минимальный отрыв лучшего центроида от второго.
+            examples: Размеченные примеры {intent: [вопросы]} (по умолчанию DEFAULT_EXAMPLES).
+            embed_query: Эмбеддинг одного вопроса (по умолчанию client.embed), позволяет
+                         переиспользовать вектор вопроса, например, в кэше ответов.
+            aembed_query: Асинхронный аналог embed_query.
+            llm_batch_size: Максимум вопросов в одном вызове уровня llm в `aroute` (1 — без микробатчинга).
+            llm_batch_wait_ms: Сколько вопрос ждёт попутчиков перед вызовом уровня llm.
+            structured_output: Ограничивать ответ уровня llm схемой (INTENT_OUTPUT / BATCH_INTENT_OUTPUT).
+            llm_max_tokens: Лимит токенов ответа уровня llm на один вопрос.
+        """
+        self.log = get_logger(__name__)
+        self.client = client
+        self.use_embeddings = use_embeddings
+        self.embedding_threshold = embedding_threshold
+        self.embedding_margin = embedding_margin
+        self.examples = examples or DEFAULT_EXAMPLES
+        self.structured_output = structured_output
+        self.llm_max_tokens = llm_max_tokens
+        self._embed_query = embed_query or (lambda q: (self.client.embed([q]) or [[]])[0])
+        self._aembed_query = aembed_query or self._default_aembed_query
+        self._batcher: Optional[IntentBatcher] = None
+        if llm_batch_size > 1:
+            self._batcher = IntentBatcher(self._allm_intents, llm_batch_size, llm_batch_wait_ms / 1000)
+
+        # Центроиды считаются лениво один раз (один вызов эмбеддингов на все конкурирующие запросы);
+        # при неудаче уровень выключен до _centroids_retry_at, затем попытка повторяется
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        self._centroids_retry_at = 0.0
+        self._centroids_lock = threading.Lock()
+        # asyncio.Lock привязывается к циклу, поэтому свой на каждый цикл
+        self._centroids_alocks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"rules": 0, "embedding": 0, "llm": 0}
+        self._latency_ms: Dict[str, float] = {"rules": 0.0, "embedding": 0.0, "llm": 0.0}
+
+    # ---------- уровень эмбеддингов ----------
+    async def _default_aembed_query(self, question: str) -> List[float]:
+        return (await self.client.aembed([question]) or [[]])[0]
+
+    def _build_centroids(self, vectors: List[List[float]]) -> Dict[str, List[float]]:
+        """Считает нормализованные центроиды из векторов примеров (в порядке self.examples)."""
+        centroids: Dict[str, List[float]] = {}
+        i = 0
+        for intent, questions in self.examples.items():
+            vs = [_normalize(v) for v in vectors[i:i + len(questions)] if v]
+            i += len(questions)
+            if not vs:
+                continue
+            dim = len(vs[0])
+            mean = [sum(v[d] for v in vs) / len(vs) for d in range(dim)]
+            centroids[intent] = _normalize(mean)
+        if len(centroids) < len(self.examples):
+            return {}
+        return centroids
+
+    def _example_texts(self) -> List[str]:
+        return [q for questions in self.examples.values() for q in questions]
+
+    def _ready_centroids(self) -> Optional[Dict[str, List[float]]]:
+        """Готовые центроиды; {} — уровень на паузе после неудачи; None — нужно построить."""
+        if self._centroids is not None:
+            return self._centroids
+        if time.monotonic() < self._centroids_retry_at:
+            return {}
+        return None
+
+    def _store_centroids(self, vectors: Optional[List[List[float]]]) -> Dict[str, List[float]]:
+        """Запоминает центроиды; если эмбеддинги недоступны — ставит паузу до следующей попытки."""
+        centroids = self._build_centroids(vectors or [])
+        if centroids:
+            self._centroids = centroids
+        else:
+            self.log.warning(
+                "intent_router: эмбеддинги примеров недоступны, уровень embedding отключён на %.0f с",
+                CENTROIDS_RETRY_PAUSE_S,
+            )
+            self._centroids_retry_at = time.monotonic() + CENTROIDS_RETRY_PAUSE_S
+        return centroids
+
+    def _ensure_centroids(self) -> Dict[str, List[float]]:
+        ready = self._ready_centroids()
+        if ready is not None:
+            return ready
+        with self._centroids_lock:
+            ready = self._ready_centroids()
+            if ready is not None:
+                return ready
+            try:
+                vectors = self.client.embed(self._example_texts())
+            except Exception as e:
+                self.log.error("intent_router: ошибка эмбеддингов примеров: %s", repr(e))
+                vectors = None
+            return self._store_centroids(vectors)
+
+    async def _aensure_centroids(self) -> Dict[str, List[float]]:
+        ready = self._ready_centroids()
+        if ready is not None:
+            return ready
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            alock = self._centroids_alocks.get(loop)
+            if alock is None:
+                alock = self._centroids_alocks[loop] = asyncio.Lock()
+        async with alock:
+            ready = self._ready_centroids()
+            if ready is not None:
+                return ready
+            try:
+                vectors = await self.client.aembed(self._example_texts())
+            except Exception as e:
+                self.log.error("intent_router: ошибка эмбеддингов примеров: %s", repr(e))
+                vectors = None
+            return self._store_centroids(vectors)
+
+    def _nearest(self, centroids: Dict[str, List[float]], vector: List[float]) -> Tuple[Optional[Intent], float]:
+        """
+        Ближайший центроид с проверкой порога и отрыва.
+
+        Returns:
+            (intent | None, confidence) — None, если классификатор не уверен.
+        """
+        if not centroids or not vector:
+            return None, 0.0
+        q = _normalize(vector)
+        scored = sorted(((_dot(q, c), intent) for intent, c in centroids.items()), reverse=True)
+        best, intent = scored[0]
+        second = scored[1][0] if len(scored) > 1 else -1.0
+        if best >= self.embedding_threshold and best - second >= self.embedding_margin:
+            return intent, best
+        return None, best
+
+    # ---------- маршрутизация ----------
+    def _llm_kwargs(self, count: int = 1) -> Dict[str, object]:
+        """Параметры вызова уровня llm для промпта на `count` вопросов."""
+        kwargs: Dict[str, object] = {
+            "temperature": 0.1,
+            "hedge_node": "planner",
+            "max_tokens": self.llm_max_tokens * count,
+        }
+        if self.structured_output:
+            kwargs["structured_output"] = BATCH_INTENT_OUTPUT if count > 1 else INTENT_OUTPUT
+        return kwargs
+
+    def _decide(self, intent: Intent, tier: str, confidence: float, t0: float) -> RouteDecision:
+        dt = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self._stats[tier] += 1
+            self._latency_ms[tier] += dt
+        self.log.info("intent_router: tier=%s | intent=%s | conf=%.2f | %.1f ms", tier, intent, confidence, dt)
+        return RouteDecision(intent=intent, tier=tier, confidence=confidence, latency_ms=dt)
+
+    def route(self, question: str) -> RouteDecision:
+        """
+        Определяет намерение, поднимаясь по уровням только при неуверенности.
+
+        Args:
+            question: Вопрос пользователя.
+
+        Returns:
+            RouteDecision: Намерение и решивший уровень.
+        """
+        t0 = time.perf_counter()
+        intent = match_rules(question)
+        if intent:
+            return self._decide(intent, "rules", 1.0, t0)
+
+        if self.use_embeddings:
+            centroids = self._ensure_centroids()
+            if centroids:
+                vector = self._embed_query(question)
+                intent, conf = self._nearest(centroids, vector)
+                if intent:
+                    return self._decide(intent, "embedding", conf, t0)
+
+        raw = self.client.generate([intent_prompt(question)], **self._llm_kwargs())[0]
+        return self._decide(parse_intent(raw), "llm", 0.0, t0)
+
+    async def aroute(self, question: str) -> RouteDecision:
+        """Асинхронный аналог `route`."""
+        t0 = time.perf_counter()
+        intent = match_rules(question)
+        if intent:
+            return self._decide(intent, "rules", 1.0, t0)
+
+        if self.use_embeddings:
+            centroids = await self._aensure_centroids()
+            if centroids:
+                vector = await self._aembed_query(question)
+                intent, conf = self._nearest(centroids, vector)
+                if intent:
+                    return self._decide(intent, "embedding", conf, t0)
+
+        if self._batcher is not None:
+            return self._decide(await self._batcher.classify(question), "llm", 0.0, t0)
+        raw = (await self.client.agenerate([intent_prompt(question)], **self._llm_kwargs()))[0]
+        return self._decide(parse_intent(raw), "llm", 0.0, t0)
+
+    # ---------- пакетная маршрутизация ----------
+    def _cheap_tiers(self, question: str, vector: Optional[List[float]], centroids) -> Optional[Tuple[Intent, str, float]]:
+        """Уровни rules и embedding для одного вопроса: (intent, tier, confidence) или None."""
+        intent = match_rules(question)
+        if intent:
+            return intent, "rules", 1.0
+        if centroids and vector:
+            intent, conf = self._nearest(centroids, vector)
+            if intent:
+                return intent, "embedding", conf
+        return None
+
+    def _llm_intents(self, questions: List[str]) -> List[Intent]:
+        """
+        Уровень llm для нескольких вопросов: один вызов с `batch_intent_prompt`,
+        вопросы без допустимой метки в ответе — по одному (`intent_prompt`).
+        """
+        if len(questions) == 1:
+            raw = self.client.generate([intent_prompt(questions[0])], **self._llm_kwargs())[0]
+            return [parse_intent(raw)]
+        raw = self.client.generate([batch_intent_prompt(questions)], **self._llm_kwargs(len(questions)))[0]
+        parsed = parse_batch_intents(raw, len(questions))
+        missing = [i for i, intent in enumerate(parsed) if intent is None]
+        if missing:
+            answers = self.client.generate(
+                [intent_prompt(questions[i]) for i in missing], **self._llm_kwargs()
+            )
+            for i, answer in zip(missing, answers):
+                parsed[i] = parse_intent(answer)
+        return parsed
+
+    async def _allm_intents(self, questions: List[str]) -> List[Intent]:
+        """Асинхронный аналог `_llm_intents`."""
+        if len(questions) == 1:
+            raw = (await self.client.agenerate([intent_prompt(questions[0])], **self._llm_kwargs()))[0]
+            return [parse_intent(raw)]
+        raw = (await self.client.agenerate([batch_intent_prompt(questions)], **self._llm_kwargs(len(questions))))[0]
+        parsed = parse_batch_intents(raw, len(questions))
+        missing = [i for i, intent in enumerate(parsed) if intent is None]
+        if missing:
+            answers = await self.client.agenerate(
+                [intent_prompt(questions[i]) for i in missing], **self._llm_kwargs()
+            )
+            for i, answer in zip(missing, answers):
+                parsed[i] = parse_intent(answer)
+        return parsed
+
+    def _merge_batch(
+        self, decided: List[Optional[Tuple[Intent, str, float]]], llm_intents: List[Intent], t0: float
+    ) -> List[RouteDecision]:
+        """Решения пакета: дешёвые уровни там, где они уверены, остальное — по порядку из уровня llm."""
+        pending = iter(llm_intents)
+        return [self._decide(*d, t0) if d else self._decide(next(pending), "llm", 0.0, t0) for d in decided]
+
+    def classify_batch(self, questions: Sequence[str]) -> List[RouteDecision]:
+        """
+        Маршрутизация набора вопросов: правила и эмбеддинги по каждому, а все неуверенные
+        вопросы — одним вызовом LLM (`_llm_intents`).
+
+        Args:
+            questions: Вопросы.
+
+        Returns:
+            List[RouteDecision]: Решения в порядке вопросов.
+        """
+        t0 = time.perf_counter()
+        centroids = None
+        if self.use_embeddings and any(match_rules(q) is None for q in questions):
+            centroids = self._ensure_centroids()
+        decided = []
+        for q in questions:
+            vector = self._embed_query(q) if centroids and match_rules(q) is None else None
+            decided.append(self._cheap_tiers(q, vector, centroids))
+        pending = [q for q, d in zip(questions, decided) if d is None]
+        return self._merge_batch(decided, self._llm_intents(pending) if pending else [], t0)
+
+    async def aclassify_batch(self, questions: Sequence[str]) -> List[RouteDecision]:
+        """Асинхронный аналог `classify_batch` (эмбеддинги вопросов считаются параллельно)."""
+        t0 = time.perf_counter()
+        centroids = None
+        if self.use_embeddings and any(match_rules(q) is None for q in questions):
+            centroids = await self._aensure_centroids()
+
+        async def _vector(q: str) -> Optional[List[float]]:
+            return await self._aembed_query(q) if centroids and match_rules(q) is None else None
+
+        vectors = await asyncio.gather(*(_vector(q) for q in questions))
+        decided = [self._cheap_tiers(q, v, centroids) for q, v in zip(questions, vectors)]
+        pending = [q for q, d in zip(questions, decided) if d is None]
+        return self._merge_batch(decided, await self._allm_intents(pending) if pending else [], t0)
+
+    def stats(self) -> Dict[str, object]:
+        """Счётчики решений по уровням, среднее время, число сэкономленных LLM-вызовов и размеры пакетов уровня llm."""
+        with self._lock:
+            decided = dict(self._stats)
+            avg = {t: (self._latency_ms[t] / n if n else 0.0) for t, n in decided.items()}
+        return {
+            "decided_by_tier": decided,
+            "avg_latency_ms_by_tier": avg,
+            "llm_calls_saved": decided["rules"] + decided["embedding"],
+            "llm_batching": self._batcher.stats() if self._batcher else None,
+        }
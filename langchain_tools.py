@@ -10,18 +10,22 @@ import httpx
 import json
 from langchain.tools import Tool
 from settings import get_settings
+from http_pool import http_pool
+from retrieval import RetrievedDocument, parse_search_result
+from tool_cache import ToolResultCache
 
 log = logging.getLogger(__name__)
-settings = get_settings()
+
+# Кэш результатов rag_search / rag_generate (общий для процесса, ошибки не кэшируются)
+rag_cache = ToolResultCache()
 
 
 def _get_json(url: str, timeout: int) -> Dict[str, Any]:
-    """Отправляет GET запрос и возвращает ответ."""
+    """Отправляет GET запрос через пул соединений сервиса и возвращает ответ."""
     try:
-        with httpx.Client(timeout=timeout) as client:
-            response = client.get(url)
-            response.raise_for_status()
-            return response.json()
+        response = http_pool.client(url).get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPStatusError as e:
         log.error(f"HTTP error: {e}")
         return {"error": f"HTTP {e.response.status_code}: {str(e)}"}
@@ -31,12 +35,39 @@ def _get_json(url: str, timeout: int) -> Dict[str, Any]:
 
 
 def _post_json(url: str, payload: Dict[str, Any], timeout: int) -> Dict[str, Any]:
-    """Отправляет JSON запрос и возвращает ответ."""
+    """Отправляет JSON запрос через пул соединений сервиса и возвращает ответ."""
+    try:
+        response = http_pool.client(url).post(url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        log.error(f"HTTP error: {e}")
+        return {"error": f"HTTP {e.response.status_code}: {str(e)}"}
+    except Exception as e:
+        log.error(f"Request failed: {e}")
+        return {"error": str(e)}
+
+
+async def _aget_json(url: str, timeout: int) -> Dict[str, Any]:
+    """Асинхронно отправляет GET запрос и возвращает ответ."""
+    try:
+        response = await http_pool.async_client(url).get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        log.error(f"HTTP error: {e}")
+        return {"error": f"HTTP {e.response.status_code}: {str(e)}"}
+    except Exception as e:
+        log.error(f"Request failed: {e}")
+        return {"error": str(e)}
+
+
+async def _apost_json(url: str, payload: Dict[str, Any], timeout: int) -> Dict[str, Any]:
+    """Асинхронно отправляет JSON запрос и возвращает ответ."""
     try:
-        with httpx.Client(timeout=timeout) as client:
-            response = client.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
+        response = await http_pool.async_client(url).post(url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPStatusError as e:
         log.error(f"HTTP error: {e}")
         return {"error": f"HTTP {e.response.status_code}: {str(e)}"}
@@ -45,9 +76,88 @@ def _post_json(url: str, payload: Dict[str, Any], timeout: int) -> Dict[str, Any
         return {"error": str(e)}
 
 
+def _cached(tool: str, query: str, fn, **params: Any) -> Dict[str, Any]:
+    """Вызов через кэш `rag_cache` (если включён `rag_cache_enabled`)."""
+    settings = get_settings()
+    if not settings.rag_cache_enabled:
+        return fn()
+    rag_cache.configure(settings.rag_cache_max_entries, settings.rag_cache_ttl_s)
+    return rag_cache.get_or_call(rag_cache.key(tool, query, **params), fn)
+
+
+async def _acached(tool: str, query: str, afn, **params: Any) -> Dict[str, Any]:
+    """Асинхронный аналог `_cached`."""
+    settings = get_settings()
+    if not settings.rag_cache_enabled:
+        return await afn()
+    rag_cache.configure(settings.rag_cache_max_entries, settings.rag_cache_ttl_s)
+    return await rag_cache.aget_or_call(rag_cache.key(tool, query, **params), afn)
+
+
+def _rag_search_raw(query: str, top_k: int, use_hyde: bool) -> Dict[str, Any]:
+    """Запрос к `/search` RAG сервиса (через кэш); ошибки — словарь с ключом "error"."""
+    return _cached("rag_search", query, lambda: _rag_search_call(query, top_k, use_hyde), top_k=top_k, use_hyde=use_hyde)
+
 
+async def _arag_search_raw(query: str, top_k: int, use_hyde: bool) -> Dict[str, Any]:
+    """Асинхронный аналог `_rag_search_raw`."""
+    return await _acached(
+        "rag_search", query, lambda: _arag_search_call(query, top_k, use_hyde), top_k=top_k, use_hyde=use_hyde
+    )
 
-def rag_search(query: str, top_k: int = 5, use_hyde: bool = False) -> str:
+
+def _rag_search_call(query: str, top_k: int, use_hyde: bool) -> Dict[str, Any]:
+    """Запрос к `/search` RAG сервиса без кэша."""
+    settings = get_settings()
+    rag_service_url = settings.rag_service_url
+    if not rag_service_url:
+        log.warning("RAG service not configured")
+        return {"error": "RAG service not configured"}
+
+    try:
+        payload = {
+            "query": query,
+            "top_k": top_k,
+            "use_hyde": use_hyde
+        }
+        log.info(f"Calling RAG search service at {rag_service_url}/search with payload: {payload}")
+
+        return _post_json(f"{rag_service_url}/search", payload, settings.http_timeout_s)
+    except Exception as e:
+        log.error(f"RAG search service call failed: {e}")
+        return {"error": str(e)}
+
+
+async def _arag_search_call(query: str, top_k: int, use_hyde: bool) -> Dict[str, Any]:
+    """Асинхронный аналог `_rag_search_call`."""
+    settings = get_settings()
+    rag_service_url = settings.rag_service_url
+    if not rag_service_url:
+        log.warning("RAG service not configured")
+        return {"error": "RAG service not configured"}
+
+    try:
+        payload = {
+            "query": query,
+            "top_k": top_k,
+            "use_hyde": use_hyde
+        }
+        log.info(f"Calling RAG search service at {rag_service_url}/search with payload: {payload}")
+
+        return await _apost_json(f"{rag_service_url}/search", payload, settings.http_timeout_s)
+    except Exception as e:
+        log.error(f"RAG search service call failed: {e}")
+        return {"error": str(e)}
+
+
+def _search_json(raw: Dict[str, Any]) -> str:
+    """Ответ инструмента: разобранные фрагменты или ошибка сервиса в формате JSON."""
+    if isinstance(raw, dict) and "error" in raw:
+        return json.dumps(raw, ensure_ascii=False)
+    return json.dumps({"results": [d.to_dict() for d in parse_search_result(raw)]}, ensure_ascii=False)
+
+
+def rag_search(query: str, top_k: int = 5, use_hyde: bool = False) -> List[RetrievedDocument]:
     """
     Выполняет поиск документов через RAG сервис.
     
@@ -57,46 +167,67 @@ def rag_search(query: str, top_k: int = 5, use_hyde: bool = False) -> str:
         use_hyde: Использовать HyDE для улучшения поиска (по умолчанию False)
         
     Returns:
-        Результаты поиска в формате JSON
+        Найденные фрагменты (текст, источник, оценка, id); при ошибке сервиса — пустой список
+    """
+    return parse_search_result(_rag_search_raw(query, top_k, use_hyde))
+
+
+async def arag_search(query: str, top_k: int = 5, use_hyde: bool = False) -> List[RetrievedDocument]:
+    """
+    Асинхронный аналог `rag_search` (не блокирует event loop).
+
+    Args:
+        query: Поисковый запрос
+        top_k: Количество результатов (по умолчанию 5)
+        use_hyde: Использовать HyDE для улучшения поиска (по умолчанию False)
+
+    Returns:
+        Найденные фрагменты (текст, источник, оценка, id); при ошибке сервиса — пустой список
     """
+    return parse_search_result(await _arag_search_raw(query, top_k, use_hyde))
+
+
+def rag_search_json(query: str, top_k: int = 5, use_hyde: bool = False) -> str:
+    """Поиск для инструмента LangChain: результаты (или ошибка) в формате JSON."""
+    return _search_json(_rag_search_raw(query, top_k, use_hyde))
+
+
+async def arag_search_json(query: str, top_k: int = 5, use_hyde: bool = False) -> str:
+    """Асинхронный аналог `rag_search_json`."""
+    return _search_json(await _arag_search_raw(query, top_k, use_hyde))
+
+
+def _rag_generate_call(query: str, top_k: int, temperature: float, use_hyde: bool) -> Dict[str, Any]:
+    """Запрос к `/rag` RAG сервиса без кэша."""
+    settings = get_settings()
     rag_service_url = settings.rag_service_url
     if not rag_service_url:
         log.warning("RAG service not configured")
-        return json.dumps({"error": "RAG service not configured"})
-    
+        return {"error": "RAG service not configured"}
+
     try:
         payload = {
             "query": query,
             "top_k": top_k,
+            "temperature": temperature,
             "use_hyde": use_hyde
         }
-        log.info(f"Calling RAG search service at {rag_service_url}/search with payload: {payload}")
-        
-        result = _post_json(f"{rag_service_url}/search", payload, settings.http_timeout_s)
-        return json.dumps(result, ensure_ascii=False)
+        log.info(f"Calling RAG generate service at {rag_service_url}/rag with payload: {payload}")
+
+        return _post_json(f"{rag_service_url}/rag", payload, settings.http_timeout_s)
     except Exception as e:
-        log.error(f"RAG search service call failed: {e}")
-        return json.dumps({"error": str(e)}, ensure_ascii=False)
+        log.error(f"RAG generate service call failed: {e}")
+        return {"error": str(e)}
 
 
-def rag_generate(query: str, top_k: int = 5, temperature: float = 0.7, use_hyde: bool = False) -> str:
-    """
-    Генерирует ответ на вопрос через RAG сервис.
-    
-    Args:
-        query: Вопрос пользователя
-        top_k: Количество документов для контекста (по умолчанию 5)
-        temperature: Температура генерации (по умолчанию 0.7)
-        use_hyde: Использовать HyDE для улучшения поиска (по умолчанию False)
-        
-    Returns:
-        Сгенерированный ответ в формате JSON
-    """
+async def _arag_generate_call(query: str, top_k: int, temperature: float, use_hyde: bool) -> Dict[str, Any]:
+    """Асинхронный аналог `_rag_generate_call`."""
+    settings = get_settings()
     rag_service_url = settings.rag_service_url
     if not rag_service_url:
         log.warning("RAG service not configured")
-        return json.dumps({"error": "RAG service not configured"})
-    
+        return {"error": "RAG service not configured"}
+
     try:
         payload = {
             "query": query,
@@ -105,12 +236,51 @@ def rag_generate(query: str, top_k: int = 5, temperature: float = 0.7, use_hyde:
             "use_hyde": use_hyde
         }
         log.info(f"Calling RAG generate service at {rag_service_url}/rag with payload: {payload}")
-        
-        result = _post_json(f"{rag_service_url}/rag", payload, settings.http_timeout_s)
-        return json.dumps(result, ensure_ascii=False)
+
+        return await _apost_json(f"{rag_service_url}/rag", payload, settings.http_timeout_s)
     except Exception as e:
         log.error(f"RAG generate service call failed: {e}")
-        return json.dumps({"error": str(e)}, ensure_ascii=False)
+        return {"error": str(e)}
+
+
+def rag_generate(query: str, top_k: int = 5, temperature: float = 0.7, use_hyde: bool = False) -> str:
+    """
+    Генерирует ответ на вопрос через RAG сервис (повторные вопросы — из кэша).
+    
+    Args:
+        query: Вопрос пользователя
+        top_k: Количество документов для контекста (по умолчанию 5)
+        temperature: Температура генерации (по умолчанию 0.7)
+        use_hyde: Использовать HyDE для улучшения поиска (по умолчанию False)
+        
+    Returns:
+        Сгенерированный ответ в формате JSON
+    """
+    result = _cached(
+        "rag_generate", query, lambda: _rag_generate_call(query, top_k, temperature, use_hyde),
+        top_k=top_k, temperature=temperature, use_hyde=use_hyde,
+    )
+    return json.dumps(result, ensure_ascii=False)
+
+
+async def arag_generate(query: str, top_k: int = 5, temperature: float = 0.7, use_hyde: bool = False) -> str:
+    """
+    Асинхронный аналог `rag_generate`.
+
+    Args:
+        query: Вопрос пользователя
+        top_k: Количество документов для контекста (по умолчанию 5)
+        temperature: Температура генерации (по умолчанию 0.7)
+        use_hyde: Использовать HyDE для улучшения поиска (по умолчанию False)
+
+    Returns:
+        Сгенерированный ответ в формате JSON
+    """
+    result = await _acached(
+        "rag_generate", query, lambda: _arag_generate_call(query, top_k, temperature, use_hyde),
+        top_k=top_k, temperature=temperature, use_hyde=use_hyde,
+    )
+    return json.dumps(result, ensure_ascii=False)
 
 
 def generate_exam(markdown_content: str, config: Dict[str, Any] = None) -> str:
@@ -124,6 +294,7 @@ def generate_exam(markdown_content: str, config: Dict[str, Any] = None) -> str:
     Returns:
         Сгенерированный экзамен в формате JSON
     """
+    settings = get_settings()
     test_generator_service_url = settings.test_generator_service_url
     if not test_generator_service_url:
         log.warning("Test generator service not configured")
@@ -143,6 +314,37 @@ def generate_exam(markdown_content: str, config: Dict[str, Any] = None) -> str:
         return json.dumps({"error": str(e)}, ensure_ascii=False)
 
 
+async def agenerate_exam(markdown_content: str, config: Dict[str, Any] = None) -> str:
+    """
+    Асинхронный аналог `generate_exam`.
+
+    Args:
+        markdown_content: Содержимое Markdown для генерации вопросов
+        config: Конфигурация для генерации экзамена
+
+    Returns:
+        Сгенерированный экзамен в формате JSON
+    """
+    settings = get_settings()
+    test_generator_service_url = settings.test_generator_service_url
+    if not test_generator_service_url:
+        log.warning("Test generator service not configured")
+        return json.dumps({"error": "Test generator service not configured"})
+
+    try:
+        payload = {
+            "markdown_content": markdown_content,
+            "config": config
+        }
+        log.info(f"Calling test generator service at {test_generator_service_url}/api/generate with payload: {payload}")
+
+        result = await _apost_json(f"{test_generator_service_url}/api/generate", payload, settings.http_timeout_s)
+        return json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        log.error(f"Test generator service call failed: {e}")
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+
 def grade_exam(exam_id: str, answers: List[Dict[str, Any]]) -> str:
     """
     Оценивает ответы на экзамен через сервис test_generator.
@@ -154,6 +356,7 @@ def grade_exam(exam_id: str, answers: List[Dict[str, Any]]) -> str:
     Returns:
         Результаты оценки в формате JSON
     """
+    settings = get_settings()
     test_generator_service_url = settings.test_generator_service_url
     if not test_generator_service_url:
         log.warning("Test generator service not configured")
@@ -173,6 +376,37 @@ def grade_exam(exam_id: str, answers: List[Dict[str, Any]]) -> str:
         return json.dumps({"error": str(e)}, ensure_ascii=False)
 
 
+async def agrade_exam(exam_id: str, answers: List[Dict[str, Any]]) -> str:
+    """
+    Асинхронный аналог `grade_exam`.
+
+    Args:
+        exam_id: Идентификатор экзамена
+        answers: Список ответов студента
+
+    Returns:
+        Результаты оценки в формате JSON
+    """
+    settings = get_settings()
+    test_generator_service_url = settings.test_generator_service_url
+    if not test_generator_service_url:
+        log.warning("Test generator service not configured")
+        return json.dumps({"error": "Test generator service not configured"})
+
+    try:
+        payload = {
+            "exam_id": exam_id,
+            "answers": answers
+        }
+        log.info(f"Calling test generator grade service at {test_generator_service_url}/api/grade with payload: {payload}")
+
+        result = await _apost_json(f"{test_generator_service_url}/api/grade", payload, settings.http_timeout_s)
+        return json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        log.error(f"Test generator grade service call failed: {e}")
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+
 def make_tools() -> List[Tool]:
     """
     Создает список инструментов LangChain для использования в агентах.
@@ -181,22 +415,26 @@ def make_tools() -> List[Tool]:
     tools = [
         Tool(
             name="rag_search",
-            func=rag_search,
+            func=rag_search_json,
+            coroutine=arag_search_json,
             description="Searches for relevant documents using the RAG service. Input should be a query string and optional parameters top_k and use_hyde. Returns search results as JSON."
         ),
         Tool(
             name="rag_generate",
             func=rag_generate,
+            coroutine=arag_generate,
             description="Generates an answer to a question using the RAG service. Input should be a query string and optional parameters top_k, temperature, and use_hyde. Returns generated answer as JSON."
         ),
         Tool(
             name="generate_exam",
             func=generate_exam,
+            coroutine=agenerate_exam,
             description="Generates an exam from Markdown content using the test generator service. Input should be markdown_content and optional config. Returns generated exam as JSON."
         ),
         Tool(
             name="grade_exam",
             func=grade_exam,
+            coroutine=agrade_exam,
             description="Grades student answers against exam answer keys using the test generator service. Input should be exam_id and answers. Returns grading results as JSON."
         ),
     ]
@@ -0,0 +1,191 @@
+"""
+Circuit breaker провайдеров LLM.
+
+На провайдера — автомат closed → open → half-open:
+- closed: вызовы идут; `failure_threshold` ошибок (или всплесков задержки) подряд — open;
+- open: вызовы к провайдеру не делаются `open_s` секунд (быстрый отказ / failover);
+- half-open: пропускается одна пробная попытка; успех — closed, ошибка — снова open.
+
+Дополнительно ведётся EWMA задержки успешных вызовов — для выбора самого быстрого
+здорового провайдера.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Вес нового замера в EWMA задержки
+_EWMA_ALPHA = 0.2
+
+
+class CircuitBreaker:
+    """Автомат состояния одного провайдера."""
+
+    def __init__(self, name: str, failure_threshold: int, open_s: float, latency_threshold_s: Optional[float]) -> None:
+        """
+        Args:
+            name: Имя провайдера (для метрик и логов).
+            failure_threshold: Ошибок подряд до размыкания.
+            open_s: Время в состоянии open до пробной попытки.
+            latency_threshold_s: Задержка успешного вызова, считающаяся отказом (None — не учитывать).
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_s = open_s
+        self.latency_threshold_s = latency_threshold_s
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._latency_ewma: Optional[float] = None
+        self._stats = {"successes": 0, "failures": 0, "slow_calls": 0, "opened": 0, "rejected": 0}
+
+    def configure(self, failure_threshold: int, open_s: float, latency_threshold_s: Optional[float]) -> None:
+        """Обновляет параметры (настройки могут перечитываться на лету)."""
+        with self._lock:
+            self.failure_threshold = failure_threshold
+            self.open_s = open_s
+            self.latency_threshold_s = latency_threshold_s
+
+    # ---------- состояние ----------
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_s:
+            self._state = HALF_OPEN
+            self._probe_started = None
+        return self._state
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._probe_started = None
+        self._stats["opened"] += 1
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    @property
+    def latency_ewma_s(self) -> Optional[float]:
+        return self._latency_ewma
+
+    def available(self) -> bool:
+        """Можно ли сейчас обратиться к провайдеру (без занятия пробной попытки)."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                # Зависшая проба (исход не записан) освобождается через open_s
+                return self._probe_started is None or now - self._probe_started >= self.open_s
+            return False
+
+    def allow(self) -> bool:
+        """
+        Разрешение на вызов. В half-open занимает единственную пробную попытку.
+
+        Returns:
+            bool: True — вызывать; False — провайдер недоступен (быстрый отказ).
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and (self._probe_started is None or now - self._probe_started >= self.open_s):
+                self._probe_started = now
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    # ---------- исходы ----------
+    def record_success(self, latency_s: float) -> None:
+        """
+        Успешный вызов. Задержка выше `latency_threshold_s` считается отказом
+        (ответ при этом используется).
+        """
+        with self._lock:
+            self._latency_ewma = (
+                latency_s if self._latency_ewma is None
+                else _EWMA_ALPHA * latency_s + (1 - _EWMA_ALPHA) * self._latency_ewma
+            )
+            if self.latency_threshold_s is not None and latency_s > self.latency_threshold_s:
+                self._stats["slow_calls"] += 1
+                self._on_failure(time.monotonic())
+                return
+            self._stats["successes"] += 1
+            self._failures = 0
+            if self._state != CLOSED:
+                self._state = CLOSED
+                self._probe_started = None
+
+    def record_failure(self) -> None:
+        """Неудачный вызов (после исчерпания ретраев)."""
+        with self._lock:
+            self._stats["failures"] += 1
+            self._on_failure(time.monotonic())
+
+    def record_skipped(self) -> None:
+        """
+        Вызов завершился не по вине провайдера (не дождался лимита частоты, ошибка запроса
+        или локальная ошибка): счётчики не меняются, занятая проба half-open освобождается.
+        """
+        with self._lock:
+            self._probe_started = None
+
+    def _on_failure(self, now: float) -> None:
+        self._failures += 1
+        if self._current_state(now) == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open(now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._failures,
+                "latency_ewma_s": self._latency_ewma,
+                **self._stats,
+            }
+
+
+class BreakerRegistry:
+    """Общие для процесса автоматы по провайдерам."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, provider: str, cfg) -> CircuitBreaker:
+        """
+        Автомат провайдера с параметрами из настроек.
+
+        Args:
+            provider: Имя провайдера.
+            cfg: LLMSettings (breaker_failure_threshold, breaker_open_s, breaker_latency_threshold_s).
+
+        Returns:
+            CircuitBreaker: Автомат провайдера.
+        """
+        params = (cfg.breaker_failure_threshold, cfg.breaker_open_s, cfg.breaker_latency_threshold_s)
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = self._breakers[provider] = CircuitBreaker(provider, *params)
+                return breaker
+        breaker.configure(*params)
+        return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.name: b.stats() for b in breakers}
+
+
+# Автоматы процесса: общие для всех экземпляров LLMClient
+breakers = BreakerRegistry()
@@ -0,0 +1,237 @@
+"""
+Хеджирование запросов к LLM (снижение хвостовой задержки).
+
+Если вызов не вернулся за перцентиль недавних задержек (p95 по умолчанию),
+запускается дубликат — к тому же или к запасному провайдеру, — и берётся
+первый успешный ответ. Число дубликатов ограничено бюджетом в минуту.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+# Размер окна задержек на ключ provider:model
+_WINDOW = 200
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных вызовов по ключу."""
+
+    def __init__(self, window: int = _WINDOW) -> None:
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, key: str, latency_s: float) -> None:
+        with self._lock:
+            self._samples[key].append(latency_s)
+
+    def percentile(self, key: str, q: float, min_samples: int) -> Optional[float]:
+        """
+        Перцентиль задержки (nearest-rank).
+
+        Returns:
+            Optional[float]: Значение в секундах или None, если замеров меньше min_samples.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        rank = min(len(samples), max(1, math.ceil(q * len(samples))))
+        return samples[rank - 1]
+
+
+class HedgeBudget:
+    """Не больше `per_minute` дубликатов за скользящую минуту."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._spent: Deque[float] = deque()
+
+    def try_spend(self, per_minute: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._spent and now - self._spent[0] >= 60.0:
+                self._spent.popleft()
+            if len(self._spent) >= per_minute:
+                return False
+            self._spent.append(now)
+            return True
+
+
+class _Timer:
+    """Один поток на процесс: выполняет отложенные действия (запуск дубликата) в срок."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay: float, action: Callable[[], None]) -> list:
+        """Планирует action через delay секунд; возвращает метку для `cancel`."""
+        entry = [time.monotonic() + delay, next(self._seq), action]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="llm-hedge-timer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry: list) -> None:
+        """Отменяет действие (запись остаётся в куче и пропускается при наступлении срока)."""
+        entry[2] = None
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                action = heapq.heappop(self._heap)[2]
+            if action is not None:
+                action()
+
+
+class Hedger:
+    """
+    Запуск вызова с дубликатом после задержки. Sync-вариант выполняет основной вызов
+    в потоке вызывающего, а в пул отдаёт только дубликат; async-вариант отменяет
+    проигравшую задачу.
+    """
+
+    def __init__(self, max_workers: int = 16) -> None:
+        """
+        Args:
+            max_workers: Потоков для дубликатов sync-вызовов (основные вызовы пул не занимают).
+        """
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self._timer = _Timer()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def delay_for(self, key: str, cfg) -> Optional[float]:
+        """
+        Через сколько секунд запускать дубликат (None — замеров мало, не хеджировать).
+
+        Args:
+            key: Ключ provider:model основного вызова.
+            cfg: LLMSettings (hedge_percentile, hedge_min_samples, hedge_min_delay_s).
+        """
+        p = self.latency.percentile(key, cfg.hedge_percentile, cfg.hedge_min_samples)
+        return None if p is None else max(cfg.hedge_min_delay_s, p)
+
+    def _spend(self, cfg) -> bool:
+        if self.budget.try_spend(cfg.hedge_budget_per_minute):
+            self._count("hedged")
+            return True
+        self._count("budget_exhausted")
+        return False
+
+    def run(self, primary: Callable[[], Any], backup: Callable[[], Any], delay: float, cfg) -> Any:
+        """
+        Выполняет primary в текущем потоке; если он не завершился за delay и бюджет позволяет,
+        backup запускается в пуле.
+
+        Поток вызывающего занят основным вызовом, поэтому ответ дубликата используется,
+        когда основной вызов завершился ошибкой (например, таймаутом): дубликат к этому
+        моменту уже в пути. Успешный основной ответ берётся всегда; ещё не начавшийся
+        дубликат тогда не выполняется (не занимает лимит частоты), а начавшийся
+        дорабатывает в фоне и сверяет свой резерв ограничителя по фактическому расходу.
+
+        Returns:
+            Ответ основного вызова или, при его ошибке, дубликата.
+
+        Raises:
+            Exception: Ошибка, если оба вызова неуспешны (или primary без дубликата).
+        """
+        self._count("calls")
+        lock = threading.Lock()
+        state: Dict[str, Any] = {"done": False, "ok": False, "backup": None}
+
+        def _backup() -> Any:
+            with lock:
+                if state["done"] and state["ok"]:
+                    return None  # основной уже ответил — дубликат не нужен
+            return backup()
+
+        def _start_backup() -> None:
+            with lock:
+                if state["done"] or not self._spend(cfg):
+                    return
+                state["backup"] = self._pool.submit(_backup)
+
+        timer = self._timer.schedule(delay, _start_backup)
+        try:
+            result = primary()
+        except Exception as e:
+            error: Optional[Exception] = e
+        else:
+            error = None
+        finally:
+            self._timer.cancel(timer)
+        with lock:
+            state["done"] = True
+            state["ok"] = error is None
+            second: Optional[Future] = state["backup"]
+
+        if error is None:
+            if second is not None:
+                second.cancel()
+            return result
+        if second is None:
+            raise error
+        value = second.result()
+        self._count("hedge_wins")
+        return value
+
+    async def arun(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        backup: Callable[[], Awaitable[Any]],
+        delay: float,
+        cfg,
+    ) -> Any:
+        """Асинхронный аналог `run`: проигравшая задача отменяется."""
+        self._count("calls")
+        first = asyncio.create_task(primary())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not self._spend(cfg):
+            return await first
+
+        second = asyncio.create_task(backup())
+        pending = {first, second}
+        last_exc: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is second:
+                            self._count("hedge_wins")
+                        return t.result()
+                    last_exc = t.exception()
+            raise last_exc
+        finally:
+            for t in pending:
+                t.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+
+# Хеджер процесса: общие окна задержек и бюджет для всех экземпляров LLMClient
+hedger = Hedger()
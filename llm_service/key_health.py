@@ -0,0 +1,224 @@
+"""
+Кэш состояния API-ключей провайдеров.
+
+Хранит результат проверки ключа с TTL, кэширует отказы авторизации
+(401/403) на отдельный, более короткий TTL и обновляется пассивно
+по исходам реальных вызовов, чтобы не делать «ping» перед каждым запросом.
+При промахе кэша одновременные запросы с тем же ключом ждут одну проверку.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from llm_service.utils import unwrap_http_exc
+
+AUTH_FAILURE_STATUSES = (401, 403)
+
+
+def key_fingerprint(api_key: str) -> str:
+    """
+    Короткий отпечаток ключа для ключей кэша (сам ключ не хранится).
+
+    Args:
+        api_key: Ключ API.
+
+    Returns:
+        str: Первые 16 символов sha256-хэша ключа.
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def is_auth_failure(exc: Exception) -> bool:
+    """
+    Проверяет, что исключение — отказ авторизации (HTTP 401/403).
+
+    Args:
+        exc: Исключение из вызова провайдера.
+
+    Returns:
+        bool: True, если статус ответа 401 или 403.
+    """
+    _, status, _, _, _ = unwrap_http_exc(exc)
+    return status in AUTH_FAILURE_STATUSES
+
+
+@dataclass
+class KeyHealth:
+    """Закэшированное состояние ключа."""
+
+    ok: bool
+    reason: str
+    checked_at: float
+    expires_at: float
+
+
+class KeyHealthCache:
+    """
+    Потокобезопасный кэш состояния ключей по (провайдер, отпечаток ключа).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._items: Dict[Tuple[str, str], KeyHealth] = {}
+        # Идущие проверки ключей: потоки и корутины (по event loop) отдельно
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._ainflight: Dict[Tuple[int, str, str], asyncio.Future] = {}
+
+    def _lookup(self, k: Tuple[str, str]) -> Optional[KeyHealth]:
+        """Актуальная запись (под self._lock); истёкшая удаляется."""
+        item = self._items.get(k)
+        if item is None:
+            return None
+        if item.expires_at <= time.monotonic():
+            del self._items[k]
+            return None
+        return item
+
+    def get(self, provider: str, api_key: str) -> Optional[KeyHealth]:
+        """
+        Возвращает актуальное состояние ключа или None (нет записи / истёк TTL).
+
+        Args:
+            provider: Имя провайдера.
+            api_key: Ключ API.
+
+        Returns:
+            Optional[KeyHealth]: Состояние ключа.
+        """
+        k = (provider, key_fingerprint(api_key))
+        with self._lock:
+            return self._lookup(k)
+
+    def check(self, provider: str, api_key: str, validate: Callable[[], Tuple[bool, str]]) -> Tuple[bool, str]:
+        """
+        Состояние ключа из кэша; при промахе — одна проверка `validate` на все одновременные
+        запросы с этим ключом (остальные ждут её результат вместо своего пинга).
+
+        Args:
+            provider: Имя провайдера.
+            api_key: Ключ API.
+            validate: Живая проверка ключа (сама записывает результат в кэш).
+
+        Returns:
+            (ok, reason) — флаг успеха и причина.
+        """
+        k = (provider, key_fingerprint(api_key))
+        with self._lock:
+            item = self._lookup(k)
+            if item is not None:
+                return item.ok, item.reason
+            leader = self._inflight.get(k)
+            own = leader is None
+            if own:
+                leader = self._inflight[k] = Future()
+        if not own:
+            return leader.result()
+
+        try:
+            result = validate()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(k, None)
+            leader.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(k, None)
+        leader.set_result(result)
+        return result
+
+    async def acheck(
+        self, provider: str, api_key: str, avalidate: Callable[[], Awaitable[Tuple[bool, str]]]
+    ) -> Tuple[bool, str]:
+        """Асинхронный аналог `check`: ожидающие не блокируют event loop."""
+        loop = asyncio.get_running_loop()
+        k = (provider, key_fingerprint(api_key))
+        slot = (id(loop), *k)
+        while True:
+            with self._lock:
+                item = self._lookup(k)
+                if item is not None:
+                    return item.ok, item.reason
+                leader = self._ainflight.get(slot)
+                if leader is None:
+                    leader = self._ainflight[slot] = loop.create_future()
+                    break
+            try:
+                # shield: отмена ожидающего не должна отменять общую проверку
+                return await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise
+                # отменена сама проверка (ушёл запрос, который её начал) — проверяем заново
+
+        try:
+            result = await avalidate()
+        except BaseException as e:
+            with self._lock:
+                self._ainflight.pop(slot, None)
+            if isinstance(e, asyncio.CancelledError):
+                leader.cancel()
+            else:
+                leader.set_exception(e)
+                leader.exception()  # помечаем извлечённым: ожидающих может не быть
+            raise
+        with self._lock:
+            self._ainflight.pop(slot, None)
+        leader.set_result(result)
+        return result
+
+    def _put(self, provider: str, api_key: str, ok: bool, reason: str, ttl_s: float) -> None:
+        """Сохраняет состояние ключа на ttl_s секунд (ttl_s <= 0 — не кэшировать)."""
+        k = (provider, key_fingerprint(api_key))
+        with self._lock:
+            if ttl_s <= 0:
+                self._items.pop(k, None)
+                return
+            now = time.monotonic()
+            self._items[k] = KeyHealth(ok=ok, reason=reason, checked_at=now, expires_at=now + ttl_s)
+
+    def mark_ok(self, provider: str, api_key: str, ttl_s: float, reason: str = "live_ok") -> None:
+        """
+        Помечает ключ рабочим (после пинга или успешного реального вызова).
+
+        Args:
+            provider: Имя провайдера.
+            api_key: Ключ API.
+            ttl_s: Время жизни записи в секундах.
+            reason: Причина для логов.
+        """
+        self._put(provider, api_key, True, reason, ttl_s)
+
+    def mark_failed(self, provider: str, api_key: str, ttl_s: float, reason: str) -> None:
+        """
+        Помечает ключ нерабочим (негативное кэширование отказа авторизации).
+
+        Args:
+            provider: Имя провайдера.
+            api_key: Ключ API.
+            ttl_s: Время жизни негативной записи в секундах.
+            reason: Причина отказа.
+        """
+        self._put(provider, api_key, False, reason, ttl_s)
+
+    def invalidate(self, provider: Optional[str] = None) -> None:
+        """
+        Сбрасывает кэш целиком или только для одного провайдера.
+
+        Args:
+            provider: Имя провайдера (None — все провайдеры).
+        """
+        with self._lock:
+            if provider is None:
+                self._items.clear()
+                return
+            for k in [k for k in self._items if k[0] == provider]:
+                del self._items[k]
+
+
+# Общий кэш процесса: все экземпляры LLMClient видят одно состояние ключей.
+key_health_cache = KeyHealthCache()
@@ -2,16 +2,27 @@
 Модуль подключения к апи моделей
 """
 
+import asyncio
+import threading
 import time
-from typing import Any, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
 
 from httpx import ConnectError, HTTPStatusError, TimeoutException
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_mistralai import ChatMistralAI, MistralAIEmbeddings
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 from logger import get_logger
 from settings import get_settings
+from llm_service.circuit_breaker import CircuitBreaker, breakers
+from llm_service.hedging import hedger
+from llm_service.key_health import is_auth_failure, key_fingerprint, key_health_cache
+from llm_service.prompt_cache import prompt_tokens, supports_cache_control, system_content
+from llm_service.rate_limit import RateLimiter, RateLimitTimeout, estimate_tokens, rate_limiters, usage_tokens
+from llm_service.retry import RetryPolicy
+from llm_service.structured import StructuredOutput, structured_kwargs, structured_text
 from llm_service.utils import (
     build_httpx_timeout,
     extract_request_id_from_exc,
@@ -20,6 +31,55 @@ from llm_service.utils import (
     unwrap_http_exc,
 )
 
+if TYPE_CHECKING:
+    import numpy as np
+
+# Параметры генерации, которые передаются при вызове модели, а не при её создании:
+# экземпляр клиента (и его пул соединений) от них не зависит и переиспользуется.
+INVOKE_PARAMS = frozenset(
+    {
+        "temperature", "max_tokens", "top_p", "stop", "presence_penalty", "frequency_penalty", "seed",
+        "tools", "tool_choice", "response_format",
+    }
+)
+
+
+class _InstanceCache:
+    """
+    Потокобезопасный LRU-кэш экземпляров чат/эмбеддинг-клиентов на время жизни процесса.
+    """
+
+    def __init__(self, maxsize: int = 32) -> None:
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Возвращает экземпляр по ключу, создавая его через factory при промахе."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            obj = factory()
+            self._items[key] = obj
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+            return obj
+
+    def clear(self) -> None:
+        """Сбрасывает кэш (новые вызовы создадут клиенты заново)."""
+        with self._lock:
+            self._items.clear()
+
+
+def _freeze_kwargs(kwargs: dict) -> Tuple[Tuple[str, str], ...]:
+    """Делает kwargs пригодными для ключа кэша."""
+    return tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+
+
+# Общий кэш процесса: клиенты и их TCP-соединения к провайдерам переиспользуются
+model_cache = _InstanceCache()
+
 
 class LLMClient:
     """
@@ -33,11 +93,19 @@ class LLMClient:
             system_prompt: Системный промпт для использования в генерации.
         """
         self.provider = (provider or "").lower().strip()
-        self.cfg = get_settings()
         self.log = get_logger(__name__)
         self.system_prompt = system_prompt
+        # Размер чанка эмбеддингов, уменьшенный после ошибок 413/too many tokens (None — не ограничен)
+        self._emb_batch_limit: Optional[int] = None
+        # Клиенты запасных провайдеров цепочки failover (создаются лениво)
+        self._peers: Dict[str, "LLMClient"] = {}
         self.log.info("Инициализация LLM-клиента: провайдер=%s", self.provider)
 
+    @property
+    def cfg(self):
+        """Текущие настройки (кэш get_settings(), учитывает горячую перезагрузку)."""
+        return get_settings()
+
     # ------------------------- ключ -------------------------
 
     def _resolve_api_key(self, method_api_key: Optional[str] = None) -> Optional[str]:
@@ -55,17 +123,133 @@ class LLMClient:
             self.log.debug("Ключ API получен из аргумента метода")
             return method_api_key
 
-        p = self.provider
-        if p == "openai" and self.cfg.openai_api_key:
-            return self.cfg.openai_api_key.get_secret_value()
-        if p == "openrouter" and self.cfg.openrouter_api_key:
-            return self.cfg.openrouter_api_key.get_secret_value()
-        if p == "mistral" and self.cfg.mistral_api_key:
-            return self.cfg.mistral_api_key.get_secret_value()
+        key = self._settings_key(self.provider)
+        if key:
+            return key
 
         self.log.warning("Ключ API отсутствует для провайдера=%s", self.provider)
         return None
 
+    def _settings_key(self, provider: str) -> Optional[str]:
+        """Ключ провайдера из настроек (None, если не задан)."""
+        secret = {
+            "openai": self.cfg.openai_api_key,
+            "openrouter": self.cfg.openrouter_api_key,
+            "mistral": self.cfg.mistral_api_key,
+        }.get(provider)
+        return secret.get_secret_value() if secret else None
+
+    def _check_api_key(self, api_key: Optional[str] = None) -> Tuple[bool, str]:
+        """
+        Проверяет ключ через кэш состояния; живой пинг — только при промахе кэша,
+        один на все одновременные вызовы с этим ключом (например, элементы батча).
+
+        Args:
+            api_key: Явный ключ API (иначе из настроек).
+
+        Returns:
+            (ok, reason) — флаг успеха и причина.
+        """
+        key = self._resolve_api_key(api_key)
+        if not key:
+            return False, "missing"
+        return key_health_cache.check(self.provider, key, lambda: self.validate_api_key(api_key=api_key))
+
+    async def _acheck_api_key(self, api_key: Optional[str] = None) -> Tuple[bool, str]:
+        """Асинхронный аналог `_check_api_key`."""
+        key = self._resolve_api_key(api_key)
+        if not key:
+            return False, "missing"
+        return await key_health_cache.acheck(self.provider, key, lambda: self.avalidate_api_key(api_key=api_key))
+
+    def _observe_call(self, api_key: Optional[str], exc: Optional[Exception] = None) -> None:
+        """
+        Пассивно обновляет кэш состояния ключа по исходу реального вызова.
+
+        Args:
+            api_key: Явный ключ API (иначе из настроек).
+            exc: Исключение вызова (None — успех).
+        """
+        key = self._resolve_api_key(api_key)
+        if not key:
+            return
+        if exc is None:
+            key_health_cache.mark_ok(self.provider, key, self.cfg.key_health_ttl_s, reason="call_ok")
+        elif is_auth_failure(exc):
+            self.log.warning("Ключ отклонён провайдером=%s: %s", self.provider, repr(exc))
+            key_health_cache.mark_failed(
+                self.provider, key, self.cfg.key_health_negative_ttl_s, reason=f"auth_error:{type(exc).__name__}"
+            )
+
+    def _max_concurrency(self) -> int:
+        """Лимит параллельных запросов батча для провайдера (override по провайдеру или общий)."""
+        limit = self.cfg.llm_max_concurrency_by_provider.get(self.provider, self.cfg.llm_max_concurrency)
+        return max(1, int(limit))
+
+    # -------------------- ограничение частоты --------------------
+
+    def _rate_limiter(self, model: str) -> RateLimiter:
+        """Общий ограничитель RPM/TPM ключа provider:model (лимиты rate_limit_rpm / rate_limit_tpm)."""
+        return rate_limiters.get(self.provider, model, self.cfg.rate_limit_rpm, self.cfg.rate_limit_tpm)
+
+    def _rate_limit_wait_s(self) -> float:
+        """Максимальное ожидание очереди ограничителя."""
+        return self.cfg.rate_limit_max_wait_s or self.cfg.request_timeout_s
+
+    def _estimate_chat_tokens(self, text: str, kwargs: dict) -> int:
+        """Оценка токенов вызова чата: промпт + ожидаемый ответ (max_tokens или настройка)."""
+        completion = kwargs.get("max_tokens") or self.cfg.rate_limit_completion_tokens
+        return estimate_tokens((self.system_prompt or "") + (text or "")) + int(completion)
+
+    @staticmethod
+    def _on_limited_error(limiter: RateLimiter, exc: Exception) -> None:
+        """429 от провайдера несмотря на лимит — приостанавливаем очередь ключа."""
+        _, status, retry_after, _, _ = unwrap_http_exc(exc)
+        if status == 429:
+            limiter.throttle(retry_after)
+
+    def _limited(
+        self, limiter: RateLimiter, tokens: int, fn: Callable[[], Any], timing: Optional[List[float]] = None
+    ) -> Any:
+        """
+        Выполняет одну попытку вызова после получения места в очереди ограничителя.
+
+        Args:
+            timing: Список, куда дописывается длительность успешного вызова провайдера
+                (без ожидания очереди) — для автомата и статистики задержек.
+        """
+        reservation = limiter.acquire(tokens, timeout=self._rate_limit_wait_s())
+        t0 = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            self._on_limited_error(limiter, e)
+            raise
+        if timing is not None:
+            timing.append(time.perf_counter() - t0)
+        reservation.settle(usage_tokens(result))
+        return result
+
+    async def _alimited(
+        self,
+        limiter: RateLimiter,
+        tokens: int,
+        afn: Callable[[], Awaitable[Any]],
+        timing: Optional[List[float]] = None,
+    ) -> Any:
+        """Асинхронный аналог `_limited`."""
+        reservation = await limiter.aacquire(tokens, timeout=self._rate_limit_wait_s())
+        t0 = time.perf_counter()
+        try:
+            result = await afn()
+        except Exception as e:
+            self._on_limited_error(limiter, e)
+            raise
+        if timing is not None:
+            timing.append(time.perf_counter() - t0)
+        reservation.settle(usage_tokens(result))
+        return result
+
     # -------------------- универсальный ретрай --------------------
 
     def _is_retriable_exc(self, exc: Exception) -> Tuple[bool, Optional[int]]:
@@ -92,13 +276,112 @@ class LLMClient:
 
         return False, None
 
-    def _call_with_retry(self, op_name: str, fn: callable) -> Any:
+    def _is_provider_failure(self, exc: Exception) -> bool:
         """
-        Выполняет вызов с фиксированными ретраями.
+        Отказ провайдера, учитываемый автоматом: транспорт, таймаут, 429/5xx и ошибки SDK без ответа.
+        Ожидание лимита частоты, ответы 4xx (запрос или ключ) и локальные ошибки
+        (валидация параметров, разбор ответа) о здоровье провайдера не говорят.
 
         Args:
-            op_name: Имя операции для логов.
+            exc: Исключение вызова (после ретраев).
+
+        Returns:
+            bool: True — записать отказ в автомат провайдера.
+        """
+        if isinstance(exc, RateLimitTimeout):
+            return False
+        retriable, _ = self._is_retriable_exc(exc)
+        if retriable:
+            return True
+        _, status, _, _, _ = unwrap_http_exc(exc)
+        if status is not None:
+            return False
+        return not isinstance(exc, (ValueError, TypeError))
+
+    def _record_failure(self, breaker: CircuitBreaker, exc: Exception) -> None:
+        """Записывает исход неудачного вызова в автомат: отказ провайдера или пропуск (см. `_is_provider_failure`)."""
+        if self._is_provider_failure(exc):
+            breaker.record_failure()
+        else:
+            breaker.record_skipped()
+
+    def _log_attempt_ok(self, op_name: str, result: Any, t0: float) -> None:
+        """Логирует успешную попытку (время и usage, если модель их вернула)."""
+        dt = (time.perf_counter() - t0) * 1000
+        usage = None
+        try:
+            rm = getattr(result, "response_metadata", None)
+            if isinstance(rm, dict):
+                usage = rm.get("token_usage") or rm.get("usage")
+        except Exception:
+            pass
+
+        if usage:
+            self.log.debug("%s: ok за %.1f мс, usage=%s", op_name, dt, usage)
+        else:
+            self.log.debug("%s: ok за %.1f мс", op_name, dt)
+
+    def _log_attempt_error(
+        self, op_name: str, attempt: int, e: Exception, t0: float
+    ) -> Tuple[Exception, bool, Optional[int], Optional[int]]:
+        """
+        Логирует неудачную попытку.
+
+        Returns:
+            (exc, retriable, status, retry_after) — развёрнутое исключение, признак ретрая,
+            HTTP-статус и Retry-After в секундах (если сервер их прислал).
+        """
+        dt = (time.perf_counter() - t0) * 1000
+        exc, status, retry_after, req_id, body = unwrap_http_exc(e)
+        retriable, retriable_status = self._is_retriable_exc(exc)
+
+        self.log.warning(
+            "%s: ошибка на попытке %d: %.1f мс, status=%s, retriable=%s, "
+            "retry_after=%s, request_id=%s, body=%s, exc=%s",
+            op_name,
+            attempt,
+            dt,
+            status,
+            retriable,
+            retry_after,
+            req_id or extract_request_id_from_exc(exc),
+            truncate(body),
+            repr(exc),
+        )
+        return exc, retriable, status or retriable_status, retry_after
+
+    def _retry_policy(self, op_name: str) -> RetryPolicy:
+        """Политика ретраев операции (override по операции — retry_max_retries_by_op)."""
+        return RetryPolicy.from_settings(self.cfg, op_name)
+
+    def _retry_delay(
+        self, policy: RetryPolicy, op_name: str, attempt: int, e: Exception, t0: float, started: float
+    ) -> Tuple[Exception, Optional[float]]:
+        """
+        Обрабатывает ошибку попытки: логирует и решает, нужен ли повтор.
+
+        Returns:
+            (exc, delay) — развёрнутое исключение и пауза перед повтором (None — не повторять).
+        """
+        exc, retriable, status, retry_after = self._log_attempt_error(op_name, attempt, e, t0)
+        if not retriable:
+            return exc, None
+        delay = policy.next_delay(attempt, time.monotonic() - started, retry_after, status)
+        if delay is None:
+            self.log.warning("%s: ретраи исчерпаны (попытка %d, бюджет %ss)", op_name, attempt, policy.deadline_s)
+        else:
+            self.log.info("%s: повтор через %.2f с", op_name, delay)
+        return exc, delay
+
+    def _call_with_retry(self, op_name: str, fn: callable, policy: Optional[RetryPolicy] = None) -> Any:
+        """
+        Выполняет вызов с ретраями по политике операции (экспонента с jitter, Retry-After,
+        общий бюджет времени).
+
+        Args:
+            op_name: Имя операции для логов и выбора политики.
             fn: Нулераговая функция, которую нужно выполнить (без аргументов).
+            policy: Явная политика (иначе — по имени операции из настроек).
 
         Returns:
             Результат вызова fn().
@@ -107,56 +390,61 @@ class LLMClient:
             Exception: Последняя ошибка, если все попытки исчерпаны.
         """
         self.log.info("start:%s", op_name)
+        policy = policy or self._retry_policy(op_name)
+        started = time.monotonic()
         last_exc: Optional[Exception] = None
-        max_tries = 5
-        sleep_seconds = 3.0
 
-        for attempt in range(1, max_tries + 1):
+        for attempt in range(1, policy.max_attempts + 1):
             t0 = time.perf_counter()
-            self.log.debug("%s: попытка %d/%d", op_name, attempt, max_tries)
+            self.log.debug("%s: попытка %d/%d", op_name, attempt, policy.max_attempts)
             try:
                 result = fn()
-                dt = (time.perf_counter() - t0) * 1000
-                # usage (если модель возвращает метаданные)
-                usage = None
-                try:
-                    rm = getattr(result, "response_metadata", None)
-                    if isinstance(rm, dict):
-                        usage = rm.get("token_usage") or rm.get("usage")
-                except Exception:
-                    pass
-
-                if usage:
-                    self.log.debug("%s: ok за %.1f мс, usage=%s", op_name, dt, usage)
-                else:
-                    self.log.debug("%s: ok за %.1f мс", op_name, dt)
+                self._log_attempt_ok(op_name, result, t0)
                 return result
 
             except Exception as e:
-                dt = (time.perf_counter() - t0) * 1000
-                exc, status, retry_after, req_id, body = unwrap_http_exc(e)
-                retriable, _ = self._is_retriable_exc(exc)
-
-                self.log.warning(
-                    "%s: ошибка на попытке %d: %.1f мс, status=%s, retriable=%s, "
-                    "retry_after=%s, request_id=%s, body=%s, exc=%s",
-                    op_name,
-                    attempt,
-                    dt,
-                    status,
-                    retriable,
-                    retry_after,
-                    req_id or extract_request_id_from_exc(exc),
-                    truncate(body),
-                    repr(exc),
-                )
-                last_exc = exc
-
-                if not retriable or attempt == max_tries:
+                last_exc, delay = self._retry_delay(policy, op_name, attempt, e, t0, started)
+                if delay is None:
                     break
+                time.sleep(delay)
+
+        raise last_exc if last_exc else RuntimeError(f"{op_name} failed")
+
+    async def _acall_with_retry(
+        self, op_name: str, afn: Callable[[], Awaitable[Any]], policy: Optional[RetryPolicy] = None
+    ) -> Any:
+        """
+        Асинхронный аналог `_call_with_retry`: пауза между попытками не блокирует event loop.
+
+        Args:
+            op_name: Имя операции для логов и выбора политики.
+            afn: Нулераговая корутинная функция.
+            policy: Явная политика (иначе — по имени операции из настроек).
+
+        Returns:
+            Результат `await afn()`.
+
+        Raises:
+            Exception: Последняя ошибка, если все попытки исчерпаны.
+        """
+        self.log.info("start:%s", op_name)
+        policy = policy or self._retry_policy(op_name)
+        started = time.monotonic()
+        last_exc: Optional[Exception] = None
+
+        for attempt in range(1, policy.max_attempts + 1):
+            t0 = time.perf_counter()
+            self.log.debug("%s: попытка %d/%d", op_name, attempt, policy.max_attempts)
+            try:
+                result = await afn()
+                self._log_attempt_ok(op_name, result, t0)
+                return result
 
-                self.log.info("%s: повтор через %.0f с", op_name, sleep_seconds)
-                time.sleep(sleep_seconds)
+            except Exception as e:
+                last_exc, delay = self._retry_delay(policy, op_name, attempt, e, t0, started)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
 
         raise last_exc if last_exc else RuntimeError(f"{op_name} failed")
 
@@ -286,8 +574,70 @@ class LLMClient:
 
         raise ValueError(f"Неподдерживаемый провайдер: {p}")
 
+    def _instance_key(self, kind: str, model: str, api_key: Optional[str], kwargs: dict) -> tuple:
+        """Ключ кэша экземпляров: провайдер, модель, хэш ключа, таймауты и параметры конструктора."""
+        key = self._resolve_api_key(api_key)
+        return (
+            kind,
+            self.provider,
+            model,
+            key_fingerprint(key) if key else "",
+            self.cfg.connect_timeout_s,
+            self.cfg.request_timeout_s,
+            self.cfg.openrouter_base_url if self.provider == "openrouter" else "",
+            _freeze_kwargs(kwargs),
+        )
+
+    def _get_chat(self, model: Optional[str] = None, api_key: Optional[str] = None, **kwargs: Any):
+        """
+        Возвращает переиспользуемый чат-клиент; параметры генерации
+        (temperature и т.п.) привязываются к вызову через `bind`, а не к экземпляру.
+
+        Args:
+            model: Имя модели (если None — из настроек).
+            api_key: Ключ API (если None — из настроек).
+            **kwargs: Параметры генерации и конструктора.
+
+        Returns:
+            Чат-модель или RunnableBinding с параметрами вызова.
+        """
+        invoke_kwargs = {k: v for k, v in kwargs.items() if k in INVOKE_PARAMS}
+        ctor_kwargs = {k: v for k, v in kwargs.items() if k not in INVOKE_PARAMS}
+        m = self._chat_model_for_provider(self.provider, model)
+        chat = model_cache.get_or_create(
+            self._instance_key("chat", m, api_key, ctor_kwargs),
+            lambda: self.create_chat(model=m, api_key=api_key, **ctor_kwargs),
+        )
+        return chat.bind(**invoke_kwargs) if invoke_kwargs else chat
+
+    def _get_embeddings(self, model: Optional[str] = None, api_key: Optional[str] = None, **kwargs: Any):
+        """Возвращает переиспользуемый клиент эмбеддингов."""
+        m = self._emb_model_for_provider(self.provider, model)
+        return model_cache.get_or_create(
+            self._instance_key("embeddings", m, api_key, kwargs),
+            lambda: self.create_embeddings(model=m, api_key=api_key, **kwargs),
+        )
+
     # ------------------------- публичные операции -------------------------
 
+    def _on_validation_result(self, key: str, out: Any, t0: float) -> Tuple[bool, str]:
+        """Разбирает ответ пинга и обновляет кэш состояния ключа."""
+        dt = (time.perf_counter() - t0) * 1000
+        ok = bool(getattr(out, "content", None))
+        self.log.info("validate_api_key: провайдер=%s, ок=%s, время=%.1f мс", self.provider, ok, dt)
+        if ok:
+            key_health_cache.mark_ok(self.provider, key, self.cfg.key_health_ttl_s)
+            return True, "live_ok"
+        return False, "live_failed_empty_response"
+
+    def _on_validation_error(self, key: str, e: Exception) -> Tuple[bool, str]:
+        """Логирует ошибку пинга; отказ авторизации кэшируется негативно."""
+        self.log.error("validate_api_key: ошибка %s", repr(e))
+        reason = f"live_error:{type(e).__name__}:{e}"
+        if is_auth_failure(e):
+            key_health_cache.mark_failed(self.provider, key, self.cfg.key_health_negative_ttl_s, reason=reason)
+        return False, reason
+
     def validate_api_key(self, api_key: Optional[str] = None) -> Tuple[bool, str]:
         """
         Делает минимальный вызов к чату и проверяет, что ключ «живой».
@@ -303,9 +653,8 @@ class LLMClient:
         if not key:
             return False, "missing"
 
-        p = self.provider
-        model = self._chat_model_for_provider(p, None)
-        chat = self.create_chat(model=model, api_key=api_key, temperature=0.0)
+        model = self._chat_model_for_provider(self.provider, None)
+        chat = self._get_chat(model=model, api_key=api_key, temperature=0.0)
 
         t0 = time.perf_counter()
         try:
@@ -313,28 +662,301 @@ class LLMClient:
                 return chat.invoke([HumanMessage(content="ping")])
 
             out = self._call_with_retry("validate_api_key", _fn)
-            dt = (time.perf_counter() - t0) * 1000
-            ok = bool(getattr(out, "content", None))
-            self.log.info("validate_api_key: провайдер=%s, ок=%s, время=%.1f мс", p, ok, dt)
-            return (True, "live_ok") if ok else (False, "live_failed_empty_response")
+            return self._on_validation_result(key, out, t0)
         except Exception as e:
-            self.log.error("validate_api_key: ошибка %s", repr(e))
-            return False, f"live_error:{type(e).__name__}:{e}"
+            return self._on_validation_error(key, e)
+
+    async def avalidate_api_key(self, api_key: Optional[str] = None) -> Tuple[bool, str]:
+        """Асинхронный аналог `validate_api_key`."""
+        self.log.info("start:avalidate_api_key провайдер=%s", self.provider)
+        key = self._resolve_api_key(api_key)
+        if not key:
+            return False, "missing"
+
+        model = self._chat_model_for_provider(self.provider, None)
+        chat = self._get_chat(model=model, api_key=api_key, temperature=0.0)
+
+        t0 = time.perf_counter()
+        try:
+            async def _afn():
+                return await chat.ainvoke([HumanMessage(content="ping")])
+
+            out = await self._acall_with_retry("validate_api_key", _afn)
+            return self._on_validation_result(key, out, t0)
+        except Exception as e:
+            return self._on_validation_error(key, e)
+
+    def _build_messages(self, text: str, model: Optional[str] = None) -> List[BaseMessage]:
+        """
+        Собирает сообщения для чата: системный промпт (если задан) + запрос.
+
+        Префикс одинаков у всех вызовов (системный промпт всегда первым, без подстановок),
+        поэтому провайдер может взять его из кэша; моделям, которым нужна явная пометка,
+        системный промпт отправляется блоком с cache_control (см. prompt_cache.py).
+        """
+        messages: List[BaseMessage] = [HumanMessage(content=text)]
+        if self.system_prompt:
+            cache_control = supports_cache_control(
+                self.provider, self._chat_model_for_provider(self.provider, model), self.cfg
+            )
+            messages.insert(0, SystemMessage(content=system_content(self.system_prompt, cache_control)))
+        return messages
+
+    # ------------------------- failover -------------------------
+
+    def _breaker(self) -> CircuitBreaker:
+        """Circuit breaker провайдера клиента (общий для процесса)."""
+        return breakers.get(self.provider, self.cfg)
+
+    def _emb_breaker(self) -> CircuitBreaker:
+        """
+        Circuit breaker эмбеддингов провайдера: отдельный от чата, чтобы сбои
+        эндпоинта эмбеддингов не выключали генерацию (и наоборот).
+        """
+        return breakers.get(f"{self.provider}:embeddings", self.cfg)
+
+    def _peer(self, provider: str) -> "LLMClient":
+        """Клиент того же назначения для другого провайдера цепочки."""
+        if provider == self.provider:
+            return self
+        peer = self._peers.get(provider)
+        if peer is None:
+            peer = self._peers[provider] = LLMClient(provider=provider, system_prompt=self.system_prompt)
+        return peer
+
+    def _chat_chain(self, api_key: Optional[str] = None) -> List["LLMClient"]:
+        """
+        Цепочка провайдеров для чата: свой провайдер, затем `llm_fallback_providers`
+        (только с ключом в настройках). Провайдеры с разомкнутым автоматом пропускаются;
+        при `llm_latency_aware_routing` здоровые упорядочиваются по EWMA задержки.
+        """
+        names = [self.provider] + [p for p in self.cfg.llm_fallback_providers if p != self.provider]
+        chain = [
+            self._peer(p) for p in dict.fromkeys(names)
+            if (p == self.provider and api_key) or self._settings_key(p)
+        ]
+        chain = [peer for peer in chain if peer._breaker().available()]
+        if self.cfg.llm_latency_aware_routing:
+            # Стабильная сортировка: без замеров — порядок из настроек
+            chain.sort(key=lambda peer: peer._breaker().latency_ewma_s or float("inf"))
+        return chain
+
+    # ------------------------- хеджирование -------------------------
+
+    def _latency_key(self, model: Optional[str]) -> str:
+        """Ключ окна задержек: provider:model."""
+        return f"{self.provider}:{self._chat_model_for_provider(self.provider, model)}"
+
+    def _hedge_plan(
+        self, peer: "LLMClient", model: Optional[str], hedge_node: Optional[str]
+    ) -> Optional[Tuple[float, "LLMClient"]]:
+        """
+        Нужно ли хеджировать вызов узла графа и как.
+
+        Returns:
+            (delay_s, backup) — задержка до дубликата и клиент для него; None — без хеджа
+            (узел не в hedge_nodes, хедж выключен или замеров задержки ещё мало).
+        """
+        cfg = self.cfg
+        if not (hedge_node and cfg.hedge_enabled and hedge_node in cfg.hedge_nodes):
+            return None
+        delay = hedger.delay_for(peer._latency_key(model), cfg)
+        if delay is None:
+            return None
+        backup = peer
+        if cfg.hedge_provider and cfg.hedge_provider != peer.provider and self._settings_key(cfg.hedge_provider):
+            candidate = self._peer(cfg.hedge_provider)
+            if candidate._breaker().available():
+                backup = candidate
+        return delay, backup
+
+    def _call_policy(self, is_last: bool) -> RetryPolicy:
+        """Политика ретраев вызова чата: если впереди есть запасной провайдер — короче."""
+        policy = self._retry_policy("generate")
+        if is_last:
+            return policy
+        return policy.with_attempts(min(policy.max_attempts, self.cfg.llm_failover_max_retries + 1))
+
+    def _chat_kwargs(self, kwargs: dict) -> Tuple[dict, Optional[StructuredOutput]]:
+        """Параметры вызова провайдера: `structured_output` переводится в его tools/response_format."""
+        spec = kwargs.get("structured_output")
+        chat_kwargs = {k: v for k, v in kwargs.items() if k != "structured_output"}
+        if spec is not None:
+            chat_kwargs.update(structured_kwargs(self.provider, spec))
+        return chat_kwargs, spec
+
+    def _invoke_chat(
+        self, text: str, model: Optional[str], api_key: Optional[str], kwargs: dict, policy: RetryPolicy
+    ) -> str:
+        """
+        Один ответ от провайдера клиента (с ретраями и лимитом частоты).
+
+        Raises:
+            Exception: Ошибка провайдера после исчерпания ретраев.
+        """
+        chat_kwargs, spec = self._chat_kwargs(kwargs)
+        chat = self._get_chat(model=model, api_key=api_key, **chat_kwargs)
+        limiter = self._rate_limiter(self._chat_model_for_provider(self.provider, model))
+        tokens = self._estimate_chat_tokens(text, kwargs)
+
+        timing: List[float] = []
+
+        def _fn():
+            return self._limited(limiter, tokens, lambda: chat.invoke(self._build_messages(text, model)), timing)
+
+        try:
+            out = self._call_with_retry("generate", _fn, policy)
+        except Exception as e:
+            self._observe_call(api_key, e)
+            self._record_failure(self._breaker(), e)
+            raise
+        dt = timing[-1]  # только успешный вызов провайдера: без ожидания ограничителя и пауз ретраев
+        self._observe_call(api_key)
+        self._breaker().record_success(dt)
+        hedger.latency.observe(self._latency_key(model), dt)
+        prompt_tokens.record(self._latency_key(model), out)
+        return structured_text(out, spec) if spec else getattr(out, "content", "") or ""
+
+    async def _ainvoke_chat(
+        self, text: str, model: Optional[str], api_key: Optional[str], kwargs: dict, policy: RetryPolicy
+    ) -> str:
+        """Асинхронный аналог `_invoke_chat`."""
+        chat_kwargs, spec = self._chat_kwargs(kwargs)
+        chat = self._get_chat(model=model, api_key=api_key, **chat_kwargs)
+        limiter = self._rate_limiter(self._chat_model_for_provider(self.provider, model))
+        tokens = self._estimate_chat_tokens(text, kwargs)
+
+        timing: List[float] = []
+
+        async def _afn():
+            return await self._alimited(
+                limiter, tokens, lambda: chat.ainvoke(self._build_messages(text, model)), timing
+            )
+
+        try:
+            out = await self._acall_with_retry("generate", _afn, policy)
+        except Exception as e:
+            self._observe_call(api_key, e)
+            self._record_failure(self._breaker(), e)
+            raise
+        dt = timing[-1]
+        self._observe_call(api_key)
+        self._breaker().record_success(dt)
+        hedger.latency.observe(self._latency_key(model), dt)
+        prompt_tokens.record(self._latency_key(model), out)
+        return structured_text(out, spec) if spec else getattr(out, "content", "") or ""
+
+    def _generate_one(
+        self,
+        chain: List["LLMClient"],
+        idx: int,
+        text: str,
+        model: Optional[str],
+        api_key: Optional[str],
+        kwargs: dict,
+        hedge_node: Optional[str] = None,
+    ) -> str:
+        """
+        Ответ на один промпт с переходом по цепочке провайдеров (и хеджем, если он
+        включён для узла); при отказе всех — "".
+        """
+        for pos, peer in enumerate(chain):
+            own = peer is self
+            key = api_key if own else None
+            ok, reason = peer._check_api_key(api_key=key)
+            if not ok:
+                self.log.warning("generate: провайдер %s пропущен из-за ключа (%s)", peer.provider, reason)
+                continue
+            if not peer._breaker().allow():
+                continue
+            peer_model = model if own else None
+            policy = self._call_policy(pos == len(chain) - 1)
+            plan = self._hedge_plan(peer, peer_model, hedge_node)
+            try:
+                if plan is None:
+                    return peer._invoke_chat(text, peer_model, key, kwargs, policy)
+                delay, backup = plan
+                same = backup is peer
+                return hedger.run(
+                    lambda: peer._invoke_chat(text, peer_model, key, kwargs, policy),
+                    lambda: backup._invoke_chat(
+                        text, peer_model if same else None, key if same else None, kwargs, policy.with_attempts(1)
+                    ),
+                    delay,
+                    self.cfg,
+                )
+            except Exception as e:
+                self.log.error("generate: item %d провайдер=%s ошибка %s", idx, peer.provider, repr(e))
+        self.log.error("generate: item %d — нет доступных провайдеров", idx)
+        return ""
+
+    async def _agenerate_one(
+        self,
+        chain: List["LLMClient"],
+        idx: int,
+        text: str,
+        model: Optional[str],
+        api_key: Optional[str],
+        kwargs: dict,
+        hedge_node: Optional[str] = None,
+    ) -> str:
+        """Асинхронный аналог `_generate_one`."""
+        for pos, peer in enumerate(chain):
+            own = peer is self
+            key = api_key if own else None
+            ok, reason = await peer._acheck_api_key(api_key=key)
+            if not ok:
+                self.log.warning("agenerate: провайдер %s пропущен из-за ключа (%s)", peer.provider, reason)
+                continue
+            if not peer._breaker().allow():
+                continue
+            peer_model = model if own else None
+            policy = self._call_policy(pos == len(chain) - 1)
+            plan = self._hedge_plan(peer, peer_model, hedge_node)
+            try:
+                if plan is None:
+                    return await peer._ainvoke_chat(text, peer_model, key, kwargs, policy)
+                delay, backup = plan
+                same = backup is peer
+                return await hedger.arun(
+                    lambda: peer._ainvoke_chat(text, peer_model, key, kwargs, policy),
+                    lambda: backup._ainvoke_chat(
+                        text, peer_model if same else None, key if same else None, kwargs, policy.with_attempts(1)
+                    ),
+                    delay,
+                    self.cfg,
+                )
+            except Exception as e:
+                self.log.error("agenerate: item %d провайдер=%s ошибка %s", idx, peer.provider, repr(e))
+        self.log.error("agenerate: item %d — нет доступных провайдеров", idx)
+        return ""
+
+    # ------------------------- генерация -------------------------
 
     def generate(
         self,
         texts: Sequence[str],
         model: Optional[str] = None,
         api_key: Optional[str] = None,
+        hedge_node: Optional[str] = None,
+        structured_output: Optional[StructuredOutput] = None,
         **kwargs: Any,
     ) -> List[str]:
         """
         Батч-генерация ответов: список промптов → список текстов.
+        Элементы батча выполняются параллельно в пуле потоков (не больше `_max_concurrency()`).
+        При отказе провайдера (или разомкнутом автомате) элемент уходит к следующему
+        провайдеру цепочки `llm_fallback_providers`; `model` и `api_key` относятся
+        только к основному провайдеру.
 
         Args:
             texts: Список входных сообщений.
             model: Имя модели (если None — из настроек).
             api_key: Ключ API (если None — из настроек).
+            hedge_node: Узел графа, от имени которого идёт вызов; если он в `hedge_nodes`
+                        и `hedge_enabled` — медленный вызов дублируется (см. hedging.py).
+            structured_output: Схема ответа (см. structured.py): ответ — JSON аргументов
+                        вызова функции (openai/openrouter) или JSON mode (mistral).
             **kwargs: Доп. параметры клиента (например, temperature).
 
         Returns:
@@ -344,83 +966,369 @@ class LLMClient:
         if not texts:
             return []
 
-        ok, reason = self.validate_api_key(api_key=api_key)
-        if not ok:
-            self.log.warning("generate: пропущено из-за ключа (%s)", reason)
+        chain = self._chat_chain(api_key)
+        if not chain:
+            self.log.warning("generate: нет доступных провайдеров (ключи/автоматы)")
             return ["" for _ in texts]
+        if structured_output is not None:
+            # каждый провайдер цепочки переводит схему в свои параметры (_chat_kwargs)
+            kwargs = {**kwargs, "structured_output": structured_output}
+        total = len(texts)
 
-        chat = self.create_chat(model=model, api_key=api_key, **kwargs)
-        results: List[str] = []
+        def _one(idx: int, t: str) -> str:
+            self.log.debug("generate: item %d/%d, prompt_len=%d", idx, total, len(t or ""))
+            return self._generate_one(chain, idx, t, model, api_key, kwargs, hedge_node)
 
-        for idx, t in enumerate(texts, 1):
-            self.log.debug("generate: item %d/%d, prompt_len=%d", idx, len(texts), len(t or ""))
+        workers = min(self._max_concurrency(), total)
+        if workers <= 1:
+            results = [_one(idx, t) for idx, t in enumerate(texts, 1)]
+        else:
+            # executor.map сохраняет порядок ответов; ошибки изолированы внутри _one
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-generate") as pool:
+                results = list(pool.map(_one, range(1, total + 1), texts))
 
-            def _fn():
-                messages = [HumanMessage(content=t)]
-                if self.system_prompt:
-                    messages.insert(0, SystemMessage(content=self.system_prompt))
-                return chat.invoke(messages)
+        self.log.info("generate: завершено провайдер=%s", self.provider)
+        return results
 
-            try:
-                out = self._call_with_retry("generate", _fn)
-                results.append(getattr(out, "content", "") or "")
-            except Exception as e:
-                self.log.error("generate: item %d ошибка %s", idx, repr(e))
-                results.append("")
+    async def agenerate(
+        self,
+        texts: Sequence[str],
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        hedge_node: Optional[str] = None,
+        structured_output: Optional[StructuredOutput] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """
+        Асинхронная батч-генерация через async-клиент провайдера (`ainvoke`).
+        Элементы батча выполняются конкурентно (`asyncio.gather` под семафором `_max_concurrency()`),
+        с тем же переходом по цепочке провайдеров, что и `generate`.
 
-        self.log.info("generate: завершено провайдер=%s", self.provider)
+        Args:
+            texts: Список входных сообщений.
+            model: Имя модели (если None — из настроек).
+            api_key: Ключ API (если None — из настроек).
+            hedge_node: Узел графа, от имени которого идёт вызов; если он в `hedge_nodes`
+                        и `hedge_enabled` — медленный вызов дублируется (см. hedging.py).
+            structured_output: Схема ответа (см. structured.py): ответ — JSON аргументов
+                        вызова функции (openai/openrouter) или JSON mode (mistral).
+            **kwargs: Доп. параметры клиента (например, temperature).
+
+        Returns:
+            Список строк той же длины, что `texts`. При ошибках — пустые строки.
+        """
+        self.log.info("start:agenerate провайдер=%s, N=%d", self.provider, len(texts or []))
+        if not texts:
+            return []
+
+        chain = self._chat_chain(api_key)
+        if not chain:
+            self.log.warning("agenerate: нет доступных провайдеров (ключи/автоматы)")
+            return ["" for _ in texts]
+        if structured_output is not None:
+            kwargs = {**kwargs, "structured_output": structured_output}
+        total = len(texts)
+        sem = asyncio.Semaphore(self._max_concurrency())
+
+        async def _one(idx: int, t: str) -> str:
+            async with sem:
+                self.log.debug("agenerate: item %d/%d, prompt_len=%d", idx, total, len(t or ""))
+                return await self._agenerate_one(chain, idx, t, model, api_key, kwargs, hedge_node)
+
+        results = list(await asyncio.gather(*(_one(idx, t) for idx, t in enumerate(texts, 1))))
+
+        self.log.info("agenerate: завершено провайдер=%s", self.provider)
         return results
 
+    async def astream_generate(
+        self,
+        text: str,
+        on_token: Callable[[str], None],
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        **kwargs: Any,
+    ) -> str:
+        """
+        Потоковая генерация одного ответа через streaming API чат-модели (`astream`)
+        первого доступного провайдера цепочки.
+
+        Args:
+            text: Входное сообщение.
+            on_token: Колбэк, вызываемый на каждый полученный фрагмент текста.
+            model: Имя модели (если None — из настроек).
+            api_key: Ключ API (если None — из настроек).
+            **kwargs: Доп. параметры клиента (например, temperature).
+
+        Returns:
+            Полный текст ответа. Если поток оборвался до первого фрагмента — ответ
+            берётся из `agenerate` (с ретраями и failover) и отдаётся в on_token целиком; при ошибке — "".
+        """
+        self.log.info("start:astream_generate провайдер=%s, prompt_len=%d", self.provider, len(text or ""))
+        peer = None
+        for candidate in self._chat_chain(api_key):
+            ok, _ = await candidate._acheck_api_key(api_key=api_key if candidate is self else None)
+            if ok and candidate._breaker().allow():
+                peer = candidate
+                break
+        if peer is None:
+            self.log.warning("astream_generate: нет доступных провайдеров (ключи/автоматы)")
+            return ""
+
+        own = peer is self
+        key = api_key if own else None
+        chat = peer._get_chat(model=model if own else None, api_key=key, **kwargs)
+        limiter = peer._rate_limiter(peer._chat_model_for_provider(peer.provider, model if own else None))
+        try:
+            reservation = await limiter.aacquire(
+                self._estimate_chat_tokens(text, kwargs), timeout=self._rate_limit_wait_s()
+            )
+        except RateLimitTimeout as e:
+            self.log.error("astream_generate: %s", e)
+            return ""
+        prompt_estimate = estimate_tokens((self.system_prompt or "") + (text or ""))
+        parts: List[str] = []
+        usage: Optional[int] = None
+        usage_chunk: Any = None
+        t0 = time.perf_counter()
+        try:
+            async for chunk in chat.astream(peer._build_messages(text, model if own else None)):
+                # расход приходит в последнем фрагменте, если провайдер его отдаёт
+                if chunk_usage := usage_tokens(chunk):
+                    usage, usage_chunk = chunk_usage, chunk
+                piece = getattr(chunk, "content", "") or ""
+                if piece:
+                    parts.append(piece)
+                    on_token(piece)
+            peer._observe_call(key)
+            peer._breaker().record_success(time.perf_counter() - t0)
+        except Exception as e:
+            self._on_limited_error(limiter, e)
+            peer._observe_call(key, e)
+            self._record_failure(peer._breaker(), e)
+            if parts:
+                reservation.settle(usage or prompt_estimate + estimate_tokens("".join(parts)))
+                self.log.error("astream_generate: поток оборван после %d фрагментов: %s", len(parts), repr(e))
+                return "".join(parts)
+            # ответа не было: токены возвращаем ограничителю (запрос остаётся учтённым), agenerate займёт своё место
+            reservation.settle(0)
+            self.log.warning(
+                "astream_generate: поток провайдера %s не начался (%s), fallback на agenerate", peer.provider, repr(e)
+            )
+            answer = (await self.agenerate([text], model=model, api_key=api_key, **kwargs))[0]
+            if answer:
+                on_token(answer)
+            return answer
+
+        answer = "".join(parts)
+        reservation.settle(usage or prompt_estimate + estimate_tokens(answer))
+        if usage_chunk is not None:
+            prompt_tokens.record(peer._latency_key(model if own else None), usage_chunk)
+        dt = (time.perf_counter() - t0) * 1000
+        self.log.info("astream_generate: завершено провайдер=%s, фрагментов=%d, %.1f мс", peer.provider, len(parts), dt)
+        return answer
+
+    # ------------------------- эмбеддинги -------------------------
+
+    @staticmethod
+    def _is_payload_too_large(exc: Exception) -> bool:
+        """Признак «слишком большой запрос»: HTTP 413 или сообщение о превышении лимита токенов."""
+        _, status, _, _, body = unwrap_http_exc(exc)
+        if status == 413:
+            return True
+        text = f"{body} {exc}".lower()
+        return any(m in text for m in ("too many tokens", "maximum context length", "too large", "max_tokens_per_request"))
+
+    def _emb_chunk_size(self) -> int:
+        """Текущий размер чанка: emb_batch_size, уменьшенный после ошибок 413/too many tokens."""
+        size = self.cfg.emb_batch_size
+        if self._emb_batch_limit:
+            size = min(size, self._emb_batch_limit)
+        return max(1, size)
+
+    def _shrink_emb_chunk(self, failed_size: int) -> int:
+        """Запоминает уменьшенный размер чанка для последующих вызовов и возвращает его."""
+        new_size = max(1, failed_size // 2)
+        self._emb_batch_limit = min(self._emb_batch_limit or new_size, new_size)
+        self.log.warning("embed: чанк %d слишком большой, уменьшаем до %d", failed_size, new_size)
+        return new_size
+
+    @staticmethod
+    def _to_matrix(vectors: List[List[float]]) -> "np.ndarray":
+        """
+        Собирает векторы в непрерывную матрицу numpy float32.
+        Строки неудавшихся элементов заполняются NaN.
+        """
+        import numpy as np
+
+        dim = next((len(v) for v in vectors if v), 0)
+        matrix = np.full((len(vectors), dim), np.nan, dtype=np.float32)
+        for i, v in enumerate(vectors):
+            if v:
+                matrix[i] = v
+        return matrix
+
+    def _embed_chunk(self, emb: Any, chunk: List[str], start: int, api_key: Optional[str]) -> List[List[float]]:
+        """Эмбеддит один чанк; при 413/too many tokens делит его пополам и повторяет."""
+        end = start + len(chunk)
+        self.log.debug("embed: chunk %d..%d", start, end)
+
+        timing: List[float] = []
+
+        def _fn():
+            limiter = self._rate_limiter(getattr(emb, "model", "") or "embeddings")
+            return self._limited(
+                limiter, sum(estimate_tokens(t) for t in chunk), lambda: emb.embed_documents(chunk), timing
+            )
+
+        try:
+            part = self._call_with_retry("embed", _fn)
+            self._observe_call(api_key)
+            self._emb_breaker().record_success(timing[-1])
+            return part
+        except Exception as e:
+            if len(chunk) > 1 and self._is_payload_too_large(e):
+                half = self._shrink_emb_chunk(len(chunk))
+                return [
+                    v
+                    for i in range(0, len(chunk), half)
+                    for v in self._embed_chunk(emb, chunk[i:i + half], start + i, api_key)
+                ]
+            self._observe_call(api_key, e)
+            self._record_failure(self._emb_breaker(), e)
+            self.log.error("embed: chunk %d..%d ошибка %s", start, end, repr(e))
+            return [[] for _ in chunk]
+
+    async def _aembed_chunk(self, emb: Any, chunk: List[str], start: int, api_key: Optional[str]) -> List[List[float]]:
+        """Асинхронный аналог `_embed_chunk`."""
+        end = start + len(chunk)
+        self.log.debug("aembed: chunk %d..%d", start, end)
+
+        timing: List[float] = []
+
+        async def _afn():
+            limiter = self._rate_limiter(getattr(emb, "model", "") or "embeddings")
+            return await self._alimited(
+                limiter, sum(estimate_tokens(t) for t in chunk), lambda: emb.aembed_documents(chunk), timing
+            )
+
+        try:
+            part = await self._acall_with_retry("embed", _afn)
+            self._observe_call(api_key)
+            self._emb_breaker().record_success(timing[-1])
+            return part
+        except Exception as e:
+            if len(chunk) > 1 and self._is_payload_too_large(e):
+                half = self._shrink_emb_chunk(len(chunk))
+                vectors: List[List[float]] = []
+                for i in range(0, len(chunk), half):
+                    vectors.extend(await self._aembed_chunk(emb, chunk[i:i + half], start + i, api_key))
+                return vectors
+            self._observe_call(api_key, e)
+            self._record_failure(self._emb_breaker(), e)
+            self.log.error("aembed: chunk %d..%d ошибка %s", start, end, repr(e))
+            return [[] for _ in chunk]
+
     def embed(
         self,
         texts: Sequence[str],
         model: Optional[str] = None,
         api_key: Optional[str] = None,
+        as_numpy: bool = False,
         **kwargs: Any,
-    ) -> List[List[float]]:
+    ) -> "List[List[float]] | np.ndarray":
         """
         Батч-эмбеддинг: список строк → матрица эмбеддингов.
+        Чанки по `emb_batch_size` отправляются параллельно (не больше `emb_max_in_flight`),
+        результат собирается в исходном порядке.
 
         Args:
             texts: Список строк.
             model: Имя модели эмбеддингов (если None — из настроек).
             api_key: Ключ API (если None — из настроек).
+            as_numpy: Вернуть непрерывную матрицу numpy float32 вместо List[List[float]].
             **kwargs: Доп. параметры клиента эмбеддингов.
 
         Returns:
-            Список векторов; при ошибке в чанке — пустые векторы на его месте.
+            Список векторов; при ошибке в чанке — пустые векторы на его месте
+            (в режиме as_numpy — строки из NaN). Эмбеддинги не переключаются на другой
+            провайдер (векторы разных моделей несовместимы): при разомкнутом автомате — быстрый отказ.
         """
         self.log.info("start:embed провайдер=%s, N=%d", self.provider, len(texts or []))
         if not texts:
-            return []
+            return self._to_matrix([]) if as_numpy else []
 
-        ok, reason = self.validate_api_key(api_key=api_key)
+        ok, reason = self._check_api_key(api_key=api_key)
+        if ok and not self._emb_breaker().allow():
+            ok, reason = False, "circuit_open"
         if not ok:
-            self.log.warning("embed: пропущено из-за ключа (%s)", reason)
-            return [[] for _ in texts]
+            self.log.warning("embed: пропущено (%s)", reason)
+            vectors = [[] for _ in texts]
+            return self._to_matrix(vectors) if as_numpy else vectors
+
+        emb = self._get_embeddings(model=model, api_key=api_key, **kwargs)
+        batch = self._emb_chunk_size()
+        starts = list(range(0, len(texts), batch))
+        chunks = [list(texts[start:start + batch]) for start in starts]
+
+        workers = min(max(1, self.cfg.emb_max_in_flight), len(chunks))
+        if workers <= 1:
+            parts = [self._embed_chunk(emb, chunk, start, api_key) for start, chunk in zip(starts, chunks)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-embed") as pool:
+                parts = list(pool.map(lambda sc: self._embed_chunk(emb, sc[1], sc[0], api_key), zip(starts, chunks)))
+
+        vectors = [v for part in parts for v in part]
+        self.log.info("embed: завершено провайдер=%s", self.provider)
+        return self._to_matrix(vectors) if as_numpy else vectors
 
-        emb = self.create_embeddings(model=model, api_key=api_key, **kwargs)
-        batch = self.cfg.emb_batch_size
-        total = len(texts)
-        vectors: List[List[float]] = []
+    async def aembed(
+        self,
+        texts: Sequence[str],
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        as_numpy: bool = False,
+        **kwargs: Any,
+    ) -> "List[List[float]] | np.ndarray":
+        """
+        Асинхронный батч-эмбеддинг через `aembed_documents`; чанки отправляются
+        конкурентно (не больше `emb_max_in_flight` одновременно).
 
-        for start in range(0, total, batch):
-            end = min(start + batch, total)
-            chunk = list(texts[start:end])
-            self.log.debug("embed: chunk %d..%d", start, end)
+        Args:
+            texts: Список строк.
+            model: Имя модели эмбеддингов (если None — из настроек).
+            api_key: Ключ API (если None — из настроек).
+            as_numpy: Вернуть непрерывную матрицу numpy float32 вместо List[List[float]].
+            **kwargs: Доп. параметры клиента эмбеддингов.
 
-            def _fn():
-                return emb.embed_documents(chunk)
+        Returns:
+            Список векторов; при ошибке в чанке — пустые векторы на его месте
+            (в режиме as_numpy — строки из NaN).
+        """
+        self.log.info("start:aembed провайдер=%s, N=%d", self.provider, len(texts or []))
+        if not texts:
+            return self._to_matrix([]) if as_numpy else []
 
-            try:
-                part = self._call_with_retry("embed", _fn)
-                vectors.extend(part)
-            except Exception as e:
-                self.log.error("embed: chunk %d..%d ошибка %s", start, end, repr(e))
-                vectors.extend([[] for _ in chunk])
+        ok, reason = await self._acheck_api_key(api_key=api_key)
+        if ok and not self._emb_breaker().allow():
+            ok, reason = False, "circuit_open"
+        if not ok:
+            self.log.warning("aembed: пропущено (%s)", reason)
+            vectors = [[] for _ in texts]
+            return self._to_matrix(vectors) if as_numpy else vectors
 
-        self.log.info("embed: завершено провайдер=%s", self.provider)
-        return vectors
+        emb = self._get_embeddings(model=model, api_key=api_key, **kwargs)
+        batch = self._emb_chunk_size()
+        sem = asyncio.Semaphore(max(1, self.cfg.emb_max_in_flight))
+
+        async def _one(start: int) -> List[List[float]]:
+            async with sem:
+                return await self._aembed_chunk(emb, list(texts[start:start + batch]), start, api_key)
+
+        parts = await asyncio.gather(*(_one(start) for start in range(0, len(texts), batch)))
+
+        vectors = [v for part in parts for v in part]
+        self.log.info("aembed: завершено провайдер=%s", self.provider)
+        return self._to_matrix(vectors) if as_numpy else vectors
 
 
 if __name__ == "__main__":
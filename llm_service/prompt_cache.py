@@ -0,0 +1,91 @@
+"""
+Кэширование префикса промпта на стороне провайдера.
+
+OpenAI и часть моделей OpenRouter кэшируют одинаковое начало запроса автоматически,
+поэтому сообщения строятся со стабильным префиксом: системный промпт, затем контекст,
+затем вопрос. Моделям, которым нужна явная пометка (Anthropic, Gemini через OpenRouter),
+системный промпт отправляется блоком с `cache_control`. По `response_metadata`
+считается, сколько входных токенов пришло из кэша.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Блок, помеченный для кэша провайдера (формат OpenRouter / Anthropic)
+_EPHEMERAL = {"type": "ephemeral"}
+
+
+def supports_cache_control(provider: str, model: str, cfg) -> bool:
+    """
+    Нужна ли явная пометка cache_control для модели.
+
+    Args:
+        provider: Имя провайдера.
+        model: Имя чат-модели.
+        cfg: LLMSettings (prompt_cache_control, prompt_cache_control_models).
+
+    Returns:
+        bool: True — только OpenRouter и модели с префиксом из `prompt_cache_control_models`.
+    """
+    if not cfg.prompt_cache_control or provider != "openrouter":
+        return False
+    return any(model.startswith(prefix) for prefix in cfg.prompt_cache_control_models)
+
+
+def system_content(text: str, cache_control: bool) -> Union[str, List[Dict[str, Any]]]:
+    """Содержимое системного сообщения: строка или текстовый блок с пометкой cache_control."""
+    if not cache_control:
+        return text
+    return [{"type": "text", "text": text, "cache_control": dict(_EPHEMERAL)}]
+
+
+def prompt_token_usage(result: Any) -> Tuple[Optional[int], int]:
+    """
+    Входные токены ответа и сколько из них пришло из кэша провайдера.
+
+    Args:
+        result: Ответ чат-модели (AIMessage).
+
+    Returns:
+        (prompt_tokens | None, cached_tokens) — None, если провайдер не вернул usage.
+    """
+    rm = getattr(result, "response_metadata", None)
+    usage = (rm.get("token_usage") or rm.get("usage")) if isinstance(rm, dict) else None
+    if not isinstance(usage, dict) or usage.get("prompt_tokens") is None:
+        return None, 0
+    details = usage.get("prompt_tokens_details") or {}
+    cached = details.get("cached_tokens") if isinstance(details, dict) else None
+    if cached is None:
+        cached = usage.get("cache_read_input_tokens")
+    return int(usage["prompt_tokens"]), int(cached or 0)
+
+
+class PromptTokenStats:
+    """Счётчики входных токенов (из кэша провайдера и без него) по ключу provider:model."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, key: str, result: Any) -> None:
+        prompt, cached = prompt_token_usage(result)
+        if prompt is None:
+            return
+        with self._lock:
+            s = self._stats.setdefault(key, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            s["calls"] += 1
+            s["prompt_tokens"] += prompt
+            s["cached_tokens"] += min(cached, prompt)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """По ключу: вызовы, входные токены, из кэша, без кэша и доля кэша."""
+        with self._lock:
+            items = {k: dict(v) for k, v in self._stats.items()}
+        for s in items.values():
+            s["uncached_tokens"] = s["prompt_tokens"] - s["cached_tokens"]
+            s["cached_ratio"] = s["cached_tokens"] / s["prompt_tokens"] if s["prompt_tokens"] else 0.0
+        return items
+
+
+# Счётчики процесса: общие для всех экземпляров LLMClient
+prompt_tokens = PromptTokenStats()
@@ -0,0 +1,279 @@
+"""
+Клиентский ограничитель частоты запросов к провайдерам.
+
+На ключ `provider:model` — два token bucket: запросы в минуту (RPM) и токены
+в минуту (TPM). Вызовы встают в FIFO-очередь и ждут своей очереди вместо того,
+чтобы получать 429 и сжигать ретраи. Один и тот же ограничитель обслуживает
+и потоки (`acquire`), и корутины (`aacquire`).
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+# Шаг опроса очереди в async-режиме (ожидающие не у головы очереди)
+_POLL_S = 0.05
+
+
+class RateLimitTimeout(RuntimeError):
+    """Вызов не дождался своей очереди за отведённое время."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов текста (≈ 4 символа на токен)."""
+    return max(1, len(text or "") // 4)
+
+
+def usage_tokens(result: Any) -> Optional[int]:
+    """
+    Фактический расход токенов из `response_metadata` ответа модели.
+
+    Args:
+        result: Ответ чат-модели (AIMessage).
+
+    Returns:
+        Optional[int]: total_tokens, если провайдер его вернул.
+    """
+    rm = getattr(result, "response_metadata", None)
+    if not isinstance(rm, dict):
+        return None
+    usage = rm.get("token_usage") or rm.get("usage") or {}
+    total = usage.get("total_tokens") if isinstance(usage, dict) else None
+    return int(total) if total is not None else None
+
+
+class _Bucket:
+    """Token bucket: ёмкость `per_minute`, равномерное пополнение за минуту."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Сколько ждать, чтобы в ведре набралось amount (не больше ёмкости)."""
+        need = min(amount, self.capacity) - self.level
+        return 0.0 if need <= 0 else need / self.rate
+
+
+class Reservation:
+    """Выданное разрешение на вызов; `settle` уточняет расход токенов по факту."""
+
+    def __init__(self, limiter: "RateLimiter", tokens: int) -> None:
+        self._limiter = limiter
+        self.tokens = tokens
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        """
+        Сверяет оценку с фактическим расходом (из token_usage).
+
+        Args:
+            actual_tokens: Фактическое число токенов (None — оставить оценку).
+        """
+        if actual_tokens is not None:
+            self._limiter._adjust_tokens(actual_tokens - self.tokens)
+            self.tokens = actual_tokens
+
+
+class RateLimiter:
+    """
+    Ограничитель RPM/TPM одного ключа `provider:model` со справедливой (FIFO) очередью.
+    """
+
+    def __init__(self, key: str, rpm: Optional[int] = None, tpm: Optional[int] = None) -> None:
+        """
+        Args:
+            key: Ключ ограничителя (для метрик).
+            rpm: Лимит запросов в минуту (None/0 — без лимита).
+            tpm: Лимит токенов в минуту (None/0 — без лимита).
+        """
+        self.key = key
+        self._rpm = _Bucket(rpm) if rpm else None
+        self._tpm = _Bucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queue: Deque[object] = deque()
+        self._blocked_until = 0.0
+        self._stats = {"acquired": 0, "waited": 0, "wait_s_total": 0.0, "timeouts": 0, "throttled": 0}
+
+    # ---------- внутреннее (под self._lock) ----------
+    def _try_take(self, tokens: int, now: float) -> float:
+        """Пытается списать запрос и токены; возвращает 0 или время ожидания."""
+        wait = max(0.0, self._blocked_until - now)
+        for bucket, amount in ((self._rpm, 1), (self._tpm, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_for(amount))
+        if wait > 0:
+            return wait
+        if self._rpm is not None:
+            self._rpm.level -= 1
+        if self._tpm is not None:
+            # Запрос больше ёмкости TPM пропускаем, уводя ведро в «долг»
+            self._tpm.level -= tokens
+        return 0.0
+
+    def _poll(self, ticket: object, tokens: int) -> float:
+        """Шаг ожидания: 0 — разрешение получено (билет снят с очереди)."""
+        now = time.monotonic()
+        if self._queue[0] is not ticket:
+            return _POLL_S
+        wait = self._try_take(tokens, now)
+        if wait == 0:
+            self._queue.popleft()
+            self._cond.notify_all()
+        return wait
+
+    def _leave(self, ticket: object) -> None:
+        try:
+            self._queue.remove(ticket)
+        except ValueError:
+            pass
+        self._cond.notify_all()
+
+    def _record(self, started: float) -> None:
+        waited = time.monotonic() - started
+        self._stats["acquired"] += 1
+        if waited > 0.001:
+            self._stats["waited"] += 1
+            self._stats["wait_s_total"] += waited
+
+    def _adjust_tokens(self, delta: int) -> None:
+        if self._tpm is None or not delta:
+            return
+        with self._lock:
+            self._tpm.refill(time.monotonic())
+            self._tpm.level = min(self._tpm.capacity, self._tpm.level - delta)
+
+    # ---------- API ----------
+    @property
+    def enabled(self) -> bool:
+        return self._rpm is not None or self._tpm is not None
+
+    def acquire(self, tokens: int = 1, timeout: Optional[float] = None) -> Reservation:
+        """
+        Блокирующее ожидание очереди (для потоков).
+
+        Args:
+            tokens: Оценка токенов вызова (промпт + ожидаемый ответ).
+            timeout: Максимальное ожидание (None — без ограничения).
+
+        Returns:
+            Reservation: Разрешение; после ответа вызвать `settle(usage)`.
+
+        Raises:
+            RateLimitTimeout: Очередь не подошла за timeout.
+        """
+        if not self.enabled:
+            return Reservation(self, tokens)
+        started = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            while True:
+                wait = self._poll(ticket, tokens)
+                if wait == 0:
+                    self._record(started)
+                    return Reservation(self, tokens)
+                if timeout is not None and time.monotonic() - started + wait > timeout:
+                    self._leave(ticket)
+                    self._stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"rate limit {self.key}: очередь не подошла за {timeout:.0f} с")
+                self._cond.wait(wait)
+
+    async def aacquire(self, tokens: int = 1, timeout: Optional[float] = None) -> Reservation:
+        """Асинхронный аналог `acquire`: ожидание не блокирует event loop."""
+        if not self.enabled:
+            return Reservation(self, tokens)
+        started = time.monotonic()
+        ticket = object()
+        with self._lock:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._poll(ticket, tokens)
+                    if wait == 0:
+                        self._record(started)
+                        return Reservation(self, tokens)
+                    if timeout is not None and time.monotonic() - started + wait > timeout:
+                        self._leave(ticket)
+                        self._stats["timeouts"] += 1
+                        raise RateLimitTimeout(f"rate limit {self.key}: очередь не подошла за {timeout:.0f} с")
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            with self._lock:
+                self._leave(ticket)
+            raise
+
+    def throttle(self, retry_after: Optional[float]) -> None:
+        """
+        Провайдер всё же ответил 429: приостанавливаем очередь на Retry-After
+        (или на интервал между запросами, если заголовка нет).
+        """
+        pause = retry_after if retry_after is not None else (60.0 / self._rpm.capacity if self._rpm else 1.0)
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+            self._stats["throttled"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики: глубина очереди, число ожиданий и суммарное время ожидания, таймауты."""
+        with self._lock:
+            return {
+                "rpm": int(self._rpm.capacity) if self._rpm else None,
+                "tpm": int(self._tpm.capacity) if self._tpm else None,
+                "queue_depth": len(self._queue),
+                **self._stats,
+            }
+
+
+class RateLimiterRegistry:
+    """Общие для процесса ограничители по ключу `provider:model`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    @staticmethod
+    def _limit(limits: Dict[str, int], provider: str, model: str) -> Optional[int]:
+        """Лимит для `provider:model`, иначе для провайдера."""
+        return limits.get(f"{provider}:{model}", limits.get(provider))
+
+    def get(self, provider: str, model: str, rpm_limits: Dict[str, int], tpm_limits: Dict[str, int]) -> RateLimiter:
+        """
+        Возвращает ограничитель ключа (создаёт или пересоздаёт при смене лимитов).
+
+        Args:
+            provider: Имя провайдера.
+            model: Имя модели.
+            rpm_limits: Лимиты запросов в минуту {"provider:model" | "provider": rpm}.
+            tpm_limits: Лимиты токенов в минуту в том же формате.
+
+        Returns:
+            RateLimiter: Ограничитель (отключённый, если лимиты не заданы).
+        """
+        key = f"{provider}:{model}"
+        rpm = self._limit(rpm_limits, provider, model) or None
+        tpm = self._limit(tpm_limits, provider, model) or None
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None or limiter.stats()["rpm"] != rpm or limiter.stats()["tpm"] != tpm:
+                limiter = self._limiters[key] = RateLimiter(key, rpm=rpm, tpm=tpm)
+            return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Метрики всех активных ограничителей."""
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {lim.key: lim.stats() for lim in limiters if lim.enabled}
+
+
+# Ограничители процесса: общие для всех экземпляров LLMClient
+rate_limiters = RateLimiterRegistry()
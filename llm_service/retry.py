@@ -0,0 +1,113 @@
+"""
+Политика ретраев вызовов провайдеров: экспоненциальная задержка с full jitter,
+учёт Retry-After (429/503) и общий бюджет времени на запрос.
+"""
+
+import random
+from dataclasses import dataclass, replace
+from typing import Callable, Optional
+
+# Статусы, для которых задержку диктует сервер через Retry-After
+RETRY_AFTER_STATUSES = frozenset({429, 503})
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Параметры ретраев одной операции.
+
+    Attributes:
+        max_attempts: Максимум попыток (1 — без ретраев).
+        base_s: Базовая задержка экспоненты.
+        max_s: Верхняя граница задержки экспоненты.
+        jitter_s: Случайная добавка к Retry-After (разводит клиентов во времени).
+        deadline_s: Бюджет на все попытки и паузы (None — без ограничения).
+    """
+
+    max_attempts: int
+    base_s: float
+    max_s: float
+    jitter_s: float
+    deadline_s: Optional[float]
+
+    @classmethod
+    def from_settings(cls, cfg, op_name: Optional[str] = None) -> "RetryPolicy":
+        """
+        Политика из настроек с учётом override по операции.
+
+        Args:
+            cfg: LLMSettings (max_retries, retry_base_s, retry_max_s, retry_jitter_s,
+                 retry_deadline_s / request_timeout_s, retry_max_retries_by_op).
+            op_name: Имя операции ("generate", "embed", "validate_api_key", ...).
+
+        Returns:
+            RetryPolicy: Политика операции.
+        """
+        retries = cfg.retry_max_retries_by_op.get(op_name, cfg.max_retries) if op_name else cfg.max_retries
+        return cls(
+            max_attempts=max(1, int(retries) + 1),
+            base_s=cfg.retry_base_s,
+            max_s=cfg.retry_max_s,
+            jitter_s=cfg.retry_jitter_s,
+            deadline_s=cfg.retry_deadline_s or cfg.request_timeout_s,
+        )
+
+    def with_attempts(self, max_attempts: int) -> "RetryPolicy":
+        """Копия политики с другим числом попыток."""
+        return replace(self, max_attempts=max(1, max_attempts))
+
+    def backoff(
+        self,
+        attempt: int,
+        retry_after: Optional[float] = None,
+        status: Optional[int] = None,
+        rand: Callable[[float, float], float] = random.uniform,
+    ) -> float:
+        """
+        Задержка перед следующей попыткой.
+
+        Retry-After (для 429/503) соблюдается как минимум; иначе — full jitter:
+        случайное значение из [0, min(max_s, base_s * 2^(attempt-1))].
+
+        Args:
+            attempt: Номер неудачной попытки (с 1).
+            retry_after: Значение Retry-After в секундах, если сервер его прислал.
+            status: HTTP-статус ошибки.
+            rand: Источник случайности (для тестов).
+
+        Returns:
+            float: Задержка в секундах.
+        """
+        if retry_after is not None and (status is None or status in RETRY_AFTER_STATUSES):
+            return float(retry_after) + rand(0.0, self.jitter_s)
+        cap = min(self.max_s, self.base_s * (2 ** (attempt - 1)))
+        return rand(0.0, cap)
+
+    def next_delay(
+        self,
+        attempt: int,
+        elapsed_s: float,
+        retry_after: Optional[float] = None,
+        status: Optional[int] = None,
+        rand: Callable[[float, float], float] = random.uniform,
+    ) -> Optional[float]:
+        """
+        Решает, делать ли ещё попытку, и возвращает паузу перед ней.
+
+        Args:
+            attempt: Номер неудачной попытки (с 1).
+            elapsed_s: Сколько времени уже потрачено на операцию.
+            retry_after: Retry-After в секундах (если есть).
+            status: HTTP-статус ошибки.
+            rand: Источник случайности (для тестов).
+
+        Returns:
+            Optional[float]: Пауза в секундах или None — попытки исчерпаны либо
+            пауза не укладывается в бюджет времени.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt, retry_after, status, rand)
+        if self.deadline_s is not None and elapsed_s + delay >= self.deadline_s:
+            return None
+        return delay
@@ -0,0 +1,67 @@
+"""
+Структурированный ответ чат-модели (function calling / JSON mode).
+
+Вызывающий передаёт в `generate`/`agenerate` описание ответа `StructuredOutput`
+(аргумент `structured_output`), а каждый провайдер цепочки переводит его в свои
+параметры вызова: OpenAI и OpenRouter — инструмент с принудительным `tool_choice`
+(аргументы вызова ограничены JSON-схемой), Mistral — `response_format: json_object`.
+Ответ в обоих случаях возвращается строкой JSON.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+
+@dataclass(frozen=True)
+class StructuredOutput:
+    """Описание ответа: имя и описание функции и JSON-схема её аргументов."""
+
+    name: str
+    description: str
+    parameters: Dict[str, Any] = field(default_factory=dict)
+
+    def to_tool(self) -> Dict[str, Any]:
+        """Инструмент в формате OpenAI (`tools`)."""
+        return {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters},
+        }
+
+
+def structured_kwargs(provider: str, spec: StructuredOutput) -> Dict[str, Any]:
+    """
+    Параметры вызова, ограничивающие ответ схемой.
+
+    Args:
+        provider: Имя провайдера.
+        spec: Описание ответа.
+
+    Returns:
+        dict: tools + tool_choice (openai/openrouter) или response_format (mistral).
+    """
+    if provider == "mistral":
+        return {"response_format": {"type": "json_object"}}
+    return {"tools": [spec.to_tool()], "tool_choice": {"type": "function", "function": {"name": spec.name}}}
+
+
+def structured_text(result: Any, spec: Optional[StructuredOutput] = None) -> str:
+    """
+    Текст ответа: аргументы вызова инструмента `spec` (JSON), если модель его вызвала, иначе content.
+
+    Args:
+        result: Ответ чат-модели (AIMessage).
+        spec: Описание ответа (None — любой вызов инструмента).
+
+    Returns:
+        str: JSON аргументов или текст ответа.
+    """
+    raw_calls = (getattr(result, "additional_kwargs", None) or {}).get("tool_calls") or []
+    for call in raw_calls:
+        fn = call.get("function") or {}
+        if spec is None or fn.get("name") == spec.name:
+            return fn.get("arguments") or ""
+    for call in getattr(result, "tool_calls", None) or []:
+        if spec is None or call.get("name") == spec.name:
+            return json.dumps(call.get("args") or {}, ensure_ascii=False)
+    return getattr(result, "content", "") or ""
@@ -4,7 +4,6 @@ from email.utils import parsedate_to_datetime
 from typing import Optional, Tuple
 
 import httpx
-from httpx import HTTPStatusError
 from tenacity import RetryError
 
 
@@ -57,10 +56,11 @@ def extract_request_id_from_exc(exc: Exception) -> Optional[str]:
     Returns:
         Optional[str]: Идентификатор запроса.
     """
-    if isinstance(exc, HTTPStatusError) and exc.response is not None:
+    response = getattr(exc, "response", None)
+    if isinstance(response, httpx.Response):
         for k in ("x-request-id", "x-requestid", "request-id"):
-            if k in exc.response.headers:
-                return exc.response.headers.get(k)
+            if k in response.headers:
+                return response.headers.get(k)
     return None
 
 
@@ -89,16 +89,18 @@ def unwrap_http_exc(
     request_id = None
     body_snippet = ""
 
-    if isinstance(exc, HTTPStatusError) and exc.response is not None:
-        status = exc.response.status_code
+    # httpx.HTTPStatusError и ошибки SDK (openai.APIStatusError) несут httpx.Response
+    response = getattr(exc, "response", None)
+    if isinstance(response, httpx.Response):
+        status = response.status_code
         request_id = extract_request_id_from_exc(exc)
-        retry_after = parse_retry_after(exc.response.headers.get("retry-after"))
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
         try:
-            body_json = exc.response.json()
+            body_json = response.json()
             body_snippet = truncate(json.dumps(body_json, ensure_ascii=False))
         except Exception:
             try:
-                body_snippet = truncate(exc.response.text or "")
+                body_snippet = truncate(response.text or "")
             except Exception:
                 body_snippet = ""
 
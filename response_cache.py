@@ -0,0 +1,415 @@
+"""
+Кэш ответов агента (RAG и прямые ответы).
+
+Поиск в два шага: точный ключ по нормализованному вопросу, затем — ближайший
+по косинусному сходству эмбеддинга вопроса (порог настраивается). Значения лежат
+в подключаемом бэкенде с TTL и вытеснением:
+- memory — в процессе, LRU с лимитом по байтам и числу записей;
+- sqlite — на диске, общий для воркеров одного хоста;
+- redis  — любой клиент с Redis-совместимым API (get/set(ex=)/delete), в т.ч. локальная замена.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from logger import get_logger
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Нормализует вопрос для ключа кэша: регистр, «ё», пунктуация, пробелы.
+
+    Args:
+        question: Исходный вопрос.
+
+    Returns:
+        str: Нормализованная строка.
+    """
+    q = (question or "").lower().replace("ё", "е")
+    q = _PUNCT_RE.sub(" ", q)
+    return _SPACE_RE.sub(" ", q).strip()
+
+
+def _unit(v: Sequence[float]) -> np.ndarray:
+    a = np.asarray(v, dtype=np.float32)
+    norm = float(np.linalg.norm(a)) or 1.0
+    return a / norm
+
+
+class _VectorIndex:
+    """
+    Семантический индекс одного пространства имён: нормированные векторы — строки
+    матрицы float32, ближайший вопрос ищется одним матричным умножением.
+    Записи вытесняются в порядке добавления (самая старая — первой).
+    """
+
+    _INITIAL_ROWS = 64
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._rows: "OrderedDict[str, int]" = OrderedDict()  # ключ → строка матрицы
+        self._keys: List[Optional[str]] = []  # строка → ключ (None — свободна)
+        self._free: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        if self._matrix is not None and self._matrix.shape[1] != vector.shape[0]:
+            self._reset()  # сменилась модель эмбеддингов — старые векторы несравнимы
+        if self._matrix is None:
+            self._matrix = np.zeros((min(self._INITIAL_ROWS, self.max_entries), vector.shape[0]), dtype=np.float32)
+        if key in self._rows:
+            row = self._rows[key]
+            self._rows.move_to_end(key)
+        else:
+            if len(self._rows) >= self.max_entries:
+                self.remove(next(iter(self._rows)))
+            row = self._free.pop() if self._free else self._grow()
+            self._rows[key] = row
+            self._keys[row] = key
+        self._matrix[row] = vector
+
+    def _grow(self) -> int:
+        """Следующая свободная строка; при нехватке матрица удваивается (до max_entries)."""
+        row = len(self._keys)
+        if row >= self._matrix.shape[0]:
+            grown = np.zeros((min(self._matrix.shape[0] * 2, self.max_entries), self._matrix.shape[1]), dtype=np.float32)
+            grown[:row] = self._matrix[:row]
+            self._matrix = grown
+        self._keys.append(None)
+        return row
+
+    def remove(self, key: str) -> None:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self._keys[row] = None
+        self._matrix[row] = 0.0  # нулевая строка даёт сходство 0 и не проходит порог
+        self._free.append(row)
+
+    def nearest(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        if not self._rows or self._matrix.shape[1] != vector.shape[0]:
+            return None, -1.0
+        scores = self._matrix[:len(self._keys)] @ vector
+        row = int(np.argmax(scores))
+        return self._keys[row], float(scores[row])
+
+
+# ---------- Бэкенды ----------
+class InMemoryCacheBackend:
+    """LRU-кэш в памяти процесса с TTL и лимитами по байтам и числу записей."""
+
+    def __init__(self, max_bytes: int, max_entries: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.time():
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (time.time() + ttl_s, value)
+            self._bytes += len(value)
+            while self._items and (self._bytes > self.max_bytes or len(self._items) > self.max_entries):
+                self._drop(next(iter(self._items)))
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        _, value = self._items.pop(key)
+        self._bytes -= len(value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._items), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class SqliteCacheBackend:
+    """Кэш на диске (SQLite): TTL и LRU-вытеснение по суммарному размеру."""
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl_s, now),
+            )
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT key, size FROM response_cache ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (row[0],))
+                total -= row[1]
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache"
+            ).fetchone()
+        return {"backend": "sqlite", "entries": entries, "bytes": size, "evictions": self.evictions}
+
+
+class RedisCacheBackend:
+    """
+    Кэш в Redis-совместимом хранилище. TTL задаётся через `SET ... EX`,
+    LRU и лимит памяти — политикой сервера (maxmemory-policy allkeys-lru).
+    """
+
+    def __init__(self, client: Any = None, url: Optional[str] = None, prefix: str = "agent:response_cache:") -> None:
+        """
+        Args:
+            client: Готовый клиент (redis.Redis или локальная замена с get/set/delete).
+            url: URL Redis, если client не передан (нужен пакет redis).
+            prefix: Префикс ключей.
+        """
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("Для response_cache_backend=redis нужен пакет redis") from e
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._client.get(self.prefix + key)
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return value
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        self._client.set(self.prefix + key, value, ex=max(1, int(ttl_s)))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+# ---------- Кэш ответов ----------
+class ResponseCache:
+    """
+    Кэш ответов с точным и семантическим поиском.
+
+    Семантический индекс (векторы вопросов) хранится в процессе матрицей numpy и ограничен
+    `max_index_entries`; сами ответы — в бэкенде. Если значение вытеснено из
+    бэкенда, запись индекса удаляется при следующем обращении.
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        ttl_s: float,
+        similarity_threshold: float,
+        namespaces: Sequence[str],
+        max_index_entries: int = 10000,
+    ) -> None:
+        """
+        Args:
+            backend: Бэкенд хранения (memory / sqlite / redis).
+            ttl_s: Время жизни ответа.
+            similarity_threshold: Минимальное косинусное сходство для семантического попадания.
+            namespaces: Намерения, ответы которых кэшируются (квиз по умолчанию исключён).
+            max_index_entries: Лимит семантического индекса на пространство имён.
+        """
+        self.log = get_logger(__name__)
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.similarity_threshold = similarity_threshold
+        self.namespaces = set(namespaces)
+        self.max_index_entries = max_index_entries
+        self._lock = threading.Lock()
+        self._index: Dict[str, _VectorIndex] = {}
+        self._stats = {"hits_exact": 0, "hits_semantic": 0, "misses": 0, "stores": 0}
+
+    def enabled_for(self, namespace: str) -> bool:
+        """Кэшируются ли ответы этого пространства имён (намерения)."""
+        return namespace in self.namespaces
+
+    @staticmethod
+    def _key(namespace: str, question: str) -> str:
+        digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:32]
+        return f"{namespace}:{digest}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _nearest(self, namespace: str, vector: Sequence[float]) -> Tuple[Optional[str], float]:
+        q = _unit(vector)
+        with self._lock:
+            index = self._index.get(namespace)
+            return index.nearest(q) if index is not None else (None, -1.0)
+
+    def lookup(self, namespace: str, question: str, vector: Optional[Sequence[float]] = None) -> Optional[str]:
+        """
+        Ищет ответ: сначала точный ключ, затем ближайший вопрос по эмбеддингу.
+
+        Args:
+            namespace: Пространство имён (намерение).
+            question: Вопрос пользователя.
+            vector: Эмбеддинг вопроса (None — только точный поиск).
+
+        Returns:
+            Optional[str]: Ответ из кэша или None.
+        """
+        if not self.enabled_for(namespace):
+            return None
+
+        value = self.backend.get(self._key(namespace, question))
+        if value is not None:
+            self._count("hits_exact")
+            return value.decode("utf-8")
+
+        if vector:
+            key, score = self._nearest(namespace, vector)
+            if key is not None and score >= self.similarity_threshold:
+                value = self.backend.get(key)
+                if value is not None:
+                    self._count("hits_semantic")
+                    self.log.debug("response_cache: семантическое попадание, sim=%.3f", score)
+                    return value.decode("utf-8")
+                with self._lock:
+                    index = self._index.get(namespace)
+                    if index is not None:
+                        index.remove(key)
+
+        self._count("misses")
+        return None
+
+    def store(self, namespace: str, question: str, answer: str, vector: Optional[Sequence[float]] = None) -> None:
+        """
+        Сохраняет ответ (пустые ответы и чужие пространства имён не кэшируются).
+
+        Args:
+            namespace: Пространство имён (намерение).
+            question: Вопрос пользователя.
+            answer: Ответ.
+            vector: Эмбеддинг вопроса для семантического индекса.
+        """
+        if not answer or not self.enabled_for(namespace):
+            return
+        key = self._key(namespace, question)
+        self.backend.set(key, answer.encode("utf-8"), self.ttl_s)
+        self._count("stores")
+        if vector:
+            q = _unit(vector)
+            with self._lock:
+                index = self._index.get(namespace)
+                if index is None:
+                    index = self._index[namespace] = _VectorIndex(self.max_index_entries)
+                index.add(key, q)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий/промахов, размер индекса и статистика бэкенда."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["index_entries"] = sum(len(i) for i in self._index.values())
+        stats.update(self.backend.stats())
+        return stats
+
+
+def make_response_cache(cfg) -> Optional[ResponseCache]:
+    """
+    Создаёт кэш ответов по настройкам (None, если кэш выключен).
+
+    Args:
+        cfg: LLMSettings.
+
+    Returns:
+        Optional[ResponseCache]: Кэш ответов.
+    """
+    if not cfg.response_cache_enabled:
+        return None
+    if cfg.response_cache_backend == "sqlite":
+        backend = SqliteCacheBackend(cfg.response_cache_sqlite_path, cfg.response_cache_max_bytes)
+    elif cfg.response_cache_backend == "redis":
+        backend = RedisCacheBackend(url=cfg.response_cache_redis_url)
+    else:
+        backend = InMemoryCacheBackend(cfg.response_cache_max_bytes, cfg.response_cache_max_entries)
+    return ResponseCache(
+        backend,
+        ttl_s=cfg.response_cache_ttl_s,
+        similarity_threshold=cfg.response_cache_similarity,
+        namespaces=cfg.response_cache_intents,
+        max_index_entries=cfg.response_cache_max_entries,
+    )
@@ -0,0 +1,200 @@
+"""
+Результаты поиска в RAG: разбор ответа сервиса, удаление почти-дубликатов
+и упаковка лучших фрагментов в бюджет токенов промпта.
+"""
+
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+from llm_service.rate_limit import estimate_tokens
+
+try:  # tiktoken приходит с langchain-openai; без него — грубая оценка
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class RetrievedDocument:
+    """
+    Фрагмент документа из RAG.
+
+    Attributes:
+        text: Текст фрагмента.
+        source: Источник (файл, URL, заголовок), если сервис его вернул.
+        score: Релевантность (чем больше, тем лучше), если есть.
+        chunk_id: Идентификатор фрагмента, если есть.
+    """
+
+    text: str
+    source: Optional[str] = None
+    score: Optional[float] = None
+    chunk_id: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def render(self) -> str:
+        """Фрагмент для промпта: текст с пометкой источника."""
+        return f"[{self.source}]\n{self.text}" if self.source else self.text
+
+
+# ---------- разбор ответа сервиса ----------
+def _first(item: Dict[str, Any], *keys: str) -> Any:
+    meta = item.get("metadata") if isinstance(item.get("metadata"), dict) else {}
+    for key in keys:
+        for container in (item, meta):
+            value = container.get(key)
+            if value not in (None, ""):
+                return value
+    return None
+
+
+def _to_document(item: Any) -> Optional[RetrievedDocument]:
+    if isinstance(item, str):
+        return RetrievedDocument(text=item) if item.strip() else None
+    if not isinstance(item, dict):
+        return None
+    text = _first(item, "text", "content", "page_content", "chunk")
+    if not isinstance(text, str) or not text.strip():
+        return None
+    source = _first(item, "source", "title", "file", "url")
+    score = _first(item, "score", "similarity", "relevance")
+    chunk_id = _first(item, "chunk_id", "id", "doc_id")
+    try:
+        score = float(score) if score is not None else None
+    except (TypeError, ValueError):
+        score = None
+    return RetrievedDocument(
+        text=text.strip(),
+        source=str(source) if source is not None else None,
+        score=score,
+        chunk_id=str(chunk_id) if chunk_id is not None else None,
+    )
+
+
+def parse_search_result(raw: Any) -> List[RetrievedDocument]:
+    """
+    Разбирает ответ `/search` RAG-сервиса.
+
+    Поддерживаются список результатов и объект со списком в `results` / `documents` /
+    `chunks` / `data`; у элемента — текст (`text` | `content` | `page_content`),
+    источник, оценка и id (в том числе внутри `metadata`).
+
+    Args:
+        raw: Ответ сервиса (уже декодированный JSON).
+
+    Returns:
+        List[RetrievedDocument]: Фрагменты в порядке ответа (ошибка сервиса — пустой список).
+    """
+    items: Iterable[Any] = ()
+    if isinstance(raw, list):
+        items = raw
+    elif isinstance(raw, dict):
+        for key in ("results", "documents", "chunks", "data"):
+            if isinstance(raw.get(key), list):
+                items = raw[key]
+                break
+    return [doc for doc in map(_to_document, items) if doc is not None]
+
+
+# ---------- дубликаты ----------
+def rank(documents: List[RetrievedDocument]) -> List[RetrievedDocument]:
+    """По убыванию оценки; без оценки — в исходном порядке после оценённых."""
+    return sorted(documents, key=lambda d: -d.score if d.score is not None else float("inf"))
+
+
+def _shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def dedupe(documents: List[RetrievedDocument], threshold: float = 0.9) -> List[RetrievedDocument]:
+    """
+    Убирает почти-дубликаты (пересекающиеся чанки, одна страница из разных источников).
+
+    Сходство — Jaccard по словесным 3-граммам; из похожих остаётся фрагмент с большей оценкой.
+
+    Args:
+        documents: Фрагменты.
+        threshold: Порог сходства, с которого фрагменты считаются дубликатами.
+
+    Returns:
+        List[RetrievedDocument]: Фрагменты без дубликатов, по убыванию оценки.
+    """
+    kept: List[RetrievedDocument] = []
+    kept_shingles: List[FrozenSet[str]] = []
+    for doc in rank(documents):
+        sh = _shingles(doc.text)
+        if any(len(sh & other) / (len(sh | other) or 1) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(sh)
+    return kept
+
+
+# ---------- бюджет контекста ----------
+def load_encoding() -> Any:
+    """
+    Загружает кодировку cl100k_base один раз на процесс (первая загрузка может скачивать
+    файл BPE — вызывать при старте, а не на горячем пути).
+
+    Returns:
+        Кодировка tiktoken или None (tiktoken не установлен либо нет кэша кодировки и сети).
+    """
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.get_encoding("cl100k_base") if tiktoken is not None else False
+                except Exception:  # нет кэша кодировки и сети
+                    _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов текста (cl100k_base через tiktoken, иначе ≈ 4 символа на токен)."""
+    encoding = load_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text or ""))
+    return estimate_tokens(text)
+
+
+def pack_context(documents: List[RetrievedDocument], max_tokens: int) -> List[RetrievedDocument]:
+    """
+    Жадно укладывает лучшие фрагменты в бюджет токенов.
+
+    Фрагмент, не помещающийся целиком, пропускается (следующие, более короткие,
+    ещё могут поместиться). Если не помещается даже лучший, он обрезается до бюджета.
+
+    Args:
+        documents: Фрагменты (будут упорядочены по оценке).
+        max_tokens: Бюджет контекста в токенах (<= 0 — без ограничения).
+
+    Returns:
+        List[RetrievedDocument]: Выбранные фрагменты по убыванию оценки.
+    """
+    ranked = rank(documents)
+    if max_tokens <= 0:
+        return ranked
+    packed: List[RetrievedDocument] = []
+    used = 0
+    for doc in ranked:
+        cost = count_tokens(doc.render())
+        if used + cost <= max_tokens:
+            packed.append(doc)
+            used += cost
+    if not packed and ranked:
+        best = ranked[0]
+        ratio = max_tokens / max(1, count_tokens(best.render()))
+        packed.append(RetrievedDocument(best.text[: int(len(best.text) * ratio)], best.source, best.score, best.chunk_id))
+    return packed
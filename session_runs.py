@@ -0,0 +1,241 @@
+"""
+Порядок и идемпотентность запусков графа в пределах сессии.
+
+- Запуски одного `session_id` (thread_id чекпоинтов) выполняются по очереди:
+  параллельные запуски гоняли бы один и тот же чекпоинт.
+- Повтор того же запроса (тот же ключ идемпотентности — заголовок `Idempotency-Key`
+  или хэш сессии и вопроса) не запускает граф заново, а получает результат уже идущего
+  запуска. Завершённый результат отдаётся ещё `dedup_ttl_s` секунд только по явному
+  ключу клиента: тот же вопрос, заданный сессией снова, — новый запуск.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from response_cache import normalize_question
+
+# Сколько завершённых результатов держать для повторов
+_MAX_COMPLETED = 1024
+
+
+def idempotency_key(session_id: str, question: str, explicit: Optional[str] = None) -> str:
+    """
+    Ключ идемпотентности запуска.
+
+    Args:
+        session_id: Сессия.
+        question: Вопрос.
+        explicit: Ключ клиента (заголовок Idempotency-Key), если передан.
+
+    Returns:
+        str: Ключ клиента или хэш сессии и нормализованного вопроса.
+    """
+    if explicit:
+        return f"{session_id}:key:{explicit}"
+    digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:32]
+    return f"{session_id}:q:{digest}"
+
+
+class _KeyedLocks:
+    """Блокировки по ключу со счётчиком ссылок: запись удаляется, когда блокировку никто не держит и не ждёт."""
+
+    def __init__(self, factory: Callable[[], Any]) -> None:
+        self._factory = factory
+        self._guard = threading.Lock()
+        self._locks: Dict[str, Tuple[Any, int]] = {}
+
+    def take(self, key: str) -> Any:
+        with self._guard:
+            lock, refs = self._locks.get(key) or (self._factory(), 0)
+            self._locks[key] = (lock, refs + 1)
+            return lock
+
+    def drop(self, key: str) -> None:
+        with self._guard:
+            lock, refs = self._locks[key]
+            if refs <= 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, refs - 1)
+
+    def __len__(self) -> int:
+        with self._guard:
+            return len(self._locks)
+
+
+class SessionRuns:
+    """Последовательные запуски по сессии и присоединение повторов к идущему запуску."""
+
+    def __init__(self, dedup_ttl_s: float = 30.0) -> None:
+        """
+        Args:
+            dedup_ttl_s: Сколько секунд после завершения повтор с явным ключом получает готовый результат
+                (0 — только идущие).
+        """
+        self.dedup_ttl_s = dedup_ttl_s
+        self._lock = threading.Lock()
+        self._async_locks = _KeyedLocks(asyncio.Lock)
+        self._thread_locks = _KeyedLocks(threading.Lock)
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+        self._completed: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._stats = {"runs": 0, "deduplicated": 0, "serialized": 0}
+
+    # ---------- очередь сессии ----------
+    @asynccontextmanager
+    async def session_lock(self, session_id: str) -> AsyncIterator[None]:
+        """Асинхронная блокировка сессии: запуски одной сессии по очереди."""
+        lock = self._async_locks.take(session_id)
+        try:
+            if lock.locked():
+                self._count("serialized")
+            async with lock:
+                yield
+        finally:
+            self._async_locks.drop(session_id)
+
+    @contextmanager
+    def thread_session_lock(self, session_id: str) -> Iterator[None]:
+        """Синхронный аналог `session_lock` (для `AgentSystem.run` из потоков)."""
+        lock = self._thread_locks.take(session_id)
+        try:
+            if lock.locked():
+                self._count("serialized")
+            with lock:
+                yield
+        finally:
+            self._thread_locks.drop(session_id)
+
+    # ---------- идемпотентность ----------
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _recent(self, key: str) -> Tuple[bool, Any]:
+        """Недавно завершённый результат (под self._lock)."""
+        item = self._completed.get(key)
+        if item is None:
+            return False, None
+        finished, value = item
+        if time.monotonic() - finished > self.dedup_ttl_s:
+            del self._completed[key]
+            return False, None
+        self._stats["deduplicated"] += 1
+        return True, value
+
+    def _remember(self, key: str, value: Any) -> None:
+        """Запоминает результат (под self._lock)."""
+        if self.dedup_ttl_s <= 0:
+            return
+        self._completed[key] = (time.monotonic(), value)
+        self._completed.move_to_end(key)
+        while len(self._completed) > _MAX_COMPLETED:
+            self._completed.popitem(last=False)
+
+    async def arun(
+        self,
+        session_id: str,
+        key: str,
+        afn: Callable[[], Awaitable[Any]],
+        *,
+        replay: bool = True,
+        admit: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> Any:
+        """
+        Выполняет запуск сессии по очереди; повтор с тем же ключом получает результат первого.
+
+        Args:
+            session_id: Сессия (единица очерёдности).
+            key: Ключ идемпотентности (`idempotency_key`).
+            afn: Запуск графа.
+            replay: Запомнить результат и отдавать его повторам после завершения
+                (только для явного ключа клиента; иначе повтор присоединяется лишь к идущему запуску).
+            admit: Фабрика контекста допуска (`AdmissionController.admit`). Входит в него только
+                выполняющий запуск и только после очереди сессии: повторы, присоединённые к идущему
+                запуску, и запуски, ждущие свою сессию, мест не занимают.
+
+        Returns:
+            Результат запуска (своего или идущего с тем же ключом).
+        """
+        while True:
+            with self._lock:
+                found, value = self._recent(key) if replay else (False, None)
+                if found:
+                    return value
+                leader = self._ainflight.get(key)
+                if leader is None:
+                    leader = self._ainflight[key] = asyncio.get_running_loop().create_future()
+                    self._stats["runs"] += 1
+                    break
+                self._stats["deduplicated"] += 1
+            try:
+                return await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise
+                # первый запуск отменён (клиент ушёл) — выполняем сами
+
+        try:
+            async with self.session_lock(session_id):
+                async with admit() if admit is not None else nullcontext():
+                    value = await afn()
+        except BaseException as e:
+            with self._lock:
+                self._ainflight.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                leader.cancel()
+            else:
+                leader.set_exception(e)
+                leader.exception()  # помечаем извлечённым: повторов может не быть
+            raise
+        with self._lock:
+            self._ainflight.pop(key, None)
+            if replay:
+                self._remember(key, value)
+        leader.set_result(value)
+        return value
+
+    def run(self, session_id: str, key: str, fn: Callable[[], Any], *, replay: bool = True) -> Any:
+        """Синхронный аналог `arun` (повторы ждут в своих потоках)."""
+        with self._lock:
+            found, value = self._recent(key) if replay else (False, None)
+            if found:
+                return value
+            leader = self._inflight.get(key)
+            own = leader is None
+            if own:
+                leader = self._inflight[key] = Future()
+                self._stats["runs"] += 1
+            else:
+                self._stats["deduplicated"] += 1
+        if not own:
+            return leader.result()
+
+        try:
+            with self.thread_session_lock(session_id):
+                value = fn()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            leader.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            if replay:
+                self._remember(key, value)
+        leader.set_result(value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Запуски, присоединённые повторы, запуски, ждавшие очереди сессии, и активные сессии."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["in_flight"] = len(self._inflight) + len(self._ainflight)
+        stats["locked_sessions"] = len(self._async_locks) + len(self._thread_locks)
+        return stats
@@ -0,0 +1,752 @@
+"""
+Хранилища сессий (чекпоинтов LangGraph).
+
+- memory — `BoundedMemorySaver`: в памяти процесса, TTL на сессию, глобальные
+  LRU-лимиты на число сессий и байты, режим «только последний чекпоинт»;
+- sqlite — `SqliteCheckpointSaver`: файл SQLite (WAL), записи копятся в буфере
+  и сбрасываются фоновым потоком одной транзакцией; переживает рестарт и
+  разделяется между воркерами на одном хосте;
+- redis  — `RedisCheckpointSaver`: Redis-совместимое хранилище, общее для подов.
+
+Дисковые бэкенды хранят последний чекпоинт сессии по полям состояния
+(`channel_values`) в сжатом виде: записываются только изменившиеся поля.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+
+from logger import get_logger
+
+# Сохранённый чекпоинт: (сериализованный checkpoint, сериализованные metadata, id родителя)
+_Saved = Tuple[bytes, bytes, Optional[str]]
+
+
+def checkpoint_id(checkpoint: Dict[str, Any]) -> str:
+    """Идентификатор чекпоинта (id в новых версиях LangGraph, ts — в старых)."""
+    return checkpoint.get("id") or checkpoint["ts"]
+
+
+@dataclass
+class _Session:
+    """Чекпоинты одной сессии (thread_id) и их суммарный размер."""
+
+    checkpoints: Dict[str, _Saved] = field(default_factory=dict)
+    size: int = 0
+    last_access: float = 0.0
+
+
+class BoundedMemorySaver(BaseCheckpointSaver):
+    """
+    In-memory чекпоинтер с TTL, LRU-лимитами и режимом «только последний чекпоинт».
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_s: float,
+        max_sessions: int,
+        max_bytes: int,
+        keep_latest_only: bool = True,
+        serde: Any = None,
+    ) -> None:
+        """
+        Args:
+            ttl_s: Время жизни сессии с последнего обращения (<= 0 — без TTL).
+            max_sessions: Максимум живых сессий.
+            max_bytes: Максимальный суммарный объём сериализованных чекпоинтов.
+            keep_latest_only: Хранить только последний чекпоинт каждой сессии.
+            serde: Сериализатор (по умолчанию — сериализатор LangGraph).
+        """
+        super().__init__(serde=serde)
+        self.log = get_logger(__name__)
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.keep_latest_only = keep_latest_only
+        self._lock = threading.RLock()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._evicted = {"ttl": 0, "lru": 0, "ended": 0}
+
+    # ---------- служебное ----------
+    def _drop(self, thread_id: str, reason: str) -> None:
+        sess = self._sessions.pop(thread_id)
+        self._bytes -= sess.size
+        self._evicted[reason] += 1
+
+    def _evict(self, now: float) -> None:
+        """Удаляет просроченные сессии, затем самые давние — пока не уложимся в лимиты."""
+        if self.ttl_s > 0:
+            while self._sessions:
+                thread_id, sess = next(iter(self._sessions.items()))
+                if sess.last_access + self.ttl_s > now:
+                    break
+                self._drop(thread_id, "ttl")
+        # Последнюю (текущую) сессию не вытесняем, даже если она одна превышает лимит
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._sessions)), "lru")
+
+    def _to_tuple(self, thread_id: str, ts: str, saved: _Saved) -> CheckpointTuple:
+        ckpt, meta, parent = saved
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "thread_ts": ts}},
+            checkpoint=self.serde.loads(ckpt),
+            metadata=self.serde.loads(meta) if meta else {},
+            parent_config={"configurable": {"thread_id": thread_id, "thread_ts": parent}} if parent else None,
+        )
+
+    # ---------- API чекпоинтера ----------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ts = config["configurable"].get("thread_ts")
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            sess = self._sessions.get(thread_id)
+            if sess is None or not sess.checkpoints:
+                return None
+            sess.last_access = now
+            self._sessions.move_to_end(thread_id)
+            if not ts:
+                ts = max(sess.checkpoints)
+            saved = sess.checkpoints.get(ts)
+        return self._to_tuple(thread_id, ts, saved) if saved else None
+
+    def list(
+        self,
+        config: RunnableConfig,
+        *,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Iterator[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        before_ts = before["configurable"].get("thread_ts") if before else None
+        with self._lock:
+            sess = self._sessions.get(thread_id)
+            items = sorted(sess.checkpoints.items(), reverse=True) if sess else []
+        for n, (ts, saved) in enumerate((ts, s) for ts, s in items if not before_ts or ts < before_ts):
+            if limit is not None and n >= limit:
+                break
+            yield self._to_tuple(thread_id, ts, saved)
+
+    def put(self, config: RunnableConfig, checkpoint: Dict[str, Any], metadata: Any = None) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ts = checkpoint_id(checkpoint)
+        parent = config["configurable"].get("thread_ts")
+        saved: _Saved = (
+            self.serde.dumps(checkpoint),
+            self.serde.dumps(metadata) if metadata is not None else b"",
+            None if self.keep_latest_only else parent,
+        )
+        now = time.monotonic()
+        with self._lock:
+            sess = self._sessions.get(thread_id)
+            if sess is None:
+                sess = self._sessions[thread_id] = _Session()
+            if self.keep_latest_only:
+                sess.checkpoints.clear()
+            sess.checkpoints[ts] = saved
+            old_size, sess.size = sess.size, sum(len(c) + len(m) for c, m, _ in sess.checkpoints.values())
+            self._bytes += sess.size - old_size
+            sess.last_access = now
+            self._sessions.move_to_end(thread_id)
+            self._evict(now)
+        return {"configurable": {"thread_id": thread_id, "thread_ts": ts}}
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: RunnableConfig,
+        *,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Dict[str, Any], metadata: Any = None) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata)
+
+    # ---------- управление сессиями ----------
+    def delete_thread(self, thread_id: str) -> bool:
+        """
+        Удаляет состояние сессии.
+
+        Args:
+            thread_id: Идентификатор сессии.
+
+        Returns:
+            bool: True, если сессия существовала.
+        """
+        with self._lock:
+            if thread_id not in self._sessions:
+                return False
+            self._drop(thread_id, "ended")
+        self.log.info("session_store: сессия %s удалена", thread_id)
+        return True
+
+    def flush(self) -> None:
+        """Записи в памяти не буферизуются — сбрасывать нечего."""
+
+    def flush_thread(self, thread_id: str) -> None:
+        """Записи в памяти не буферизуются — сбрасывать нечего."""
+
+    def close(self) -> None:
+        """Ресурсов, требующих закрытия, нет."""
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики: живые сессии, занятая память, счётчики вытеснений."""
+        with self._lock:
+            self._evict(time.monotonic())
+            return {
+                "backend": "memory",
+                "live_sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "checkpoints": sum(len(s.checkpoints) for s in self._sessions.values()),
+                "evicted": dict(self._evicted),
+            }
+
+
+# ---------- дисковые бэкенды ----------
+# Блоки меньше порога не сжимаем: zlib на коротких строках только добавляет байты
+_COMPRESS_MIN_BYTES = 256
+
+
+def pack(data: bytes) -> bytes:
+    """Компактное представление блока: zlib, если это выгодно (префикс z/r)."""
+    if len(data) >= _COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return b"z" + compressed
+    return b"r" + data
+
+
+def unpack(blob: bytes) -> bytes:
+    """Обратное преобразование к `pack`."""
+    blob = bytes(blob)
+    return zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+
+
+@dataclass
+class _Record:
+    """
+    Запись последнего чекпоинта сессии, разложенного по полям.
+
+    full=True — поля заменяют сохранённые целиком; иначе `fields` — изменившиеся
+    поля, `removed` — исчезнувшие из состояния.
+    """
+
+    ts: str
+    parent: Optional[str]
+    skeleton: bytes
+    metadata: bytes
+    fields: Dict[str, bytes]
+    removed: Set[str] = field(default_factory=set)
+    full: bool = True
+
+    def merge(self, newer: "_Record") -> "_Record":
+        """Объединяет буферизованную запись с более новой (для пакетной записи)."""
+        if newer.full:
+            return newer
+        merged = dict(self.fields)
+        merged.update(newer.fields)
+        for name in newer.removed:
+            merged.pop(name, None)
+        return _Record(
+            ts=newer.ts,
+            parent=newer.parent,
+            skeleton=newer.skeleton,
+            metadata=newer.metadata,
+            fields=merged,
+            removed=(self.removed - set(newer.fields)) | newer.removed,
+            full=self.full,
+        )
+
+
+class _FieldCheckpointSaver(BaseCheckpointSaver, ABC):
+    """
+    Общая часть дисковых чекпоинтеров: хранится последний чекпоинт сессии,
+    `channel_values` раскладываются по полям и пишутся только изменившиеся.
+    """
+
+    backend = ""
+
+    def __init__(self, *, ttl_s: float, serde: Any = None, max_tracked_sessions: int = 10000) -> None:
+        super().__init__(serde=serde)
+        self.log = get_logger(__name__)
+        self.ttl_s = ttl_s
+        self.max_tracked_sessions = max_tracked_sessions
+        # thread_id -> (id последнего записанного чекпоинта, версии полей в нём)
+        self._versions: "OrderedDict[str, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        self._versions_lock = threading.Lock()
+        self._counters = {"puts": 0, "fields_written": 0, "fields_skipped": 0}
+
+    # ---------- хранение (реализуют бэкенды) ----------
+    @abstractmethod
+    def _write(self, thread_id: str, record: _Record) -> None:
+        """Записывает чекпоинт сессии (только изменившиеся поля, если `record.full` ложно)."""
+
+    @abstractmethod
+    def _read(self, thread_id: str) -> Optional[_Record]:
+        """Последний чекпоинт сессии со всеми полями (None — сессии нет или истёк TTL)."""
+
+    @abstractmethod
+    def _delete(self, thread_id: str) -> bool:
+        """Удаляет сессию; True, если она существовала."""
+
+    # ---------- разложение чекпоинта ----------
+    def _encode(self, thread_id: str, parent: Optional[str], checkpoint: Dict[str, Any], metadata: Any) -> _Record:
+        """
+        Раскладывает чекпоинт на «скелет» и поля. Если предыдущий чекпоинт сессии
+        записан этим процессом, пишутся только поля с изменившейся версией.
+        """
+        ts = checkpoint_id(checkpoint)
+        values = checkpoint.get("channel_values", {})
+        versions = dict(checkpoint.get("channel_versions", {}))
+        skeleton = {k: v for k, v in checkpoint.items() if k != "channel_values"}
+
+        with self._versions_lock:
+            prev = self._versions.get(thread_id)
+            self._versions[thread_id] = (ts, versions)
+            self._versions.move_to_end(thread_id)
+            while len(self._versions) > self.max_tracked_sessions:
+                self._versions.popitem(last=False)
+
+        full = prev is None or prev[0] != parent
+        prev_versions = {} if full else prev[1]
+        changed = {
+            name: pack(self.serde.dumps(value))
+            for name, value in values.items()
+            if full or versions.get(name) is None or prev_versions.get(name) != versions.get(name)
+        }
+        removed = set() if full else set(prev_versions) - set(values)
+        self._counters["puts"] += 1
+        self._counters["fields_written"] += len(changed)
+        self._counters["fields_skipped"] += len(values) - len(changed)
+        return _Record(
+            ts=ts,
+            parent=parent,
+            skeleton=pack(self.serde.dumps(skeleton)),
+            metadata=pack(self.serde.dumps(metadata)) if metadata is not None else b"",
+            fields=changed,
+            removed=removed,
+            full=full,
+        )
+
+    def _decode(self, thread_id: str, record: _Record) -> CheckpointTuple:
+        checkpoint = self.serde.loads(unpack(record.skeleton))
+        checkpoint["channel_values"] = {
+            name: self.serde.loads(unpack(blob)) for name, blob in record.fields.items()
+        }
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "thread_ts": record.ts}},
+            checkpoint=checkpoint,
+            metadata=self.serde.loads(unpack(record.metadata)) if record.metadata else {},
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "thread_ts": record.parent}} if record.parent else None
+            ),
+        )
+
+    # ---------- API чекпоинтера ----------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ts = config["configurable"].get("thread_ts")
+        record = self._read(thread_id)
+        if record is None or (ts and record.ts != ts):
+            return None
+        return self._decode(thread_id, record)
+
+    def list(
+        self,
+        config: RunnableConfig,
+        *,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Iterator[CheckpointTuple]:
+        # Хранится только последний чекпоинт сессии
+        before_ts = before["configurable"].get("thread_ts") if before else None
+        latest = self.get_tuple({"configurable": {"thread_id": config["configurable"]["thread_id"]}})
+        if latest and (limit is None or limit > 0) and (not before_ts or latest.config["configurable"]["thread_ts"] < before_ts):
+            yield latest
+
+    def put(self, config: RunnableConfig, checkpoint: Dict[str, Any], metadata: Any = None) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        record = self._encode(thread_id, config["configurable"].get("thread_ts"), checkpoint, metadata)
+        self._write(thread_id, record)
+        return {"configurable": {"thread_id": thread_id, "thread_ts": record.ts}}
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig,
+        *,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Dict[str, Any], metadata: Any = None) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata)
+
+    # ---------- управление сессиями ----------
+    def delete_thread(self, thread_id: str) -> bool:
+        """Удаляет состояние сессии; True, если сессия существовала."""
+        with self._versions_lock:
+            self._versions.pop(thread_id, None)
+        existed = self._delete(thread_id)
+        if existed:
+            self.log.info("session_store[%s]: сессия %s удалена", self.backend, thread_id)
+        return existed
+
+    def flush(self) -> None:
+        """Сбрасывает буферизованные записи (если бэкенд буферизует)."""
+
+    def flush_thread(self, thread_id: str) -> None:
+        """Сбрасывает буферизованную запись сессии (вызывается в конце запуска графа)."""
+
+    def close(self) -> None:
+        """Освобождает ресурсы бэкенда."""
+
+
+class SqliteCheckpointSaver(_FieldCheckpointSaver):
+    """
+    Чекпоинтер в SQLite (WAL). `put` кладёт запись в буфер (несколько шагов
+    графа одной сессии схлопываются в одну запись), фоновый поток сбрасывает
+    буфер одной транзакцией каждые `flush_interval_s`. Чтение учитывает буфер.
+    Конец запуска сбрасывает запись сессии синхронно (`flush_thread`), поэтому
+    буферизуются только промежуточные шаги: другой воркер сразу видит итог запуска.
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl_s: float,
+        max_sessions: int,
+        flush_interval_s: float = 0.05,
+        cleanup_interval_s: float = 60.0,
+        serde: Any = None,
+    ) -> None:
+        """
+        Args:
+            path: Путь к файлу базы.
+            ttl_s: Время жизни сессии с последней записи (<= 0 — без TTL).
+            max_sessions: Максимум сессий (самые давние удаляются при очистке).
+            flush_interval_s: Период сброса буфера записей.
+            cleanup_interval_s: Период удаления просроченных сессий.
+            serde: Сериализатор (по умолчанию — сериализатор LangGraph).
+        """
+        super().__init__(ttl_s=ttl_s, serde=serde)
+        self.path = path
+        self.max_sessions = max_sessions
+        self.flush_interval_s = flush_interval_s
+        self.cleanup_interval_s = cleanup_interval_s
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " thread_id TEXT PRIMARY KEY, thread_ts TEXT NOT NULL, parent_ts TEXT,"
+            " skeleton BLOB NOT NULL, metadata BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_fields ("
+            " thread_id TEXT NOT NULL, field TEXT NOT NULL, value BLOB NOT NULL,"
+            " PRIMARY KEY (thread_id, field))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+        # Порядок захвата: _db_lock, затем _pending_lock. Сброс держит _db_lock
+        # от изъятия буфера до COMMIT, поэтому читатель видит запись либо в буфере, либо в базе.
+        self._db_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending: Dict[str, _Record] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_cleanup = 0.0
+        self._counters.update({"flushes": 0, "flushed_sessions": 0, "flush_errors": 0, "expired": 0})
+        self._flusher = threading.Thread(target=self._flush_loop, name="sqlite-checkpoint-flush", daemon=True)
+        self._flusher.start()
+
+    # ---------- буфер и фоновый сброс ----------
+    def _write(self, thread_id: str, record: _Record) -> None:
+        with self._pending_lock:
+            prev = self._pending.get(thread_id)
+            self._pending[thread_id] = prev.merge(record) if prev else record
+
+    def _flush_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.time() - self._last_cleanup >= self.cleanup_interval_s:
+                    self._cleanup()
+            except Exception as e:
+                self._counters["flush_errors"] += 1
+                self.log.error("session_store[sqlite]: ошибка сброса: %s", e)
+
+    def flush(self) -> None:
+        """Записывает буфер в базу одной транзакцией."""
+        self._flush(None)
+
+    def flush_thread(self, thread_id: str) -> None:
+        """Записывает в базу буферизованную запись одной сессии."""
+        self._flush(thread_id)
+
+    def _flush(self, thread_id: Optional[str]) -> None:
+        """Сброс буфера (thread_id=None — весь буфер, иначе — только эта сессия)."""
+        with self._db_lock:
+            with self._pending_lock:
+                if thread_id is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    rec = self._pending.pop(thread_id, None)
+                    batch = {thread_id: rec} if rec is not None else {}
+            if not batch:
+                return
+            now = time.time()
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for thread_id, rec in batch.items():
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sessions (thread_id, thread_ts, parent_ts, skeleton, metadata, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (thread_id, rec.ts, rec.parent, rec.skeleton, rec.metadata, now),
+                    )
+                    if rec.full:
+                        self._conn.execute("DELETE FROM session_fields WHERE thread_id = ?", (thread_id,))
+                    elif rec.removed:
+                        self._conn.executemany(
+                            "DELETE FROM session_fields WHERE thread_id = ? AND field = ?",
+                            [(thread_id, name) for name in rec.removed],
+                        )
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO session_fields (thread_id, field, value) VALUES (?, ?, ?)",
+                        [(thread_id, name, blob) for name, blob in rec.fields.items()],
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # Возвращаем пакет в буфер, не затирая более новые записи
+                with self._pending_lock:
+                    for thread_id, rec in batch.items():
+                        newer = self._pending.get(thread_id)
+                        self._pending[thread_id] = rec.merge(newer) if newer else rec
+                raise
+            self._counters["flushes"] += 1
+            self._counters["flushed_sessions"] += len(batch)
+
+    def _cleanup(self) -> None:
+        """Удаляет просроченные сессии и самые давние сверх лимита."""
+        self._last_cleanup = time.time()
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = []
+                if self.ttl_s > 0:
+                    stale = [r[0] for r in self._conn.execute(
+                        "SELECT thread_id FROM sessions WHERE updated_at < ?", (self._last_cleanup - self.ttl_s,)
+                    )]
+                excess = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - len(stale) - self.max_sessions
+                if excess > 0:
+                    stale += [r[0] for r in self._conn.execute(
+                        "SELECT thread_id FROM sessions WHERE updated_at >= ? ORDER BY updated_at LIMIT ?",
+                        (self._last_cleanup - self.ttl_s if self.ttl_s > 0 else 0.0, excess),
+                    )]
+                for thread_id in stale:
+                    self._conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+                    self._conn.execute("DELETE FROM session_fields WHERE thread_id = ?", (thread_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._counters["expired"] += len(stale)
+
+    # ---------- чтение ----------
+    def _read(self, thread_id: str) -> Optional[_Record]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT thread_ts, parent_ts, skeleton, metadata, updated_at FROM sessions WHERE thread_id = ?",
+                (thread_id,),
+            ).fetchone()
+            stored = None
+            if row is not None and (self.ttl_s <= 0 or row[4] >= time.time() - self.ttl_s):
+                fields = dict(self._conn.execute(
+                    "SELECT field, value FROM session_fields WHERE thread_id = ?", (thread_id,)
+                ).fetchall())
+                stored = _Record(ts=row[0], parent=row[1], skeleton=row[2], metadata=row[3], fields=fields)
+            with self._pending_lock:
+                pending = self._pending.get(thread_id)
+        if pending is None:
+            return stored
+        return stored.merge(pending) if stored else pending
+
+    def _delete(self, thread_id: str) -> bool:
+        with self._db_lock:
+            with self._pending_lock:
+                was_pending = self._pending.pop(thread_id, None) is not None
+            cur = self._conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM session_fields WHERE thread_id = ?", (thread_id,))
+        return was_pending or cur.rowcount > 0
+
+    def close(self) -> None:
+        """Останавливает фоновый сброс, записывает буфер и закрывает базу."""
+        self._stop.set()
+        self._wake.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db_lock:
+            sessions, meta_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(skeleton) + LENGTH(metadata)), 0) FROM sessions"
+            ).fetchone()
+            field_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM session_fields"
+            ).fetchone()[0]
+            with self._pending_lock:
+                pending = len(self._pending)
+        return {
+            "backend": "sqlite",
+            "live_sessions": sessions,
+            "bytes": meta_bytes + field_bytes,
+            "pending_writes": pending,
+            **self._counters,
+        }
+
+
+class RedisCheckpointSaver(_FieldCheckpointSaver):
+    """
+    Чекпоинтер в Redis-совместимом хранилище: сессия — hash
+    (`_ts`, `_parent`, `_skeleton`, `_meta`, `f:<поле>`), запись — один pipeline,
+    TTL продлевается при каждом обращении.
+    """
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        client: Any = None,
+        url: Optional[str] = None,
+        *,
+        ttl_s: float,
+        prefix: str = "agent:session:",
+        serde: Any = None,
+    ) -> None:
+        """
+        Args:
+            client: Готовый клиент (redis.Redis или совместимый).
+            url: URL Redis, если client не передан (нужен пакет redis).
+            ttl_s: Время жизни сессии с последнего обращения (<= 0 — без TTL).
+            prefix: Префикс ключей.
+            serde: Сериализатор (по умолчанию — сериализатор LangGraph).
+        """
+        super().__init__(ttl_s=ttl_s, serde=serde)
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("Для checkpointer_backend=redis нужен пакет redis") from e
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+        self.prefix = prefix
+
+    def _touch(self, pipe: Any, key: str) -> None:
+        if self.ttl_s > 0:
+            pipe.expire(key, max(1, int(self.ttl_s)))
+
+    def _write(self, thread_id: str, record: _Record) -> None:
+        key = self.prefix + thread_id
+        mapping = {"_ts": record.ts, "_parent": record.parent or "", "_skeleton": record.skeleton, "_meta": record.metadata}
+        mapping.update({"f:" + name: blob for name, blob in record.fields.items()})
+        pipe = self._client.pipeline()
+        if record.full:
+            pipe.delete(key)
+        elif record.removed:
+            pipe.hdel(key, *["f:" + name for name in record.removed])
+        pipe.hset(key, mapping=mapping)
+        self._touch(pipe, key)
+        pipe.execute()
+
+    @staticmethod
+    def _text(value: Any) -> str:
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _read(self, thread_id: str) -> Optional[_Record]:
+        key = self.prefix + thread_id
+        raw = {self._text(k): v for k, v in (self._client.hgetall(key) or {}).items()}
+        if "_ts" not in raw:
+            return None
+        if self.ttl_s > 0:
+            self._client.expire(key, max(1, int(self.ttl_s)))
+        return _Record(
+            ts=self._text(raw["_ts"]),
+            parent=self._text(raw.get("_parent")) or None,
+            skeleton=raw["_skeleton"],
+            metadata=raw.get("_meta") or b"",
+            fields={k[2:]: v for k, v in raw.items() if k.startswith("f:")},
+        )
+
+    def _delete(self, thread_id: str) -> bool:
+        return bool(self._client.delete(self.prefix + thread_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "prefix": self.prefix, **self._counters}
+
+
+def make_checkpointer(cfg) -> BaseCheckpointSaver:
+    """
+    Создаёт чекпоинтер агента по настройкам (checkpointer_backend: memory | sqlite | redis).
+
+    Args:
+        cfg: LLMSettings.
+
+    Returns:
+        BaseCheckpointSaver: Чекпоинтер сессий.
+    """
+    if cfg.checkpointer_backend == "sqlite":
+        return SqliteCheckpointSaver(
+            cfg.checkpointer_sqlite_path,
+            ttl_s=cfg.session_ttl_s,
+            max_sessions=cfg.session_max_count,
+            flush_interval_s=cfg.checkpointer_flush_interval_s,
+        )
+    if cfg.checkpointer_backend == "redis":
+        return RedisCheckpointSaver(url=cfg.checkpointer_redis_url, ttl_s=cfg.session_ttl_s)
+    return BoundedMemorySaver(
+        ttl_s=cfg.session_ttl_s,
+        max_sessions=cfg.session_max_count,
+        max_bytes=cfg.session_max_bytes,
+        keep_latest_only=cfg.session_keep_latest_only,
+    )
@@ -1,23 +1,30 @@
-from typing import Literal
+from typing import Dict, List, Literal, Optional, Tuple
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr, Field
 import json
 import os
+import threading
+import time
 
 ProviderName = Literal["openai", "openrouter", "mistral"]
 
 
+def app_settings_path() -> str:
+    """Путь к app_settings.json (переопределяется переменной окружения APP_SETTINGS_PATH)."""
+    return os.getenv("APP_SETTINGS_PATH") or os.path.join(os.path.dirname(__file__), "app_settings.json")
+
+
+def system_prompt_path() -> str:
+    """Путь к файлу системного промпта."""
+    return os.path.join(os.path.dirname(__file__), "prompts", "system_prompt.txt")
+
+
 def load_app_settings():
     """Загружает настройки из app_settings.json или из переменной окружения APP_SETTINGS_PATH."""
-    # Проверяем переменную окружения для кастомного пути
-    custom_path = os.getenv("APP_SETTINGS_PATH")
-    if custom_path:
-        app_settings_path = custom_path
-    else:
-        app_settings_path = os.path.join(os.path.dirname(__file__), "app_settings.json")
-    
-    if os.path.exists(app_settings_path):
-        with open(app_settings_path, "r", encoding="utf-8") as f:
+    app_settings_path_ = app_settings_path()
+
+    if os.path.exists(app_settings_path_):
+        with open(app_settings_path_, "r", encoding="utf-8") as f:
             return json.load(f)
     return {}
 
@@ -59,6 +66,98 @@ class LLMSettings(BaseSettings):
     retry_base_s: float = 1.0
     retry_max_s: float = 20.0
     retry_jitter_s: float = 0.5
+    # Бюджет на все попытки и паузы одного вызова (None — request_timeout_s)
+    retry_deadline_s: float | None = None
+    # Число ретраев по операциям (override max_retries): проверка ключа не ретраится
+    retry_max_retries_by_op: Dict[str, int] = Field(default={"validate_api_key": 0})
+
+    # Параллелизм батч-генерации: общий лимит и override по провайдеру ({"openrouter": 2})
+    llm_max_concurrency: int = 4
+    llm_max_concurrency_by_provider: Dict[str, int] = Field(default={})
+
+    # Failover чата: запасные провайдеры после default_provider (только с ключом) и выбор по задержке
+    llm_fallback_providers: List[str] = Field(default=[])
+    llm_latency_aware_routing: bool = True
+    llm_failover_max_retries: int = 1              # ретраев у провайдера, если впереди есть запасной
+    # Circuit breaker провайдера: ошибок подряд до размыкания, пауза до пробы, порог «медленного» вызова
+    breaker_failure_threshold: int = 3
+    breaker_open_s: float = 30.0
+    breaker_latency_threshold_s: float | None = 30.0
+    # Хедж медленных вызовов: дубликат после перцентиля задержки, только для перечисленных узлов графа
+    hedge_enabled: bool = False
+    hedge_nodes: List[str] = Field(default=["planner", "direct_answer"])
+    hedge_percentile: float = 0.95
+    hedge_min_delay_s: float = 0.5
+    hedge_min_samples: int = 20                  # замеров provider:model до первого хеджа
+    hedge_budget_per_minute: int = 10            # дубликатов в минуту на процесс
+    hedge_provider: str | None = None            # куда слать дубликат (None — тот же провайдер)
+    # Кэш префикса промпта у провайдера: пометка cache_control системного промпта для моделей OpenRouter
+    prompt_cache_control: bool = True
+    prompt_cache_control_models: List[str] = Field(default=["anthropic/", "google/gemini"])
+
+    # Клиентский лимит частоты: {"provider:model" | "provider": лимит в минуту}, пусто — без лимита
+    rate_limit_rpm: Dict[str, int] = Field(default={})
+    rate_limit_tpm: Dict[str, int] = Field(default={})
+    rate_limit_completion_tokens: int = 512      # оценка ответа для TPM, если max_tokens не задан
+    rate_limit_max_wait_s: float | None = None   # ожидание очереди (None — request_timeout_s)
+
+    # Роутер намерений: уровень эмбеддингов (nearest centroid) и его пороги уверенности
+    intent_router_embeddings: bool = True
+    intent_embedding_threshold: float = 0.5
+    intent_embedding_margin: float = 0.05
+    # Микробатчинг уровня llm роутера: вопросов в одном вызове (1 — выключен) и ожидание попутчиков
+    intent_llm_batch_size: int = 8
+    intent_llm_batch_wait_ms: float = 5.0
+    # Ответ уровня llm роутера: схема (tools/tool_choice или JSON mode у Mistral) и лимит токенов на вопрос
+    intent_structured_output: bool = True
+    intent_llm_max_tokens: int = 16
+    # Поиск в RAG параллельно с классификацией (если правила не решили маршрут); лишний — отменяется
+    speculative_retrieval: bool = True
+    # Контекст RAG: порог почти-дубликатов (Jaccard по 3-граммам слов) и бюджет фрагментов в промпте
+    rag_dedup_threshold: float = 0.9
+    rag_context_max_tokens: int = 3000
+    # Кэш результатов rag_search / rag_generate по нормализованному запросу и параметрам (LRU + TTL)
+    rag_cache_enabled: bool = True
+    rag_cache_ttl_s: float = 300.0
+    rag_cache_max_entries: int = 1024
+
+    # Кэш ответов (RAG и прямые ответы): бэкенд memory | sqlite | redis, TTL, лимиты, порог сходства
+    response_cache_enabled: bool = True
+    response_cache_backend: str = "memory"
+    response_cache_intents: List[str] = Field(default=["general", "rag_answer"])
+    response_cache_ttl_s: float = 3600.0
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entries: int = 10000
+    response_cache_semantic: bool = True
+    response_cache_similarity: float = 0.92
+    response_cache_sqlite_path: str = "data/response_cache.sqlite3"
+    response_cache_redis_url: str | None = None
+
+    # Сессии (чекпоинты графа): TTL с последнего обращения, LRU-лимиты, только последний чекпоинт
+    session_ttl_s: float = 3600.0
+    session_max_count: int = 10000
+    session_max_bytes: int = 256 * 1024 * 1024
+    session_keep_latest_only: bool = True
+    # Бэкенд чекпоинтов: memory (один процесс) | sqlite (WAL, переживает рестарт) | redis (общий для подов)
+    checkpointer_backend: str = "memory"
+    checkpointer_sqlite_path: str = "data/sessions.sqlite3"
+    checkpointer_redis_url: str | None = None
+    checkpointer_flush_interval_s: float = 0.05
+    # Повтор того же запроса сессии получает ответ идущего запуска; с Idempotency-Key — ещё столько секунд после него
+    session_dedup_ttl_s: float = 30.0
+
+    # Контроль допуска /api/agent/*: одновременных запусков на воркер, очередь (общая и на сессию), ожидание
+    admission_max_concurrency: int = 8
+    admission_max_queue: int = 64
+    admission_max_queue_per_session: int = 4
+    admission_max_wait_s: float | None = 30.0
+    # Пакетный запуск /api/agent/run_batch: одновременных элементов пакета и максимум элементов в запросе
+    batch_max_concurrency: int = 4
+    batch_max_items: int = 500
+
+    # Кэш состояния ключей API: TTL для живого ключа и для отказа авторизации (401/403)
+    key_health_ttl_s: float = 600.0
+    key_health_negative_ttl_s: float = 60.0
 
     # ---- External MCPs & App-level settings ----
     # (URLs можно задавать через переменные окружения CONTEXT7_URL, TAVILY_URL, ADDITION_SERVICE_URL, RAG_SERVICE_URL, TEST_GENERATOR_SERVICE_URL)
@@ -70,8 +169,15 @@ class LLMSettings(BaseSettings):
     context7_api_key: SecretStr | None = Field(default=None)
     http_timeout_s: float = Field(default=60.0)
 
-    # Батч для эмбеддингов
+    # Пул HTTP-соединений к внешним сервисам (один пул на сервис)
+    http_max_connections: int = Field(default=100)
+    http_max_keepalive_connections: int = Field(default=20)
+    http_keepalive_expiry_s: float = Field(default=30.0)
+    http2_enabled: bool = Field(default=True)
+
+    # Батч для эмбеддингов и число чанков, отправляемых параллельно
     emb_batch_size: int = Field(default=64)
+    emb_max_in_flight: int = Field(default=4)
 
     # ---- Mistral ----
     mistral_chat_model: str = Field(default="mistral-large-latest")
@@ -81,6 +187,12 @@ class LLMSettings(BaseSettings):
     # ---- Системный промпт ----
     system_prompt: str = Field(default="")
 
+    # ---- Горячая перезагрузка настроек ----
+    # Раз в settings_reload_check_s get_settings() сверяет mtime app_settings.json, .env и
+    # системного промпта и пересоздаёт настройки при изменении
+    settings_hot_reload: bool = Field(default=False)
+    settings_reload_check_s: float = Field(default=2.0)
+
     def __init__(self, **kwargs):
         """Инициализирует настройки, загружая значения из app_settings.json."""
         super().__init__(**kwargs)
@@ -98,18 +210,75 @@ class LLMSettings(BaseSettings):
         
         # Загружаем системный промпт из файла, если он не был переопределён
         if not self.system_prompt:
-            system_prompt_path = os.path.join(os.path.dirname(__file__), "prompts", "system_prompt.txt")
-            if os.path.exists(system_prompt_path):
-                with open(system_prompt_path, "r", encoding="utf-8") as f:
+            prompt_path = system_prompt_path()
+            if os.path.exists(prompt_path):
+                with open(prompt_path, "r", encoding="utf-8") as f:
                     self.system_prompt = f.read().strip()
 
 
+# ---- Кэш настроек ----
+_settings_lock = threading.Lock()
+_settings: Optional[LLMSettings] = None
+_settings_path: Optional[str] = None            # APP_SETTINGS_PATH, для которого построены настройки
+_settings_mtimes: Tuple[Optional[int], ...] = ()
+_settings_checked_at = 0.0
+
+
+def _source_mtimes() -> Tuple[Optional[int], ...]:
+    """mtime файлов-источников настроек (None — файла нет)."""
+    mtimes = []
+    for path in (app_settings_path(), ".env", system_prompt_path()):
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def reload_settings() -> LLMSettings:
+    """
+    Перечитывает настройки (env, .env, app_settings.json, системный промпт)
+    и заменяет закэшированный экземпляр.
+    """
+    global _settings, _settings_path, _settings_mtimes, _settings_checked_at
+    with _settings_lock:
+        mtimes = _source_mtimes()
+        fresh = LLMSettings()
+        _settings, _settings_path, _settings_mtimes = fresh, os.getenv("APP_SETTINGS_PATH"), mtimes
+        _settings_checked_at = time.monotonic()
+        return fresh
+
+
+def invalidate_settings() -> None:
+    """Сбрасывает кэш: следующий get_settings() перечитает настройки."""
+    global _settings
+    with _settings_lock:
+        _settings = None
+
+
 def get_settings() -> LLMSettings:
     """
-    Возвращает НОВЫЙ экземпляр настроек.
-    (Без синглтона: каждый вызов создаёт объект заново.)
+    Возвращает закэшированный экземпляр настроек (общий для процесса).
+
+    Настройки перечитываются при смене APP_SETTINGS_PATH, после invalidate_settings()
+    и — если включён settings_hot_reload — при изменении mtime app_settings.json,
+    .env или системного промпта (проверка не чаще раза в settings_reload_check_s).
+    Экземпляр не следует изменять: он общий для всех потребителей.
     """
-    return LLMSettings()
+    global _settings_checked_at
+    current = _settings
+    if current is None or _settings_path != os.getenv("APP_SETTINGS_PATH"):
+        return reload_settings()
+    if not current.settings_hot_reload:
+        return current
+
+    now = time.monotonic()
+    if now - _settings_checked_at < current.settings_reload_check_s:
+        return current
+    with _settings_lock:
+        _settings_checked_at = now
+        changed = _source_mtimes() != _settings_mtimes
+    return reload_settings() if changed else current
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+"""
+Спекулятивный поиск в RAG, пока планировщик ещё выбирает намерение.
+
+Два из четырёх намерений (rag_answer, generate_quiz) всегда требуют поиска,
+поэтому, если правила не решили маршрут, `rag_search` запускается параллельно
+с классификацией. Узел retrieve забирает готовый (или ещё идущий) результат,
+а при маршруте без поиска он отменяется. Результат живёт в слоте одного запуска
+графа (`scope()`), между запусками и сессиями он не переиспользуется.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from logger import get_logger
+
+# Слот текущего запуска графа: {"query": ..., "pending": Future | asyncio.Task}.
+# Задаётся на время запуска и наследуется узлами через контекст; вне запуска — None.
+_slot: ContextVar[Optional[Dict[str, Any]]] = ContextVar("speculative_retrieval", default=None)
+
+
+class SpeculativeRetrieval:
+    """Запуск поиска заранее и учёт попаданий/промахов."""
+
+    def __init__(
+        self,
+        search: Callable[[str], Any],
+        asearch: Callable[[str], Awaitable[Any]],
+        max_workers: int = 4,
+    ) -> None:
+        """
+        Args:
+            search: Синхронный поиск (rag_search).
+            asearch: Асинхронный поиск (arag_search).
+            max_workers: Потоков для спекулятивного поиска в sync-режиме.
+        """
+        self.log = get_logger(__name__)
+        self._search = search
+        self._asearch = asearch
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-speculative")
+        self._lock = threading.Lock()
+        self._stats = {"launched": 0, "hits": 0, "wasted": 0, "failed": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    @contextmanager
+    def scope(self) -> Iterator[None]:
+        """Слот на время одного запуска графа; невостребованный поиск отменяется на выходе."""
+        token = _slot.set({})
+        try:
+            yield
+        finally:
+            self.discard()
+            _slot.reset(token)
+
+    # ---------- запуск ----------
+    def _begin(self, query: str) -> Optional[Dict[str, Any]]:
+        slot = _slot.get()
+        if slot is None:
+            return None
+        self.discard()
+        slot["query"] = query
+        self._count("launched")
+        return slot
+
+    def start(self, query: str) -> bool:
+        """
+        Запускает поиск в фоновом потоке.
+
+        Returns:
+            bool: False — запуск вне `scope()`, поиск не начат.
+        """
+        slot = self._begin(query)
+        if slot is None:
+            return False
+        slot["pending"] = self._pool.submit(self._search, query)
+        return True
+
+    def astart(self, query: str) -> bool:
+        """Асинхронный аналог `start`: поиск — задача в текущем event loop."""
+        slot = self._begin(query)
+        if slot is None:
+            return False
+        slot["pending"] = asyncio.create_task(self._asearch(query))
+        return True
+
+    # ---------- исход ----------
+    def _pop(self, query: str) -> Optional[Any]:
+        slot = _slot.get()
+        if not slot or "pending" not in slot:
+            return None
+        if slot.get("query") != query:
+            self.discard()
+            return None
+        slot.pop("query", None)
+        return slot.pop("pending")
+
+    def take(self, query: str) -> Optional[Any]:
+        """
+        Забирает результат спекулятивного поиска по тому же запросу (дожидаясь его).
+
+        Returns:
+            Результат поиска или None — поиска не было или он упал (тогда искать заново).
+        """
+        pending: Optional[Future] = self._pop(query)
+        if pending is None:
+            return None
+        try:
+            result = pending.result()
+        except Exception as e:
+            self.log.warning("speculative retrieve: ошибка %s", repr(e))
+            self._count("failed")
+            return None
+        self._count("hits")
+        return result
+
+    async def atake(self, query: str) -> Optional[Any]:
+        """Асинхронный аналог `take`."""
+        pending: Optional[asyncio.Task] = self._pop(query)
+        if pending is None:
+            return None
+        try:
+            result = await pending
+        except Exception as e:
+            self.log.warning("speculative retrieve: ошибка %s", repr(e))
+            self._count("failed")
+            return None
+        self._count("hits")
+        return result
+
+    def discard(self) -> None:
+        """Отменяет невостребованный поиск (маршрут без retrieve) и считает его потерей."""
+        slot = _slot.get()
+        pending = slot.pop("pending", None) if slot else None
+        if pending is None:
+            return
+        slot.pop("query", None)
+        pending.cancel()
+        self._count("wasted")
+
+    def stats(self) -> Dict[str, Any]:
+        """Запуски, попадания (результат использован), потери и доля попаданий."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats["hit_ratio"] = stats["hits"] / stats["launched"] if stats["launched"] else 0.0
+        return stats
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Тест для проверки контроля допуска запросов"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_limits_and_rejections():
+    """Параллелизм ограничен; полная очередь — 503, доля сессии — 429, таймаут — 503"""
+
+    async def main():
+        ctl = AdmissionController(max_concurrency=1, max_queue=2, max_queue_per_session=1, max_wait_s=0.05)
+        first = await ctl.acquire("a")
+        waiting = asyncio.create_task(ctl.acquire("b"))
+        await asyncio.sleep(0)
+        try:
+            await ctl.acquire("b")
+            assert False, "ожидался отказ по доле сессии"
+        except AdmissionRejected as e:
+            assert e.status == 429 and e.retry_after >= 1
+        third = asyncio.create_task(ctl.acquire("c"))
+        await asyncio.sleep(0)
+        try:
+            await ctl.acquire("d")
+            assert False, "ожидался отказ по полной очереди"
+        except AdmissionRejected as e:
+            assert e.status == 503
+
+        ctl.release(first)
+        second = await waiting
+        try:
+            await third
+            assert False, "ожидался таймаут ожидания"
+        except AdmissionRejected as e:
+            assert e.status == 503
+        ctl.release(second)
+        ctl.release(second)  # повторное освобождение ничего не делает
+        stats = ctl.stats()
+        assert stats["active"] == 0 and stats["queue_depth"] == 0
+        assert stats["rejected_session"] == 1 and stats["rejected_queue_full"] == 1 and stats["timeouts"] == 1
+
+    asyncio.run(main())
+
+
+def test_round_robin_between_sessions():
+    """Освободившееся место получает следующая сессия, а не следующий запрос той же сессии"""
+
+    async def main():
+        ctl = AdmissionController(max_concurrency=1, max_queue=10, max_queue_per_session=5, max_wait_s=None)
+        order = []
+
+        async def request(session):
+            async with ctl.admit(session):
+                order.append(session)
+                await asyncio.sleep(0.001)
+
+        holder = await ctl.acquire("busy")
+        tasks = [asyncio.create_task(request(s)) for s in ("a", "a", "a", "b", "c")]
+        await asyncio.sleep(0)
+        ctl.release(holder)
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c", "a", "a"]
+        assert ctl.stats()["service_time"]["avg_s"] > 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_frees_queue():
+    """Клиент ушёл из очереди — место в очереди освобождается"""
+
+    async def main():
+        ctl = AdmissionController(max_concurrency=1, max_queue=1, max_queue_per_session=1, max_wait_s=None)
+        holder = await ctl.acquire("a")
+        waiter = asyncio.create_task(ctl.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        assert ctl.stats()["queue_depth"] == 0
+        ctl.release(holder)
+        assert ctl.stats()["active"] == 0
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    test_limits_and_rejections()
+    test_round_robin_between_sessions()
+    test_cancelled_waiter_frees_queue()
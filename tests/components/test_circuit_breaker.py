@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Тест для проверки circuit breaker провайдеров"""
+
+import sys
+import os
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_opens_after_consecutive_failures_and_probes():
+    """closed → open после ошибок подряд → half-open с одной пробой → closed"""
+    breaker = CircuitBreaker("openrouter", failure_threshold=2, open_s=0.05, latency_threshold_s=None)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow() and not breaker.available()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()          # пробная попытка
+    assert not breaker.allow()      # вторая — отклонена, пока проба не завершилась
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_half_open_failure_reopens():
+    """Ошибка пробной попытки снова размыкает автомат"""
+    breaker = CircuitBreaker("mistral", failure_threshold=1, open_s=0.05, latency_threshold_s=None)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened"] == 2
+
+
+def test_latency_spikes_count_as_failures():
+    """Медленные успешные вызовы считаются отказами; EWMA задержки обновляется"""
+    breaker = CircuitBreaker("openai", failure_threshold=2, open_s=30, latency_threshold_s=1.0)
+    breaker.record_success(0.5)
+    assert breaker.latency_ewma_s == 0.5
+    breaker.record_success(5.0)
+    breaker.record_success(5.0)
+    assert breaker.state == OPEN
+    assert breaker.stats()["slow_calls"] == 2 and breaker.latency_ewma_s > 0.5
+
+
+def test_skipped_call_frees_probe_without_counting():
+    """Пропуск (ошибка не провайдера) не считается отказом и освобождает пробу half-open"""
+    breaker = CircuitBreaker("openai", failure_threshold=1, open_s=0.05, latency_threshold_s=None)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_skipped()
+    assert breaker.state == HALF_OPEN and breaker.allow()
+    assert breaker.stats()["failures"] == 1 and breaker.stats()["opened"] == 1
+
+
+if __name__ == "__main__":
+    test_opens_after_consecutive_failures_and_probes()
+    test_half_open_failure_reopens()
+    test_latency_spikes_count_as_failures()
+    test_skipped_call_frees_probe_without_counting()
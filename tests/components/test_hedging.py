@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Тест для проверки хеджирования вызовов LLM"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.hedging import HedgeBudget, Hedger, LatencyTracker
+
+
+def _cfg(budget: int = 10):
+    return SimpleNamespace(
+        hedge_percentile=0.95, hedge_min_samples=5, hedge_min_delay_s=0.01, hedge_budget_per_minute=budget
+    )
+
+
+def test_percentile_needs_min_samples():
+    """Перцентиль считается только после min_samples замеров"""
+    tracker = LatencyTracker()
+    for s in (0.1, 0.2, 0.3, 0.4):
+        tracker.observe("openai:gpt", s)
+    assert tracker.percentile("openai:gpt", 0.95, 5) is None
+    for s in [0.1] * 15 + [2.0]:
+        tracker.observe("openai:gpt", s)
+    assert tracker.percentile("openai:gpt", 0.95, 5) == 0.4
+    assert tracker.percentile("openai:gpt", 1.0, 5) == 2.0
+
+
+def test_budget_per_minute():
+    """Бюджет не пропускает больше per_minute дубликатов"""
+    budget = HedgeBudget()
+    assert budget.try_spend(2) and budget.try_spend(2)
+    assert not budget.try_spend(2)
+
+
+def test_fast_primary_is_not_hedged():
+    """Быстрый основной вызов дубликат не запускает"""
+    hedger = Hedger(max_workers=2)
+    calls = []
+    assert hedger.run(lambda: "primary", lambda: calls.append(1) or "backup", 0.5, _cfg()) == "primary"
+    assert calls == []
+    assert hedger.stats()["hedged"] == 0
+
+
+def test_slow_failing_primary_is_covered_by_backup():
+    """Sync: основной вызов идёт в потоке вызывающего, дубликат — в пуле; при ошибке основного берётся дубликат"""
+    hedger = Hedger(max_workers=2)
+    threads = []
+
+    def slow_failing():
+        threads.append(threading.get_ident())
+        time.sleep(0.1)
+        raise TimeoutError("slow")
+
+    def backup():
+        threads.append(threading.get_ident())
+        return "backup"
+
+    assert hedger.run(slow_failing, backup, 0.02, _cfg()) == "backup"
+    assert threads[0] == threading.get_ident() and threads[1] != threading.get_ident()
+    stats = hedger.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_successful_primary_skips_pending_backup():
+    """Успешный основной ответ берётся; дубликат, не дождавшийся потока пула, не выполняется"""
+    hedger = Hedger(max_workers=1)
+    release = threading.Event()
+    hedger._pool.submit(release.wait)  # единственный поток пула занят
+    calls = []
+
+    def slow():
+        time.sleep(0.05)
+        return "primary"
+
+    assert hedger.run(slow, lambda: calls.append(1) or "backup", 0.01, _cfg()) == "primary"
+    release.set()
+    hedger._pool.shutdown(wait=True)
+    assert calls == []
+    assert hedger.stats()["hedged"] == 1 and hedger.stats()["hedge_wins"] == 0
+
+
+def test_budget_exhausted_waits_for_primary():
+    """Без бюджета дубликат не запускается — ждём основной вызов"""
+    hedger = Hedger(max_workers=2)
+
+    def slow():
+        time.sleep(0.05)
+        return "primary"
+
+    assert hedger.run(slow, lambda: "backup", 0.01, _cfg(budget=0)) == "primary"
+    assert hedger.stats()["budget_exhausted"] == 1
+
+
+def test_async_loser_is_cancelled():
+    """Async: проигравшая задача отменяется, ошибка одной из копий не мешает другой"""
+    hedger = Hedger(max_workers=1)
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "primary"
+
+    async def fast():
+        return "backup"
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    async def main():
+        assert await hedger.arun(slow, fast, 0.02, _cfg()) == "backup"
+        await asyncio.sleep(0)
+        assert cancelled == [True]
+        assert await hedger.arun(lambda: asyncio.sleep(0.1, result="primary"), failing, 0.02, _cfg()) == "primary"
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    test_percentile_needs_min_samples()
+    test_budget_per_minute()
+    test_fast_primary_is_not_hedged()
+    test_slow_failing_primary_is_covered_by_backup()
+    test_successful_primary_skips_pending_backup()
+    test_budget_exhausted_waits_for_primary()
+    test_async_loser_is_cancelled()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Тест для проверки пула HTTP-клиентов внешних сервисов"""
+
+import asyncio
+import sys
+import os
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from http_pool import HTTPClientPool, service_key
+
+
+def test_service_key():
+    """Ключ пула — origin сервиса с портом по умолчанию"""
+    assert service_key("http://rag:8000/api/search?q=1") == "http://rag:8000"
+    assert service_key("https://example.com/x") == "https://example.com:443"
+    assert service_key("http://example.com/x") == "http://example.com:80"
+
+
+def test_sync_clients_reused_per_service_and_closed():
+    """Один sync-клиент на сервис; close() закрывает их, следующий вызов создаёт новый"""
+    pool = HTTPClientPool()
+    a = pool.client("http://rag:8000/search")
+    assert pool.client("http://rag:8000/generate") is a
+    b = pool.client("http://tests:8001/generate")
+    assert b is not a
+
+    pool.close()
+    assert a.is_closed and b.is_closed
+    assert pool.client("http://rag:8000/search") is not a
+    pool.close()
+
+
+def test_async_clients_per_loop():
+    """Async-клиент переиспользуется в цикле; клиенты закрытых циклов забываются, aclose закрывает текущие"""
+    pool = HTTPClientPool()
+
+    async def first():
+        c = pool.async_client("http://rag:8000/search")
+        assert pool.async_client("http://rag:8000/other") is c
+        return c
+
+    old = asyncio.run(first())
+    assert pool.stats()["loops"] == 0  # цикл asyncio.run закрыт — запись удалена
+
+    async def second():
+        c = pool.async_client("http://rag:8000/search")
+        assert c is not old
+        assert pool.stats() == {"clients": 0, "loops": 1, "async_clients": 1}
+        await pool.aclose()
+        assert c.is_closed
+        assert pool.stats()["async_clients"] == 0
+
+    asyncio.run(second())
+
+
+if __name__ == "__main__":
+    test_service_key()
+    test_sync_clients_reused_per_service_and_closed()
+    test_async_clients_per_loop()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Тест для проверки многоуровневого роутера намерений"""
+
+import asyncio
+import sys
+import os
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from intent_router import INTENT_OUTPUT, IntentRouter, match_rules, parse_batch_intents, parse_intent
+
+
+class FakeClient:
+    """Заглушка LLMClient: эмбеддинги — по ключевым словам, LLM всегда отвечает rag_answer"""
+
+    def __init__(self):
+        self.llm_calls = 0
+
+    def embed(self, texts):
+        vocab = ["привет", "что", "квиз", "ответ"]
+        return [[1.0 if w in t.lower() else 0.01 for w in vocab] for t in texts]
+
+    def generate(self, texts, **kwargs):
+        self.llm_calls += 1
+        return ["rag_answer" for _ in texts]
+
+
+def test_rules_tier():
+    """Очевидные формулировки решаются правилами без LLM"""
+    assert match_rules("Создай квиз по машинному обучению из учебника Яндекса") == "generate_quiz"
+    assert match_rules("Вот мои ответы на квиз: ответ 1, ответ 2") == "evaluate_quiz"
+    assert match_rules("Расскажи о машинном обучении из учебника Яндекса") == "rag_answer"
+    assert match_rules("Привет! Как дела?") == "general"
+    assert match_rules("Что такое градиентный бустинг?") is None
+
+
+def test_router_falls_back_to_llm():
+    """При неуверенности эмбеддингов роутер обращается к LLM"""
+    client = FakeClient()
+    router = IntentRouter(client, use_embeddings=False)
+
+    decision = router.route("Создай квиз по deep learning")
+    assert decision.tier == "rules" and client.llm_calls == 0
+
+    decision = router.route("Как работает dropout")
+    assert decision.tier == "llm" and decision.intent == "rag_answer"
+    assert router.stats()["llm_calls_saved"] == 1
+
+
+class RecordingClient(FakeClient):
+    """Заглушка LLMClient: запоминает параметры вызовов, отвечает текстом вокруг метки"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def generate(self, texts, **kwargs):
+        self.calls.append(kwargs)
+        return ["Намерение: evaluate_quiz." for _ in texts]
+
+
+def test_parse_intent_structured_and_prose():
+    """Метка берётся из JSON, а если модель ответила фразой — из текста"""
+    assert parse_intent('{"label": "rag_answer"}') == "rag_answer"
+    assert parse_intent("Rag_answer.") == "rag_answer"
+    assert parse_intent("Это generate_quiz, потому что просят тест") == "generate_quiz"
+    assert parse_intent("не знаю") == "general"
+
+
+def test_llm_tier_uses_schema_and_token_cap():
+    """Уровень llm передаёт схему ответа и лимит токенов"""
+    client = RecordingClient()
+    router = IntentRouter(client, use_embeddings=False, llm_max_tokens=12)
+    assert router.route("Как работает dropout").intent == "evaluate_quiz"
+    assert client.calls[0]["structured_output"] is INTENT_OUTPUT
+    assert client.calls[0]["max_tokens"] == 12
+
+    plain = RecordingClient()
+    IntentRouter(plain, use_embeddings=False, structured_output=False).route("Как работает dropout")
+    assert "structured_output" not in plain.calls[0]
+
+
+class BatchClient(FakeClient):
+    """Заглушка LLMClient: на пакетный промпт отвечает только на первый вопрос"""
+
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def generate(self, texts, **kwargs):
+        self.llm_calls += 1
+        self.prompts.extend(texts)
+        return ["1: general\nпояснение" if "Вопросы:" in t else "rag_answer" for t in texts]
+
+
+def test_parse_batch_intents():
+    """Пакетный ответ разбирается по номерам; недопустимые и лишние строки пропускаются"""
+    raw = "1: rag_answer\n2) General\n3: что-то\n7: general"
+    assert parse_batch_intents(raw, 3) == ["rag_answer", "general", None]
+    assert parse_batch_intents("", 2) == [None, None]
+    assert parse_batch_intents('Ответ: ["rag_answer", "quiz", "General"]', 3) == ["rag_answer", None, "general"]
+
+
+def test_classify_batch_single_llm_call():
+    """Неуверенные вопросы пакета классифицируются одним вызовом LLM, неразобранные — по одному"""
+    client = BatchClient()
+    router = IntentRouter(client, use_embeddings=False)
+    questions = ["Привет!", "Как работает dropout", "Что такое бустинг", "Создай квиз по deep learning"]
+
+    decisions = router.classify_batch(questions)
+    assert [d.intent for d in decisions] == ["general", "general", "rag_answer", "generate_quiz"]
+    assert [d.tier for d in decisions] == ["rules", "llm", "llm", "rules"]
+    # один пакетный вызов + один повтор для вопроса, на который модель не ответила
+    assert client.llm_calls == 2
+    assert "Как работает dropout" in client.prompts[0] and "Привет" not in client.prompts[0]
+
+
+class AsyncBatchClient:
+    """Асинхронная заглушка LLMClient: на пакетный промпт отвечает JSON-списком rag_answer"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def agenerate(self, texts, **kwargs):
+        self.prompts.extend(texts)
+        await asyncio.sleep(0)
+        return ['["rag_answer", "rag_answer", "rag_answer"]' if "Вопросы:" in t else "general" for t in texts]
+
+
+def test_concurrent_questions_share_llm_call():
+    """Вопросы, пришедшие одновременно, классифицируются одним вызовом LLM"""
+    client = AsyncBatchClient()
+    router = IntentRouter(client, use_embeddings=False, llm_batch_size=3, llm_batch_wait_ms=50)
+
+    async def scenario():
+        return await asyncio.gather(*(router.aroute(q) for q in ["Что такое бустинг", "Как работает dropout", "Что такое SVM"]))
+
+    decisions = asyncio.run(scenario())
+    assert [d.intent for d in decisions] == ["rag_answer"] * 3
+    assert len(client.prompts) == 1
+    batching = router.stats()["llm_batching"]
+    assert batching["batches"] == 1 and batching["max_batch"] == 3
+
+    # одиночный вопрос уходит по таймеру обычным промптом
+    decision = asyncio.run(router.aroute("Что такое PCA"))
+    assert decision.intent == "general" and len(client.prompts) == 2
+
+
+class FlakyEmbeddingsClient(FakeClient):
+    """Асинхронная заглушка LLMClient: первый вызов эмбеддингов падает, вызовы считаются"""
+
+    def __init__(self):
+        super().__init__()
+        self.embed_calls = 0
+
+    async def aembed(self, texts):
+        self.embed_calls += 1
+        await asyncio.sleep(0.01)
+        if self.embed_calls == 1:
+            raise RuntimeError("embeddings unavailable")
+        return self.embed(texts)
+
+    async def agenerate(self, texts, **kwargs):
+        return self.generate(texts)
+
+
+def test_centroids_single_flight_and_retry():
+    """Конкурентные первые запросы строят центроиды одним вызовом; после ошибки — повтор после паузы"""
+    client = FlakyEmbeddingsClient()
+    router = IntentRouter(client)
+
+    async def burst():
+        return await asyncio.gather(*(router._aensure_centroids() for _ in range(5)))
+
+    assert asyncio.run(burst()) == [{}] * 5
+    assert client.embed_calls == 1  # ошибка не размножилась на каждый запрос
+    assert asyncio.run(router._aensure_centroids()) == {}  # пауза ещё идёт
+    assert client.embed_calls == 1
+
+    router._centroids_retry_at = 0.0  # пауза истекла
+    assert set(asyncio.run(burst())[0]) == set(router.examples)
+    assert client.embed_calls == 2
+
+
+if __name__ == "__main__":
+    test_rules_tier()
+    test_router_falls_back_to_llm()
+    test_parse_batch_intents()
+    test_classify_batch_single_llm_call()
+    test_concurrent_questions_share_llm_call()
+    test_parse_intent_structured_and_prose()
+    test_llm_tier_uses_schema_and_token_cap()
+    test_centroids_single_flight_and_retry()
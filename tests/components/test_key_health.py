@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Тест для проверки кэша состояния API-ключей"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+
+import httpx
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.key_health import KeyHealthCache, is_auth_failure
+from llm_service.utils import unwrap_http_exc
+
+
+def test_key_health_ttl_and_negative_caching():
+    """Живой ключ кэшируется на TTL, отказ авторизации — на негативный TTL"""
+    cache = KeyHealthCache()
+    assert cache.get("openrouter", "key-1") is None
+
+    cache.mark_ok("openrouter", "key-1", ttl_s=60)
+    state = cache.get("openrouter", "key-1")
+    assert state is not None and state.ok
+
+    # Пассивное обновление: 401 на реальном вызове переворачивает состояние
+    cache.mark_failed("openrouter", "key-1", ttl_s=0.05, reason="auth_error")
+    state = cache.get("openrouter", "key-1")
+    assert state is not None and not state.ok
+
+    time.sleep(0.1)
+    assert cache.get("openrouter", "key-1") is None, "Негативная запись должна истечь"
+
+
+def test_key_health_isolation_and_invalidate():
+    """Ключи разных провайдеров не пересекаются и сбрасываются по провайдеру"""
+    cache = KeyHealthCache()
+    cache.mark_ok("openai", "k", ttl_s=60)
+    cache.mark_ok("mistral", "k", ttl_s=60)
+    assert cache.get("openai", "other-key") is None
+
+    cache.invalidate("openai")
+    assert cache.get("openai", "k") is None
+    assert cache.get("mistral", "k") is not None
+
+
+class SDKStatusError(Exception):
+    """Ошибка SDK провайдера (как openai.APIStatusError): ответ в атрибуте response"""
+
+    def __init__(self, response):
+        super().__init__(f"status {response.status_code}")
+        self.response = response
+
+
+def _response(status, headers=None):
+    return httpx.Response(status, headers=headers, json={"error": "x"}, request=httpx.Request("POST", "http://llm/chat"))
+
+
+def test_auth_failure_from_sdk_and_httpx_errors():
+    """Статус и Retry-After читаются и из httpx.HTTPStatusError, и из ошибок SDK с httpx.Response"""
+    sdk = SDKStatusError(_response(401))
+    assert is_auth_failure(sdk)
+    raw = httpx.HTTPStatusError("forbidden", request=httpx.Request("GET", "http://llm"), response=_response(403))
+    assert is_auth_failure(raw)
+    _, status, retry_after, _, body = unwrap_http_exc(SDKStatusError(_response(429, {"retry-after": "7"})))
+    assert (status, retry_after) == (429, 7) and "error" in body
+    assert not is_auth_failure(SDKStatusError(_response(500)))
+    assert not is_auth_failure(RuntimeError("no response"))
+
+
+def test_cold_cache_check_is_single_flight():
+    """Промах кэша: одновременные проверки ключа ждут один пинг (потоки и корутины)"""
+    cache = KeyHealthCache()
+    pings = []
+
+    def validate():
+        pings.append(1)
+        time.sleep(0.05)
+        cache.mark_ok("openai", "key-1", ttl_s=60)
+        return True, "live_ok"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.check("openai", "key-1", validate))) for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [(True, "live_ok")] * 5 and len(pings) == 1
+
+    async def avalidate():
+        pings.append(1)
+        await asyncio.sleep(0.05)
+        return False, "auth_error"
+
+    async def main():
+        return await asyncio.gather(*(cache.acheck("openai", "key-2", avalidate) for _ in range(5)))
+
+    assert asyncio.run(main()) == [(False, "auth_error")] * 5 and len(pings) == 2
+
+
+if __name__ == "__main__":
+    test_key_health_ttl_and_negative_caching()
+    test_key_health_isolation_and_invalidate()
+    test_auth_failure_from_sdk_and_httpx_errors()
+    test_cold_cache_check_is_single_flight()
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""Тест для проверки LLMClient: ограничитель частоты, ключи, батчи (без обращения к провайдерам)"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.circuit_breaker import CircuitBreaker, breakers
+from llm_service.key_health import key_health_cache
+from llm_service.llm_client import LLMClient, _InstanceCache, model_cache
+from llm_service.prompt_cache import prompt_tokens
+from llm_service.rate_limit import RateLimiter
+
+API_KEY = "test-key"
+
+
+def _cfg(**overrides):
+    values = dict(
+        openai_api_key=SimpleNamespace(get_secret_value=lambda: API_KEY), openrouter_api_key=None, mistral_api_key=None,
+        openai_chat_model="gpt-test", openai_emb_model="emb-test", request_timeout_s=5.0, connect_timeout_s=1.0,
+        key_health_ttl_s=60.0, key_health_negative_ttl_s=10.0, emb_batch_size=8,
+        llm_max_concurrency=4, llm_max_concurrency_by_provider={}, emb_max_in_flight=2,
+        max_retries=0, retry_base_s=0.0, retry_max_s=0.0, retry_jitter_s=0.0, retry_deadline_s=None,
+        retry_max_retries_by_op={},
+        rate_limit_rpm={}, rate_limit_tpm={}, rate_limit_completion_tokens=10, rate_limit_max_wait_s=None,
+        llm_fallback_providers=[], llm_latency_aware_routing=False, llm_failover_max_retries=0,
+        breaker_failure_threshold=1000, breaker_open_s=30.0, breaker_latency_threshold_s=None,
+        hedge_enabled=False, hedge_nodes=[],
+        prompt_cache_control=False, prompt_cache_control_models=[],
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+class SDKStatusError(Exception):
+    """Ошибка SDK провайдера (как openai.APIStatusError): ответ в атрибуте response"""
+
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.response = httpx.Response(status, request=httpx.Request("POST", "http://llm/chat"))
+
+
+class FakeChat:
+    """Заглушка чат-модели: поток фрагментов (исключение в списке — обрыв) и обычный ответ (или ошибка)"""
+
+    def __init__(self, chunks=(), stream_error=None, answer="ответ", usage=20, error=None):
+        self.chunks = list(chunks)
+        self.stream_error = stream_error
+        self.answer = answer
+        self.usage = usage
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(content=self.answer, response_metadata={"token_usage": {"total_tokens": self.usage}})
+
+    async def astream(self, messages):
+        if self.stream_error is not None:
+            raise self.stream_error
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    async def ainvoke(self, messages):
+        return SimpleNamespace(content=self.answer, response_metadata={"token_usage": {"total_tokens": self.usage}})
+
+
+class SlowChat:
+    """Заглушка чат-модели: отвечает эхом, поздние промпты быстрее ранних; считает одновременные вызовы"""
+
+    def __init__(self, total):
+        self.total = total
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def _enter(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _leave(self):
+        with self.lock:
+            self.active -= 1
+
+    def _delay(self, text):
+        return 0.01 * (self.total - int(text.split()[-1]))
+
+    def _answer(self, messages):
+        text = messages[-1].content
+        return SimpleNamespace(content=f"re: {text}", response_metadata={}), self._delay(text)
+
+    def invoke(self, messages):
+        self._enter()
+        try:
+            answer, delay = self._answer(messages)
+            time.sleep(delay)
+            return answer
+        finally:
+            self._leave()
+
+    async def ainvoke(self, messages):
+        self._enter()
+        try:
+            answer, delay = self._answer(messages)
+            await asyncio.sleep(delay)
+            return answer
+        finally:
+            self._leave()
+
+
+class FakeEmbeddings:
+    """Заглушка модели эмбеддингов: вектор [len(text)]; ошибка или 413 для чанка больше max_batch"""
+
+    model = "emb-test"
+
+    def __init__(self, error=None, max_batch=None):
+        self.error = error
+        self.max_batch = max_batch
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        if self.max_batch is not None and len(texts) > self.max_batch:
+            raise SDKStatusError(413)
+        return [[float(len(t))] for t in texts]
+
+
+class Client(LLMClient):
+    """LLMClient с настройками теста, подменёнными моделями и своим ограничителем"""
+
+    cfg = _cfg()
+
+    def __init__(self, chat=None, limiter=None, embeddings=None):
+        super().__init__("openai")
+        self.chat = chat
+        self.embeddings = embeddings
+        self.limiter = limiter or RateLimiter("openai:gpt-test")
+
+    def _get_chat(self, model=None, api_key=None, **kwargs):
+        return self.chat
+
+    def _get_embeddings(self, model=None, api_key=None, **kwargs):
+        return self.embeddings
+
+    def _rate_limiter(self, model):
+        return self.limiter
+
+
+class FactoryClient(Client):
+    """Client с настоящими _get_chat/_get_embeddings: считает созданные экземпляры моделей"""
+
+    _get_chat = LLMClient._get_chat
+    _get_embeddings = LLMClient._get_embeddings
+
+    def __init__(self):
+        super().__init__()
+        self.created = []
+
+    def create_chat(self, model=None, api_key=None, **kwargs):
+        self.created.append(("chat", api_key, kwargs))
+        return SimpleNamespace(bind=lambda **params: SimpleNamespace(params=params))
+
+    def create_embeddings(self, model=None, api_key=None, **kwargs):
+        self.created.append(("embeddings", api_key, kwargs))
+        return FakeEmbeddings()
+
+
+def _chunk(text, total_tokens=None):
+    metadata = {"token_usage": {"total_tokens": total_tokens}} if total_tokens is not None else {}
+    return SimpleNamespace(content=text, response_metadata=metadata)
+
+
+def _spent(limiter):
+    """Сколько токенов списано из ведра TPM (с точностью до пополнения за время теста)"""
+    return round(limiter._tpm.capacity - limiter._tpm.level)
+
+
+def test_call_outcome_updates_key_health_without_ping():
+    """Исход реального вызова обновляет кэш ключа; после 401 провайдер пропускается без запроса"""
+    key_health_cache.invalidate("openai")
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    chat = FakeChat(answer="ok")
+    client = Client(chat)
+    assert client.generate(["вопрос"]) == ["ok"]
+    assert key_health_cache.get("openai", API_KEY).reason == "call_ok"
+    assert chat.calls == 1  # без пинга перед вызовом
+
+    chat.error = SDKStatusError(401)
+    assert client.generate(["вопрос"]) == [""]
+    state = key_health_cache.get("openai", API_KEY)
+    assert not state.ok and state.reason.startswith("auth_error")
+    assert client.generate(["вопрос"]) == [""]
+    assert chat.calls == 2, "отозванный ключ не должен вызываться до истечения негативного TTL"
+
+    chat.error = SDKStatusError(400)
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    client.generate(["вопрос"])
+    assert key_health_cache.get("openai", API_KEY).ok, "ошибка запроса не считается отказом ключа"
+    key_health_cache.invalidate("openai")
+
+
+def test_retry_classification_and_async_retries():
+    """Таймауты, 429 и 5xx ретраятся (в async — без блокировки цикла), 4xx и прочие ошибки — нет"""
+    client = Client()
+    client.cfg = _cfg(max_retries=2)
+    assert client._is_retriable_exc(httpx.ConnectError("down")) == (True, None)
+    assert client._is_retriable_exc(httpx.ReadTimeout("slow")) == (True, None)
+    assert client._is_retriable_exc(SDKStatusError(429)) == (True, 429)
+    assert client._is_retriable_exc(SDKStatusError(503)) == (True, 503)
+    assert client._is_retriable_exc(SDKStatusError(400)) == (False, None)
+    assert client._is_retriable_exc(ValueError("bad")) == (False, None)
+
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise SDKStatusError(503)
+        return "ok"
+
+    async def unauthorized():
+        attempts.append(1)
+        raise SDKStatusError(401)
+
+    assert asyncio.run(client._acall_with_retry("generate", flaky)) == "ok"
+    assert len(attempts) == 3
+    attempts.clear()
+    try:
+        asyncio.run(client._acall_with_retry("generate", unauthorized))
+        assert False, "ожидалась ошибка 401"
+    except SDKStatusError:
+        pass
+    assert len(attempts) == 1
+
+
+def test_stream_tokens_in_order_and_partial_answer_on_break():
+    """Фрагменты уходят в on_token по порядку; обрыв после первых фрагментов отдаёт полученное без fallback"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    chat = FakeChat([_chunk("Градиентный"), _chunk(" спуск"), RuntimeError("connection reset")], answer="полный")
+    tokens = []
+    assert asyncio.run(Client(chat).astream_generate("вопрос", tokens.append)) == "Градиентный спуск"
+    assert tokens == ["Градиентный", " спуск"]
+
+
+def test_model_instances_reused_and_params_bound_per_call():
+    """Экземпляр модели общий для вызовов и клиентов; параметры генерации привязываются к вызову"""
+    model_cache.clear()
+    client = FactoryClient()
+    cold = client._get_chat(temperature=0.0)
+    warm = client._get_chat(temperature=0.7, max_tokens=16)
+    assert cold.params == {"temperature": 0.0} and warm.params == {"temperature": 0.7, "max_tokens": 16}
+    assert len(client.created) == 1
+
+    other = FactoryClient()
+    other._get_chat(temperature=0.0)
+    assert other.created == [], "экземпляр общий для всех LLMClient процесса"
+    other._get_chat(api_key="another-key")
+    other._get_chat(streaming=True)  # параметр конструктора — отдельный экземпляр
+    assert [c[0] for c in other.created] == ["chat", "chat"]
+
+    assert client._get_embeddings() is client._get_embeddings()
+    assert [c[0] for c in client.created] == ["chat", "embeddings"]
+    model_cache.clear()
+
+
+def test_instance_cache_is_lru():
+    """Кэш экземпляров вытесняет давно не использованный"""
+    cache = _InstanceCache(maxsize=2)
+    a = cache.get_or_create("a", object)
+    cache.get_or_create("b", object)
+    assert cache.get_or_create("a", object) is a
+    cache.get_or_create("c", object)  # вытесняет b
+    b = cache.get_or_create("b", object)
+    assert cache.get_or_create("b", object) is b
+    assert cache.get_or_create("a", object) is not a
+
+
+def test_generate_batch_is_concurrent_bounded_and_ordered():
+    """Элементы батча идут параллельно не больше llm_max_concurrency, ответы — в порядке промптов"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    prompts = [f"вопрос {i}" for i in range(6)]
+    expected = [f"re: {p}" for p in prompts]
+
+    chat = SlowChat(len(prompts))
+    client = Client(chat)
+    client.cfg = _cfg(llm_max_concurrency=3)
+    assert client.generate(prompts) == expected
+    assert chat.peak == 3
+
+    chat = SlowChat(len(prompts))
+    client = Client(chat)
+    client.cfg = _cfg(llm_max_concurrency=2)
+    assert asyncio.run(client.agenerate(prompts)) == expected
+    assert chat.peak == 2
+
+
+def test_embed_chunks_in_order_and_shrink_after_413():
+    """Чанки эмбеддингов идут параллельно, векторы — в исходном порядке; после 413 чанк уменьшается"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    texts = ["a" * n for n in range(1, 9)]
+    embeddings = FakeEmbeddings(max_batch=2)
+    client = Client(embeddings=embeddings)
+    client.cfg = _cfg(emb_batch_size=4, emb_max_in_flight=2)
+
+    assert client.embed(texts) == [[float(n)] for n in range(1, 9)]
+    assert client._emb_batch_limit == 2
+    embeddings.calls.clear()
+    matrix = client.embed(texts, as_numpy=True)
+    assert matrix.shape == (8, 1) and matrix[:, 0].tolist() == list(range(1, 9))
+    assert all(len(call) <= 2 for call in embeddings.calls), "уменьшенный размер чанка запоминается"
+
+
+def test_stream_settles_reservation_with_usage():
+    """Поток сверяет резерв с фактическим расходом; без usage — с оценкой по промпту и ответу"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    limiter = RateLimiter("openai:gpt-test", tpm=100000)
+    chat = FakeChat([_chunk("При"), _chunk("вет"), _chunk("", total_tokens=30)])
+    tokens = []
+    assert asyncio.run(Client(chat, limiter).astream_generate("вопрос", tokens.append)) == "Привет"
+    assert tokens == ["При", "вет"]
+    assert _spent(limiter) == 30
+
+    limiter = RateLimiter("openai:gpt-test", tpm=100000)
+    chat = FakeChat([_chunk("x" * 400)])
+    asyncio.run(Client(chat, limiter).astream_generate("вопрос", tokens.append))
+    assert 100 <= _spent(limiter) < 110  # промпт + ~400/4 токенов ответа, а не rate_limit_completion_tokens
+
+
+def test_stream_refunds_reservation_before_fallback():
+    """Поток не начался: резерв возвращается, а agenerate списывает только свой расход"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    limiter = RateLimiter("openai:gpt-test", tpm=100000)
+    chat = FakeChat(stream_error=RuntimeError("stream failed"), usage=20)
+    tokens = []
+    assert asyncio.run(Client(chat, limiter).astream_generate("вопрос", tokens.append)) == "ответ"
+    assert tokens == ["ответ"]
+    assert _spent(limiter) == 20
+
+
+def test_embedding_failures_do_not_open_chat_breaker():
+    """У эмбеддингов свой автомат: их сбои не размыкают чат провайдера"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    client = Client(embeddings=FakeEmbeddings(error=RuntimeError("embeddings down")))
+    client.cfg = _cfg(breaker_failure_threshold=2, breaker_open_s=0.0)
+    chat_opened = breakers.stats().get("openai", {}).get("opened", 0)
+    for _ in range(3):
+        assert client.embed(["текст"]) == [[]]
+    stats = breakers.stats()
+    assert stats["openai:embeddings"]["opened"] >= 1
+    assert stats.get("openai", {}).get("opened", 0) == chat_opened
+
+    client.embeddings = FakeEmbeddings()
+    assert client.embed(["текст"]) == [[5.0]]  # успешная проба замыкает автомат
+    assert breakers.stats()["openai:embeddings"]["state"] == "closed"
+
+
+def test_breaker_counts_only_provider_failures():
+    """Автомат считает отказами только ошибки провайдера: ожидание лимита, 4xx и локальные ошибки — нет"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+
+    def failures():
+        return breakers.stats().get("openai", {}).get("failures", 0)
+
+    before = failures()
+    client = Client(FakeChat(), RateLimiter("openai:gpt-test", rpm=1))
+    client.cfg = _cfg(rate_limit_max_wait_s=0.01)
+    assert client.generate(["вопрос"]) == ["ответ"]
+    assert client.generate(["вопрос"]) == [""]  # очередь ограничителя не подошла
+    client.limiter = RateLimiter("openai:gpt-test")
+    for error in (SDKStatusError(400), ValueError("bad params")):
+        client.chat = FakeChat(error=error)
+        assert client.generate(["вопрос"]) == [""]
+    assert failures() == before
+
+    client.chat = FakeChat(error=SDKStatusError(503))
+    assert client.generate(["вопрос"]) == [""]
+    assert failures() == before + 1
+
+
+def test_breaker_latency_excludes_rate_limit_wait():
+    """Автомат и EWMA получают задержку вызова провайдера, без ожидания очереди ограничителя"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    limiter = RateLimiter("openai:gpt-test", tpm=6000)
+    limiter._tpm.level = 0.0  # ведро пусто: вызов ждёт пополнения ~0.1 с
+    client = Client(FakeChat(), limiter)
+    breaker = CircuitBreaker("openai", failure_threshold=1000, open_s=30.0, latency_threshold_s=None)
+    client._breaker = lambda: breaker
+    t0 = time.perf_counter()
+    assert client.generate(["вопрос"]) == ["ответ"]
+    assert time.perf_counter() - t0 >= 0.05
+    assert breaker.latency_ewma_s < 0.05
+
+
+def test_stream_records_prompt_cache_usage():
+    """Поток учитывает входные токены и попадания в кэш промпта по usage последнего фрагмента"""
+    key_health_cache.mark_ok("openai", API_KEY, 60)
+    before = prompt_tokens.stats().get("openai:gpt-test", {}).get("cached_tokens", 0)
+    usage = {"total_tokens": 130, "prompt_tokens": 120, "prompt_tokens_details": {"cached_tokens": 100}}
+    last = SimpleNamespace(content="", response_metadata={"token_usage": usage})
+    chat = FakeChat([_chunk("ответ"), last])
+    assert asyncio.run(Client(chat).astream_generate("вопрос", lambda _: None)) == "ответ"
+    assert prompt_tokens.stats()["openai:gpt-test"]["cached_tokens"] == before + 100
+
+
+def test_cold_key_cache_pings_once_for_parallel_items():
+    """Холодный кэш ключа: параллельные элементы батча ждут одну проверку, а не пингуют каждый"""
+    pings = []
+
+    class PingChat(FakeChat):
+        def invoke(self, messages):
+            if messages[-1].content == "ping":
+                pings.append(1)
+                time.sleep(0.05)
+            return super().invoke(messages)
+
+        async def ainvoke(self, messages):
+            if messages[-1].content == "ping":
+                pings.append(1)
+                await asyncio.sleep(0.05)
+            return await super().ainvoke(messages)
+
+    prompts = [f"вопрос {i}" for i in range(4)]
+    client = Client(PingChat())
+    key_health_cache.invalidate("openai")
+    assert client.generate(prompts) == ["ответ"] * 4
+    assert len(pings) == 1
+    key_health_cache.invalidate("openai")
+    assert asyncio.run(client.agenerate(prompts)) == ["ответ"] * 4
+    assert len(pings) == 2
+
+
+if __name__ == "__main__":
+    test_call_outcome_updates_key_health_without_ping()
+    test_retry_classification_and_async_retries()
+    test_stream_tokens_in_order_and_partial_answer_on_break()
+    test_model_instances_reused_and_params_bound_per_call()
+    test_instance_cache_is_lru()
+    test_generate_batch_is_concurrent_bounded_and_ordered()
+    test_embed_chunks_in_order_and_shrink_after_413()
+    test_stream_settles_reservation_with_usage()
+    test_stream_refunds_reservation_before_fallback()
+    test_embedding_failures_do_not_open_chat_breaker()
+    test_breaker_counts_only_provider_failures()
+    test_breaker_latency_excludes_rate_limit_wait()
+    test_stream_records_prompt_cache_usage()
+    test_cold_key_cache_pings_once_for_parallel_items()
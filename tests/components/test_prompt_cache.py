@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Тест для проверки кэширования префикса промпта"""
+
+import sys
+import os
+from types import SimpleNamespace
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.prompt_cache import PromptTokenStats, prompt_token_usage, supports_cache_control, system_content
+
+CFG = SimpleNamespace(prompt_cache_control=True, prompt_cache_control_models=["anthropic/", "google/gemini"])
+
+
+def test_cache_control_only_for_marked_openrouter_models():
+    """Пометка cache_control — только для OpenRouter и перечисленных моделей"""
+    assert supports_cache_control("openrouter", "anthropic/claude-3.5-sonnet", CFG)
+    assert supports_cache_control("openrouter", "google/gemini-2.0-flash", CFG)
+    assert not supports_cache_control("openrouter", "openai/gpt-4o-mini", CFG)
+    assert not supports_cache_control("openai", "anthropic/x", CFG)
+    off = SimpleNamespace(prompt_cache_control=False, prompt_cache_control_models=["anthropic/"])
+    assert not supports_cache_control("openrouter", "anthropic/x", off)
+
+
+def test_system_content():
+    """Без пометки — строка, с пометкой — текстовый блок с cache_control"""
+    assert system_content("sys", False) == "sys"
+    assert system_content("sys", True) == [{"type": "text", "text": "sys", "cache_control": {"type": "ephemeral"}}]
+
+
+def test_usage_and_stats():
+    """Кэшированные токены из prompt_tokens_details и cache_read_input_tokens"""
+    openai_like = SimpleNamespace(response_metadata={
+        "token_usage": {"prompt_tokens": 2000, "prompt_tokens_details": {"cached_tokens": 1536}}
+    })
+    anthropic_like = SimpleNamespace(response_metadata={"usage": {"prompt_tokens": 1000, "cache_read_input_tokens": 800}})
+    assert prompt_token_usage(openai_like) == (2000, 1536)
+    assert prompt_token_usage(anthropic_like) == (1000, 800)
+    assert prompt_token_usage(SimpleNamespace(response_metadata={})) == (None, 0)
+
+    stats = PromptTokenStats()
+    stats.record("openai:gpt", openai_like)
+    stats.record("openai:gpt", SimpleNamespace(response_metadata={"token_usage": {"prompt_tokens": 500}}))
+    s = stats.stats()["openai:gpt"]
+    assert s["calls"] == 2 and s["prompt_tokens"] == 2500
+    assert s["cached_tokens"] == 1536 and s["uncached_tokens"] == 964
+
+
+if __name__ == "__main__":
+    test_cache_control_only_for_marked_openrouter_models()
+    test_system_content()
+    test_usage_and_stats()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Тест для проверки клиентского ограничителя частоты (RPM/TPM)"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.rate_limit import RateLimiter, RateLimiterRegistry, RateLimitTimeout, usage_tokens
+
+
+def test_rpm_queue_is_fifo():
+    """Сверх RPM вызовы ждут пополнения и получают разрешение в порядке очереди"""
+    limiter = RateLimiter("openrouter:free", rpm=600)  # 10 запросов в секунду
+    limiter._rpm.level = 0.0
+    order = []
+
+    def worker(n):
+        limiter.acquire()
+        order.append(n)
+
+    threads = []
+    for n in range(3):
+        t = threading.Thread(target=worker, args=(n,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.01)
+    for t in threads:
+        t.join()
+    assert order == [0, 1, 2]
+    stats = limiter.stats()
+    assert stats["acquired"] == 3 and stats["waited"] == 3 and stats["queue_depth"] == 0
+
+
+def test_tpm_settle_and_timeout():
+    """Фактический расход токенов уточняет бюджет; без места в бюджете — таймаут"""
+    limiter = RateLimiter("openai:gpt-4o-mini", tpm=1000)
+    reservation = limiter.acquire(tokens=100)
+    reservation.settle(900)
+    try:
+        limiter.acquire(tokens=500, timeout=0.1)
+        assert False, "ожидался RateLimitTimeout"
+    except RateLimitTimeout:
+        pass
+    assert limiter.stats()["timeouts"] == 1
+
+    message = SimpleNamespace(response_metadata={"token_usage": {"total_tokens": 42}})
+    assert usage_tokens(message) == 42 and usage_tokens("text") is None
+
+
+def test_async_acquire_and_registry():
+    """Async-вариант и реестр: лимит по provider:model, затем по провайдеру"""
+    registry = RateLimiterRegistry()
+    limiter = registry.get("openrouter", "m", {"openrouter": 1200}, {})
+    assert limiter is registry.get("openrouter", "m", {"openrouter": 1200}, {})
+    assert not registry.get("openai", "m", {"openrouter": 1200}, {}).enabled
+
+    async def main():
+        limiter._rpm.level = 0.0
+        t0 = time.monotonic()
+        await asyncio.gather(limiter.aacquire(), limiter.aacquire())
+        return time.monotonic() - t0
+
+    assert asyncio.run(main()) >= 0.09
+    assert registry.stats()["openrouter:m"]["acquired"] == 2
+
+
+if __name__ == "__main__":
+    test_rpm_queue_is_fifo()
+    test_tpm_settle_and_timeout()
+    test_async_acquire_and_registry()
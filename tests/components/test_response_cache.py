@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Тест для проверки кэша ответов"""
+
+import sys
+import os
+import tempfile
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from response_cache import InMemoryCacheBackend, ResponseCache, SqliteCacheBackend, normalize_question
+
+
+def _cache(backend):
+    return ResponseCache(backend, ttl_s=60, similarity_threshold=0.9, namespaces=["general", "rag_answer"])
+
+
+def test_exact_and_semantic_lookup():
+    """Точное попадание по нормализованному вопросу и семантическое — по эмбеддингу"""
+    cache = _cache(InMemoryCacheBackend(max_bytes=1024 * 1024, max_entries=100))
+    assert normalize_question("Что такое  градиентный бустинг?") == "что такое градиентный бустинг"
+
+    cache.store("rag_answer", "Что такое градиентный бустинг?", "Ансамбль деревьев", vector=[1.0, 0.0])
+    assert cache.lookup("rag_answer", "что такое градиентный бустинг") == "Ансамбль деревьев"
+    assert cache.lookup("rag_answer", "Расскажи про градиентный бустинг", vector=[0.99, 0.05]) == "Ансамбль деревьев"
+    assert cache.lookup("rag_answer", "Что такое SVM?", vector=[0.0, 1.0]) is None
+
+    # Квизы по умолчанию не кэшируются
+    cache.store("generate_quiz", "Создай квиз", "Вопрос 1 ...")
+    assert cache.lookup("generate_quiz", "Создай квиз") is None
+
+    stats = cache.stats()
+    assert stats["hits_exact"] == 1 and stats["hits_semantic"] == 1 and stats["misses"] == 1
+
+
+def test_memory_backend_lru_by_bytes():
+    """LRU-вытеснение по лимиту байт"""
+    backend = InMemoryCacheBackend(max_bytes=10, max_entries=100)
+    backend.set("a", b"12345", ttl_s=60)
+    backend.set("b", b"12345", ttl_s=60)
+    assert backend.get("a") is not None
+    backend.set("c", b"12345", ttl_s=60)
+    assert backend.get("b") is None, "Давно не использованная запись должна быть вытеснена"
+    assert backend.get("a") is not None and backend.get("c") is not None
+
+
+def test_sqlite_backend_ttl():
+    """SQLite-бэкенд: хранение и истечение TTL"""
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SqliteCacheBackend(os.path.join(tmp, "cache.sqlite3"), max_bytes=1024)
+        backend.set("k", "ответ".encode("utf-8"), ttl_s=60)
+        assert backend.get("k").decode("utf-8") == "ответ"
+        backend.set("old", b"x", ttl_s=-1)
+        assert backend.get("old") is None
+
+
+def test_semantic_index_bounded_and_evicts_oldest():
+    """Индекс ограничен max_index_entries: старые векторы вытесняются, строки матрицы переиспользуются"""
+    cache = ResponseCache(
+        InMemoryCacheBackend(max_bytes=1024 * 1024, max_entries=100),
+        ttl_s=60, similarity_threshold=0.9, namespaces=["rag_answer"], max_index_entries=2,
+    )
+    cache.store("rag_answer", "вопрос x", "ответ x", vector=[1.0, 0.0, 0.0])
+    cache.store("rag_answer", "вопрос y", "ответ y", vector=[0.0, 1.0, 0.0])
+    cache.store("rag_answer", "вопрос z", "ответ z", vector=[0.0, 0.0, 1.0])
+    assert cache.stats()["index_entries"] == 2
+
+    assert cache.lookup("rag_answer", "другой x", vector=[0.98, 0.1, 0.0]) is None  # вытеснен
+    assert cache.lookup("rag_answer", "другой y", vector=[0.1, 0.98, 0.0]) == "ответ y"
+    assert cache.lookup("rag_answer", "другой z", vector=[0.0, 0.1, 0.98]) == "ответ z"
+
+    # Смена размерности эмбеддингов сбрасывает несравнимый индекс
+    cache.store("rag_answer", "вопрос w", "ответ w", vector=[1.0, 0.0])
+    assert cache.stats()["index_entries"] == 1
+    assert cache.lookup("rag_answer", "другой w", vector=[0.99, 0.05]) == "ответ w"
+
+
+if __name__ == "__main__":
+    test_exact_and_semantic_lookup()
+    test_memory_backend_lru_by_bytes()
+    test_sqlite_backend_ttl()
+    test_semantic_index_bounded_and_evicts_oldest()
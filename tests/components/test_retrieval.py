@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Тест для проверки разбора, дедупликации и упаковки результатов RAG"""
+
+import sys
+import os
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from retrieval import RetrievedDocument, count_tokens, dedupe, load_encoding, pack_context, parse_search_result
+
+
+def test_parse_search_result_shapes():
+    """Разбор разных форм ответа сервиса, включая metadata и ошибку"""
+    raw = {
+        "results": [
+            {"content": "Стек — структура LIFO.", "metadata": {"source": "ch1.md", "chunk_id": 7}, "score": "0.8"},
+            {"text": "  ", "score": 0.9},
+            "Очередь — структура FIFO.",
+        ]
+    }
+    docs = parse_search_result(raw)
+    assert docs[0] == RetrievedDocument("Стек — структура LIFO.", "ch1.md", 0.8, "7")
+    assert docs[1] == RetrievedDocument("Очередь — структура FIFO.")
+    assert len(docs) == 2
+    assert parse_search_result({"error": "HTTP 500"}) == []
+    assert parse_search_result([{"page_content": "x", "similarity": 1}])[0].score == 1.0
+
+
+def test_dedupe_keeps_best_scored():
+    """Из почти одинаковых фрагментов остаётся лучший по оценке"""
+    text = "бинарное дерево поиска хранит ключи так что левое поддерево меньше корня а правое больше"
+    docs = [
+        RetrievedDocument(text, "a.md", 0.5),
+        RetrievedDocument(text + " корня", "b.md", 0.9),
+        RetrievedDocument("хеш таблица даёт доступ за константное время в среднем", "c.md", 0.7),
+    ]
+    kept = dedupe(docs, threshold=0.8)
+    assert [d.source for d in kept] == ["b.md", "c.md"]
+
+
+def test_pack_context_respects_budget():
+    """В бюджет попадают лучшие фрагменты; слишком длинный лучший обрезается"""
+    docs = [
+        RetrievedDocument("a " * 400, "long", 0.9),
+        RetrievedDocument("short one", "s1", 0.8),
+        RetrievedDocument("short two", "s2", None),
+    ]
+    packed = pack_context(docs, max_tokens=50)
+    assert [d.source for d in packed] == ["s1", "s2"]
+    assert sum(count_tokens(d.render()) for d in packed) <= 50
+
+    only_long = pack_context([docs[0]], max_tokens=20)
+    assert len(only_long) == 1 and count_tokens(only_long[0].render()) <= 25
+    assert len(pack_context(docs, max_tokens=0)) == 3
+
+
+def test_encoding_loaded_once():
+    """Кодировка загружается один раз (при старте), подсчёт токенов её переиспользует"""
+    encoding = load_encoding()
+    assert load_encoding() is encoding
+    assert count_tokens("градиентный спуск") > 0
+
+
+if __name__ == "__main__":
+    test_parse_search_result_shapes()
+    test_dedupe_keeps_best_scored()
+    test_pack_context_respects_budget()
+    test_encoding_loaded_once()
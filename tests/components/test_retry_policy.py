@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Тест для проверки политики ретраев"""
+
+import sys
+import os
+from types import SimpleNamespace
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.retry import RetryPolicy
+
+
+def _upper(lo, hi):
+    """Детерминированная «случайность»: всегда верхняя граница"""
+    return hi
+
+
+def _cfg(**overrides):
+    values = dict(
+        max_retries=3, retry_base_s=1.0, retry_max_s=5.0, retry_jitter_s=0.5,
+        retry_deadline_s=None, request_timeout_s=30.0,
+        retry_max_retries_by_op={"validate_api_key": 0},
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def test_exponential_backoff_with_cap():
+    """Граница full jitter растёт экспоненциально и ограничена retry_max_s"""
+    policy = RetryPolicy.from_settings(_cfg(), "generate")
+    assert policy.max_attempts == 4 and policy.deadline_s == 30.0
+    assert [policy.backoff(n, rand=_upper) for n in (1, 2, 3, 4)] == [1.0, 2.0, 4.0, 5.0]
+    assert 0.0 <= policy.backoff(3) <= 4.0
+
+
+def test_retry_after_and_deadline():
+    """Retry-After для 429 соблюдается; пауза сверх бюджета прекращает ретраи"""
+    policy = RetryPolicy.from_settings(_cfg(), "generate")
+    assert policy.next_delay(1, elapsed_s=0.0, retry_after=7, status=429, rand=_upper) == 7.5
+    assert policy.next_delay(1, elapsed_s=25.0, retry_after=7, status=429, rand=_upper) is None
+    assert policy.next_delay(4, elapsed_s=0.0) is None
+
+
+def test_per_operation_policy():
+    """Проверка ключа не ретраится"""
+    policy = RetryPolicy.from_settings(_cfg(), "validate_api_key")
+    assert policy.max_attempts == 1
+    assert policy.next_delay(1, elapsed_s=0.0) is None
+
+
+if __name__ == "__main__":
+    test_exponential_backoff_with_cap()
+    test_retry_after_and_deadline()
+    test_per_operation_policy()
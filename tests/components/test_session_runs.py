@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Тест для проверки очерёдности и идемпотентности запусков сессии"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from admission import AdmissionController
+from session_runs import SessionRuns, idempotency_key
+
+
+def test_idempotency_key():
+    """Ключ клиента важнее хэша; хэш не зависит от регистра и пунктуации вопроса"""
+    assert idempotency_key("s1", "Что такое стек?") == idempotency_key("s1", "что такое стек")
+    assert idempotency_key("s1", "стек") != idempotency_key("s2", "стек")
+    assert idempotency_key("s1", "стек", "abc") == "s1:key:abc"
+
+
+def test_async_duplicates_attach_and_session_is_serialized():
+    """Повтор присоединяется к идущему запуску; разные запросы сессии идут по очереди"""
+    runs = SessionRuns(dedup_ttl_s=0)
+    calls = []
+    active = []
+
+    async def graph(name):
+        active.append(name)
+        assert len(active) == 1, "запуски одной сессии пересеклись"
+        calls.append(name)
+        await asyncio.sleep(0.02)
+        active.remove(name)
+        return f"answer:{name}"
+
+    async def main():
+        k1, k2 = idempotency_key("s", "q1"), idempotency_key("s", "q2")
+        results = await asyncio.gather(
+            runs.arun("s", k1, lambda: graph("q1")),
+            runs.arun("s", k1, lambda: graph("q1")),
+            runs.arun("s", k2, lambda: graph("q2")),
+        )
+        assert results == ["answer:q1", "answer:q1", "answer:q2"]
+        assert calls == ["q1", "q2"]
+        # dedup_ttl_s=0: после завершения тот же запрос выполняется заново
+        await runs.arun("s", k1, lambda: graph("q1"))
+        assert calls == ["q1", "q2", "q1"]
+
+    asyncio.run(main())
+    stats = runs.stats()
+    assert stats["runs"] == 3 and stats["deduplicated"] == 1 and stats["serialized"] == 1
+    assert stats["in_flight"] == 0 and stats["locked_sessions"] == 0
+
+
+def test_recent_result_and_errors():
+    """Недавний результат отдаётся повтору; ошибка не запоминается"""
+    runs = SessionRuns(dedup_ttl_s=10)
+    calls = []
+
+    async def ok():
+        calls.append("ok")
+        return "done"
+
+    async def fail():
+        calls.append("fail")
+        raise RuntimeError("boom")
+
+    async def main():
+        assert await runs.arun("s", "k", ok) == "done"
+        assert await runs.arun("s", "k", ok) == "done"
+        for _ in range(2):
+            try:
+                await runs.arun("s", "e", fail)
+                assert False
+            except RuntimeError:
+                pass
+
+    asyncio.run(main())
+    assert calls == ["ok", "fail", "fail"]
+
+
+def test_replay_only_for_explicit_key():
+    """Без явного ключа завершённый результат не отдаётся: тот же вопрос сессии — новый запуск"""
+    runs = SessionRuns(dedup_ttl_s=10)
+    calls = []
+
+    async def graph():
+        calls.append(1)
+        return f"answer:{len(calls)}"
+
+    async def main():
+        key = idempotency_key("s", "мои ответы")
+        assert await runs.arun("s", key, graph, replay=False) == "answer:1"
+        assert await runs.arun("s", key, graph, replay=False) == "answer:2"
+        explicit = idempotency_key("s", "мои ответы", "req-1")
+        assert await runs.arun("s", explicit, graph) == "answer:3"
+        assert await runs.arun("s", explicit, graph) == "answer:3"
+
+    asyncio.run(main())
+    assert runs.run("s", "k", lambda: "sync", replay=False) == "sync"
+    assert runs.run("s", "k", lambda: "again", replay=False) == "again"
+    assert len(calls) == 3
+
+
+def test_only_leader_is_admitted():
+    """Контекст допуска входит только выполняющий запуск; повторы ждут его без места"""
+    runs = SessionRuns(dedup_ttl_s=0)
+    admitted = []
+
+    @asynccontextmanager
+    async def admit():
+        admitted.append(1)
+        yield
+
+    async def graph():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        key = idempotency_key("s", "q")
+        results = await asyncio.gather(*(runs.arun("s", key, graph, admit=admit) for _ in range(3)))
+        assert results == ["answer"] * 3
+
+    asyncio.run(main())
+    assert admitted == [1]
+
+
+def test_session_queue_does_not_hold_admission():
+    """Запуски, ждущие свою сессию, не занимают допуск: другая сессия получает место следующей"""
+    runs = SessionRuns(dedup_ttl_s=0)
+    admission = AdmissionController(max_concurrency=1, max_queue=1, max_queue_per_session=1, max_wait_s=None)
+    started = []
+
+    async def graph(name):
+        started.append(name)
+        await asyncio.sleep(0.02)
+        return name
+
+    def submit(session, name):
+        key = idempotency_key(session, name)
+        return runs.arun(session, key, lambda: graph(name), admit=lambda: admission.admit(session))
+
+    async def main():
+        a = [asyncio.create_task(submit("a", f"a{i}")) for i in range(3)]
+        await asyncio.sleep(0.005)
+        b = asyncio.create_task(submit("b", "b0"))
+        return await asyncio.gather(*a, b)
+
+    assert asyncio.run(main()) == ["a0", "a1", "a2", "b0"]
+    assert started.index("b0") == 1, started
+    stats = admission.stats()
+    assert stats["rejected_session"] == 0 and stats["rejected_queue_full"] == 0
+
+
+def test_threads():
+    """Синхронный вариант: повтор из другого потока ждёт результат первого"""
+    runs = SessionRuns()
+    calls = []
+
+    def graph():
+        calls.append(1)
+        time.sleep(0.05)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(runs.run("s", "k", graph))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["answer"] * 3 and len(calls) == 1
+
+
+if __name__ == "__main__":
+    test_idempotency_key()
+    test_async_duplicates_attach_and_session_is_serialized()
+    test_recent_result_and_errors()
+    test_replay_only_for_explicit_key()
+    test_only_leader_is_admitted()
+    test_session_queue_does_not_hold_admission()
+    test_threads()
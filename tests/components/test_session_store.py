@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Тест для проверки ограниченного хранилища сессий"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from session_store import BoundedMemorySaver, SqliteCheckpointSaver, pack, unpack
+
+
+def _config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _checkpoint(cid, payload="", **fields):
+    values = {"question": payload, **fields}
+    return {"v": 1, "id": cid, "ts": cid, "channel_values": values,
+            "channel_versions": {name: int(cid) for name in values}, "versions_seen": {}}
+
+
+def test_keep_latest_only_and_delete():
+    """Хранится только последний чекпоинт; end_session удаляет сессию"""
+    saver = BoundedMemorySaver(ttl_s=60, max_sessions=10, max_bytes=1024 * 1024)
+    cfg = saver.put(_config("s1"), _checkpoint("0001", "первый"), {"step": 1})
+    saver.put(cfg, _checkpoint("0002", "второй"), {"step": 2})
+
+    latest = saver.get_tuple(_config("s1"))
+    assert latest.checkpoint["channel_values"]["question"] == "второй"
+    assert len(list(saver.list(_config("s1")))) == 1
+
+    assert saver.delete_thread("s1") is True
+    assert saver.get_tuple(_config("s1")) is None
+    assert saver.delete_thread("s1") is False
+    assert saver.stats()["evicted"]["ended"] == 1
+
+
+def test_lru_limits():
+    """Вытеснение самых давних сессий по числу и по байтам"""
+    saver = BoundedMemorySaver(ttl_s=60, max_sessions=2, max_bytes=1024 * 1024)
+    for sid in ("a", "b"):
+        saver.put(_config(sid), _checkpoint("0001"), {})
+    saver.get_tuple(_config("a"))  # a становится самой свежей
+    saver.put(_config("c"), _checkpoint("0001"), {})
+    assert saver.get_tuple(_config("b")) is None
+    assert saver.get_tuple(_config("a")) is not None
+    assert saver.stats()["evicted"]["lru"] == 1
+
+    saver = BoundedMemorySaver(ttl_s=60, max_sessions=100, max_bytes=1)
+    saver.put(_config("a"), _checkpoint("0001", "x" * 100), {})
+    saver.put(_config("b"), _checkpoint("0001", "x" * 100), {})
+    stats = saver.stats()
+    assert stats["live_sessions"] == 1 and saver.get_tuple(_config("b")) is not None
+
+
+def test_ttl():
+    """Сессия удаляется по TTL с последнего обращения"""
+    saver = BoundedMemorySaver(ttl_s=0.05, max_sessions=10, max_bytes=1024 * 1024)
+    saver.put(_config("s1"), _checkpoint("0001"), {})
+    time.sleep(0.1)
+    assert saver.get_tuple(_config("s1")) is None
+    assert saver.stats()["evicted"]["ttl"] == 1
+
+
+def test_pack_roundtrip():
+    """Сжатие больших блоков и прозрачная распаковка"""
+    big = ("квиз " * 200).encode("utf-8")
+    assert unpack(pack(big)) == big and len(pack(big)) < len(big)
+    assert unpack(pack(b"short")) == b"short"
+
+
+def test_sqlite_survives_restart_and_lazy_fields():
+    """SQLite: состояние переживает пересоздание чекпоинтера, поля читаются выборочно"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.sqlite3")
+        saver = SqliteCheckpointSaver(path, ttl_s=60, max_sessions=10)
+        cfg = saver.put(_config("quiz"), _checkpoint("0001", "создай квиз", quiz_content="Вопрос 1"), {"step": 1})
+        # Чтение до сброса буфера видит последнюю запись
+        assert saver.get_tuple(_config("quiz")).checkpoint["channel_values"]["quiz_content"] == "Вопрос 1"
+
+        ckpt = _checkpoint("0002", "мои ответы", quiz_content="Вопрос 1")
+        ckpt["channel_versions"]["quiz_content"] = 1  # поле не менялось — не перезаписывается
+        saver.put(cfg, ckpt, {"step": 2})
+        assert saver.stats()["fields_skipped"] == 1
+        saver.close()
+
+        saver = SqliteCheckpointSaver(path, ttl_s=60, max_sessions=10)
+        latest = saver.get_tuple(_config("quiz"))
+        assert latest.config["configurable"]["thread_ts"] == "0002"
+        assert latest.checkpoint["channel_values"] == {"question": "мои ответы", "quiz_content": "Вопрос 1"}
+
+        assert saver.delete_thread("quiz") is True
+        assert saver.get_tuple(_config("quiz")) is None
+        saver.close()
+
+
+def test_sqlite_flush_thread_writes_only_that_session():
+    """SQLite: flush_thread сразу пишет запись сессии в базу, остальные остаются в буфере"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.sqlite3")
+        saver = SqliteCheckpointSaver(path, ttl_s=60, max_sessions=10, flush_interval_s=60)
+        saver.put(_config("a"), _checkpoint("0001", "вопрос a"), {"step": 1})
+        saver.put(_config("b"), _checkpoint("0001", "вопрос b"), {"step": 1})
+        saver.flush_thread("a")
+
+        other = SqliteCheckpointSaver(path, ttl_s=60, max_sessions=10, flush_interval_s=60)
+        assert other.get_tuple(_config("a")).checkpoint["channel_values"]["question"] == "вопрос a"
+        assert other.get_tuple(_config("b")) is None
+        other.close()
+        saver.close()
+
+
+if __name__ == "__main__":
+    test_keep_latest_only_and_delete()
+    test_lru_limits()
+    test_ttl()
+    test_pack_roundtrip()
+    test_sqlite_survives_restart_and_lazy_fields()
+    test_sqlite_flush_thread_writes_only_that_session()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Тест для проверки кэша настроек и горячей перезагрузки"""
+
+import sys
+import os
+import json
+import tempfile
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from settings import get_settings, invalidate_settings
+
+
+def _write(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def test_cached_and_invalidated():
+    """get_settings() возвращает один экземпляр до invalidate_settings() или смены APP_SETTINGS_PATH"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "app_settings.json")
+        _write(path, {"openai_chat_model": "model-a"})
+        os.environ["APP_SETTINGS_PATH"] = path
+        try:
+            first = get_settings()
+            assert first.openai_chat_model == "model-a"
+            assert get_settings() is first
+
+            _write(path, {"openai_chat_model": "model-b"})
+            assert get_settings() is first  # без hot reload файл не перечитывается
+            invalidate_settings()
+            assert get_settings().openai_chat_model == "model-b"
+
+            other = os.path.join(tmp, "other.json")
+            _write(other, {"openai_chat_model": "model-c"})
+            os.environ["APP_SETTINGS_PATH"] = other
+            assert get_settings().openai_chat_model == "model-c"
+        finally:
+            os.environ.pop("APP_SETTINGS_PATH", None)
+            invalidate_settings()
+
+
+def test_hot_reload_by_mtime():
+    """При settings_hot_reload изменение файла подхватывается без рестарта"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "app_settings.json")
+        _write(path, {"settings_hot_reload": True, "settings_reload_check_s": 0, "request_timeout_s": 30})
+        os.environ["APP_SETTINGS_PATH"] = path
+        try:
+            assert get_settings().request_timeout_s == 30
+            _write(path, {"settings_hot_reload": True, "settings_reload_check_s": 0, "request_timeout_s": 45})
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+            assert get_settings().request_timeout_s == 45
+        finally:
+            os.environ.pop("APP_SETTINGS_PATH", None)
+            invalidate_settings()
+
+
+if __name__ == "__main__":
+    test_cached_and_invalidated()
+    test_hot_reload_by_mtime()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Тест для проверки спекулятивного поиска в RAG"""
+
+import sys
+import os
+import asyncio
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from speculation import SpeculativeRetrieval
+
+
+def _search(query: str) -> str:
+    time.sleep(0.02)
+    return f"docs:{query}"
+
+
+async def _asearch(query: str) -> str:
+    await asyncio.sleep(0.02)
+    return f"docs:{query}"
+
+
+def test_outside_scope_does_nothing():
+    """Вне запуска графа поиск не стартует"""
+    spec = SpeculativeRetrieval(_search, _asearch)
+    assert not spec.start("q")
+    assert spec.take("q") is None
+    assert spec.stats()["launched"] == 0
+
+
+def test_sync_hit_and_waste():
+    """Результат забирает retrieve; при другом маршруте поиск отменяется"""
+    spec = SpeculativeRetrieval(_search, _asearch)
+    with spec.scope():
+        assert spec.start("что такое стек")
+        assert spec.take("что такое стек") == "docs:что такое стек"
+    with spec.scope():
+        spec.start("привет")
+        spec.discard()
+        assert spec.take("привет") is None
+    stats = spec.stats()
+    assert stats["launched"] == 2 and stats["hits"] == 1 and stats["wasted"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_unclaimed_result_is_discarded_on_scope_exit():
+    """Невостребованный поиск отменяется по завершении запуска, другой запрос не получает чужой результат"""
+    spec = SpeculativeRetrieval(_search, _asearch)
+    with spec.scope():
+        spec.start("a")
+        assert spec.take("b") is None
+    with spec.scope():
+        spec.start("c")
+    assert spec.stats()["wasted"] == 2
+
+
+def test_async_hit_and_cancel():
+    """Async: задача забирается retrieve или отменяется"""
+    spec = SpeculativeRetrieval(_search, _asearch)
+
+    async def main():
+        with spec.scope():
+            assert spec.astart("q1")
+            assert await spec.atake("q1") == "docs:q1"
+        with spec.scope():
+            spec.astart("q2")
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    stats = spec.stats()
+    assert stats["hits"] == 1 and stats["wasted"] == 1
+
+
+if __name__ == "__main__":
+    test_outside_scope_does_nothing()
+    test_sync_hit_and_waste()
+    test_unclaimed_result_is_discarded_on_scope_exit()
+    test_async_hit_and_cancel()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Тест для проверки структурированного ответа чат-модели"""
+
+import json
+import sys
+import os
+from types import SimpleNamespace
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from llm_service.structured import StructuredOutput, structured_kwargs, structured_text
+
+SPEC = StructuredOutput(
+    name="set_intent",
+    description="Намерение",
+    parameters={"type": "object", "properties": {"label": {"type": "string"}}, "required": ["label"]},
+)
+
+
+def test_kwargs_by_provider():
+    """OpenAI/OpenRouter — принудительный вызов функции, Mistral — JSON mode"""
+    for provider in ("openai", "openrouter"):
+        kwargs = structured_kwargs(provider, SPEC)
+        assert kwargs["tools"][0]["function"]["name"] == "set_intent"
+        assert kwargs["tools"][0]["function"]["parameters"] == SPEC.parameters
+        assert kwargs["tool_choice"] == {"type": "function", "function": {"name": "set_intent"}}
+    assert structured_kwargs("mistral", SPEC) == {"response_format": {"type": "json_object"}}
+
+
+def test_structured_text():
+    """Ответ — аргументы вызова функции, без вызова — content"""
+    raw = SimpleNamespace(
+        content="",
+        additional_kwargs={"tool_calls": [{"function": {"name": "set_intent", "arguments": '{"label": "rag_answer"}'}}]},
+    )
+    assert json.loads(structured_text(raw, SPEC)) == {"label": "rag_answer"}
+
+    parsed = SimpleNamespace(content="", additional_kwargs={}, tool_calls=[{"name": "set_intent", "args": {"label": "general"}}])
+    assert json.loads(structured_text(parsed, SPEC)) == {"label": "general"}
+
+    other = SimpleNamespace(content="", additional_kwargs={}, tool_calls=[{"name": "other", "args": {}}])
+    assert structured_text(other, SPEC) == ""
+
+    mistral = SimpleNamespace(content='{"label": "evaluate_quiz"}', additional_kwargs={})
+    assert structured_text(mistral, SPEC) == '{"label": "evaluate_quiz"}'
+
+
+if __name__ == "__main__":
+    test_kwargs_by_provider()
+    test_structured_text()
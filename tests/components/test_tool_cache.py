@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Тест для проверки кэша результатов инструментов RAG"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tool_cache import ToolResultCache
+
+
+def test_key_normalizes_query():
+    """Ключ не зависит от регистра и пунктуации, но зависит от параметров"""
+    k = ToolResultCache.key
+    assert k("rag_search", "Что такое стек?", top_k=5) == k("rag_search", "что такое  стек", top_k=5)
+    assert k("rag_search", "стек", top_k=5) != k("rag_search", "стек", top_k=3)
+    assert k("rag_search", "стек") != k("rag_generate", "стек")
+
+
+def test_hit_ttl_lru_and_errors():
+    """Попадание, истечение TTL, вытеснение LRU; ошибки не кэшируются"""
+    cache = ToolResultCache(max_entries=2, ttl_s=0.05)
+    calls = []
+
+    def fetch(value):
+        calls.append(value)
+        return {"results": [value]}
+
+    assert cache.get_or_call("a", lambda: fetch("a")) == {"results": ["a"]}
+    assert cache.get_or_call("a", lambda: fetch("a2")) == {"results": ["a"]}
+    cache.get_or_call("b", lambda: fetch("b"))
+    cache.get_or_call("c", lambda: fetch("c"))      # вытесняет "a"
+    cache.get_or_call("a", lambda: fetch("a3"))
+    assert calls == ["a", "b", "c", "a3"]
+
+    time.sleep(0.06)
+    cache.get_or_call("a", lambda: fetch("a4"))
+    cache.get_or_call("err", lambda: {"error": "HTTP 500"})
+    cache.get_or_call("err", lambda: fetch("ok"))
+    assert calls[-2:] == ["a4", "ok"]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["evictions"] >= 1
+
+
+def test_threads_coalesce():
+    """N одновременных одинаковых запросов из потоков — один вызов сервиса"""
+    cache = ToolResultCache()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"results": ["x"]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_call("q", slow))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and results == [{"results": ["x"]}] * 5
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_async_coalesce_and_cancelled_leader():
+    """Корутины объединяются; при отмене ведущего ожидающий повторяет вызов сам"""
+    cache = ToolResultCache()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"results": ["y"]}
+
+    async def main():
+        results = await asyncio.gather(*(cache.aget_or_call("q", slow) for _ in range(4)))
+        assert results == [{"results": ["y"]}] * 4 and len(calls) == 1
+
+        leader = asyncio.create_task(cache.aget_or_call("z", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.aget_or_call("z", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == {"results": ["y"]}
+        assert len(calls) == 3
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    test_key_normalizes_query()
+    test_hit_ttl_lru_and_errors()
+    test_threads_coalesce()
+    test_async_coalesce_and_cancelled_leader()
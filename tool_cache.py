@@ -0,0 +1,161 @@
+"""
+Кэш результатов внешних инструментов (поиск и генерация в RAG).
+
+LRU с TTL по ключу «инструмент + нормализованный запрос + параметры» и
+singleflight: одновременные одинаковые запросы ждут один вызов сервиса вместо N.
+Ошибки сервиса не кэшируются.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from response_cache import normalize_question
+
+
+def _cacheable(result: Any) -> bool:
+    """Ответ сервиса с ошибкой не кэшируется."""
+    return not (isinstance(result, dict) and "error" in result)
+
+
+class ToolResultCache:
+    """LRU+TTL кэш с объединением одновременных одинаковых вызовов (потоки и корутины)."""
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def configure(self, max_entries: int, ttl_s: float) -> None:
+        """Обновляет лимиты (настройки могут перечитываться на лету)."""
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl_s = ttl_s
+            self._trim()
+
+    @staticmethod
+    def key(tool: str, query: str, **params: Any) -> str:
+        """Ключ: инструмент, нормализованный запрос и параметры вызова."""
+        return json.dumps([tool, normalize_question(query), params], sort_keys=True, ensure_ascii=False)
+
+    # ---------- хранение (под self._lock) ----------
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        item = self._items.get(key)
+        if item is None:
+            return False, None
+        expires, value = item
+        if time.monotonic() >= expires:
+            del self._items[key]
+            return False, None
+        self._items.move_to_end(key)
+        self._stats["hits"] += 1
+        return True, value
+
+    def _store(self, key: str, value: Any) -> None:
+        if self.ttl_s <= 0 or not _cacheable(value):
+            return
+        self._items[key] = (time.monotonic() + self.ttl_s, value)
+        self._items.move_to_end(key)
+        self._trim()
+
+    def _trim(self) -> None:
+        while len(self._items) > max(0, self.max_entries):
+            self._items.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    # ---------- API ----------
+    def get_or_call(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Значение из кэша; иначе — один вызов `fn` на все одновременные запросы ключа.
+
+        Args:
+            key: Ключ (`ToolResultCache.key`).
+            fn: Вызов сервиса.
+
+        Returns:
+            Результат (из кэша, чужого вызова или своего).
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            leader = self._inflight.get(key)
+            if leader is None:
+                leader = self._inflight[key] = Future()
+                self._stats["misses"] += 1
+                own = True
+            else:
+                self._stats["coalesced"] += 1
+                own = False
+        if not own:
+            return leader.result()
+
+        try:
+            value = fn()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            leader.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._store(key, value)
+        leader.set_result(value)
+        return value
+
+    async def aget_or_call(self, key: str, afn: Callable[[], Awaitable[Any]]) -> Any:
+        """Асинхронный аналог `get_or_call`: ожидающие не блокируют event loop."""
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        while True:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    return value
+                leader = self._ainflight.get(slot)
+                if leader is None:
+                    leader = self._ainflight[slot] = loop.create_future()
+                    self._stats["misses"] += 1
+                    break
+                self._stats["coalesced"] += 1
+            try:
+                # shield: отмена ожидающего не должна отменять общий результат
+                return await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise
+                # отменён сам ведущий вызов (например, ненужный спекулятивный поиск) — повторяем
+
+        try:
+            value = await afn()
+        except BaseException as e:
+            with self._lock:
+                self._ainflight.pop(slot, None)
+            if isinstance(e, asyncio.CancelledError):
+                leader.cancel()
+            else:
+                leader.set_exception(e)
+                leader.exception()  # помечаем извлечённым: ожидающих может не быть
+            raise
+        with self._lock:
+            self._ainflight.pop(slot, None)
+            self._store(key, value)
+        leader.set_result(value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Попадания, промахи, объединённые вызовы, вытеснения и число записей."""
+        with self._lock:
+            return {"entries": len(self._items), "in_flight": len(self._inflight) + len(self._ainflight), **self._stats}